@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Benchmark tải end-to-end cho /chat và /ws/{session_id}.
+
+Mô phỏng nhiều session tiếng Việt đồng thời (hỏi chính sách, đặt vé nhiều lượt, hủy vé),
+đo throughput, độ trễ p50/p95/p99 và tỉ lệ lỗi theo từng route, rồi ghi kết quả ra JSON
+để so sánh giữa các phiên bản.
+
+Mặc định script tự chạy server (main.py) ở một process riêng với các thành phần thay thế cục bộ:
+- LLM: FakeLLMProvider (LLM_PROVIDER=fake) trả lời theo kịch bản sau --llm-latency-ms (có jitter)
+- Redis: kho key-value trong process, hỗ trợ đúng các lệnh mà chat memory/session store dùng
+Model embedding vẫn là model thật, được nạp từ cache của HuggingFace (chế độ offline).
+
+Ví dụ:
+    python bench_load.py --sessions 200 --concurrency 50 --output results.json
+    python bench_load.py --url http://localhost:8000 --routes chat
+    python bench_load.py --baseline results_old.json
+"""
+import sys
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import threading
+from datetime import datetime, timezone
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+# ---------- Kịch bản hội thoại ----------
+
+POLICY_QUESTIONS = [
+    "Chính sách hoàn tiền khi hủy vé như thế nào?",
+    "Tôi có được mang thú cưng lên xe không?",
+    "Hành lý được mang tối đa bao nhiêu kg?",
+    "Quy định đổi vé trước giờ khởi hành ra sao?",
+    "Làm sao để xuất hóa đơn VAT?",
+    "Trẻ em dưới 5 tuổi có phải mua vé không?",
+    "Thanh toán bằng những hình thức nào?",
+    "Nếu xe bị trễ thì tôi được bồi thường không?",
+]
+
+BOOKING_FLOWS = [
+    ["Tôi muốn đặt vé", "Hà Nội", "Sài Gòn", "ngày mai", "2 vé", "9h"],
+    ["Đặt vé từ Hà Nội đi Sài Gòn", "ngày mai", "1 vé", "8h"],
+    ["Cho tôi đặt 3 vé từ Sài Gòn đi Hà Nội ngày mai lúc 9h"],
+]
+
+CANCEL_FLOWS = [
+    ["Tôi muốn hủy vé", "VN000001"],
+    ["Tôi muốn đổi giờ vé VN000002", "14h"],
+]
+
+SCENARIOS = {
+    "policy": lambda rng: [rng.choice(POLICY_QUESTIONS)],
+    "booking": lambda rng: list(rng.choice(BOOKING_FLOWS)),
+    "cancel": lambda rng: list(rng.choice(CANCEL_FLOWS)),
+}
+
+DEFAULT_MIX = "policy=5,booking=4,cancel=1"
+
+# ---------- Thành phần thay thế cục bộ (chỉ dùng trong process server) ----------
+
+class LocalRedis:
+    """
+    Kho key-value trong process thay cho Redis khi benchmark offline.
+    Chỉ hỗ trợ các lệnh mà ChatMemory và SessionStateStore dùng; TTL được bỏ qua.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[key] = value
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def rpush(self, key, *values):
+        values = [v.encode("utf-8") if isinstance(v, str) else v for v in values]
+        with self._lock:
+            items = self._data.setdefault(key, [])
+            items.extend(values)
+            return len(items)
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            items = self._data.get(key, [])
+            end = len(items) if end == -1 else end + 1
+            self._data[key] = items[start:end]
+        return True
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            items = list(self._data.get(key, []))
+        end = len(items) if end == -1 else end + 1
+        return items[start:end]
+
+    def expire(self, key, seconds):
+        return True
+
+    def pipeline(self, transaction=True):
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    def __init__(self, target):
+        self._target = target
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self._target, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+
+
+class AsyncLocalRedis:
+    """Phiên bản async của LocalRedis, dùng chung dữ liệu"""
+    def __init__(self, sync_client):
+        self._sync = sync_client
+
+    def __getattr__(self, name):
+        method = getattr(self._sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction=True):
+        return _AsyncLocalPipeline(self._sync)
+
+
+class _AsyncLocalPipeline(_LocalPipeline):
+    async def execute(self):
+        return _LocalPipeline.execute(self)
+
+
+def serve_offline(port, llm_latency_ms, llm_jitter_ms):
+    """Chạy main.py với LLM giả và Redis giả (được gọi trong process con)"""
+    # Không gọi Gemini thật và không tải model từ mạng
+    os.environ["GOOGLE_API_KEY"] = ""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(llm_latency_ms)
+    os.environ["LLM_FAKE_JITTER_MS"] = str(llm_jitter_ms)
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+    # Redis giả chỉ sống trong process này nên không chạy cluster được
+    os.environ["CLUSTER_MODE"] = "false"
+    os.chdir(project_root)
+
+    from src.__modules.core import conversation_manager
+
+    local_redis = LocalRedis()
+    conversation_manager.redis_client = local_redis
+    conversation_manager.async_redis_client = AsyncLocalRedis(local_redis)
+
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+# ---------- Phía client ----------
+
+class RouteStats:
+    """Độ trễ và lỗi của một route"""
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.error_samples = []
+
+    def record(self, latency, error=None):
+        if error is None:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+            if len(self.error_samples) < 5:
+                self.error_samples.append(error)
+
+    def summary(self, elapsed):
+        total = len(self.latencies) + self.errors
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+            return round(ordered[index] * 1000, 2)
+
+        return {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": round(ordered[-1] * 1000, 2) if ordered else None,
+            },
+            "error_samples": self.error_samples,
+        }
+
+
+async def run_chat_session(client, base_url, turns, stats, timeout):
+    session_id = f"bench_{uuid.uuid4().hex[:12]}"
+    for message in turns:
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{base_url}/chat", json={"message": message, "session_id": session_id}, timeout=timeout
+            )
+            latency = time.perf_counter() - start
+            if response.status_code != 200:
+                stats.record(latency, f"HTTP {response.status_code}")
+            elif response.json().get("status") != "success":
+                stats.record(latency, f"status={response.json().get('status')}")
+            else:
+                stats.record(latency)
+        except Exception as e:
+            stats.record(time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+async def run_ws_session(base_url, turns, stats, timeout):
+    import websockets
+
+    session_id = f"bench_{uuid.uuid4().hex[:12]}"
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://") + f"/ws/{session_id}"
+    try:
+        async with websockets.connect(ws_url, open_timeout=timeout) as websocket:
+            for message in turns:
+                start = time.perf_counter()
+                try:
+                    await websocket.send(json.dumps({"message": message}, ensure_ascii=False))
+                    reply = json.loads(await asyncio.wait_for(websocket.recv(), timeout))
+                    latency = time.perf_counter() - start
+                    if reply.get("status") != "success":
+                        stats.record(latency, f"status={reply.get('status')}")
+                    else:
+                        stats.record(latency)
+                except Exception as e:
+                    stats.record(time.perf_counter() - start, f"{type(e).__name__}: {e}")
+                    return
+    except Exception as e:
+        stats.record(0.0, f"connect {type(e).__name__}: {e}")
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Kịch bản không hợp lệ: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def run_load(base_url, routes, sessions, concurrency, mix, timeout, seed):
+    import httpx
+
+    rng = random.Random(seed)
+    names = list(mix)
+    plan = [(route, names_choice, SCENARIOS[names_choice](rng))
+            for route in routes
+            for names_choice in rng.choices(names, weights=[mix[n] for n in names], k=sessions)]
+    rng.shuffle(plan)
+
+    stats = {route: RouteStats() for route in routes}
+    scenario_counts = {route: {} for route in routes}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def worker(route, scenario, turns):
+            async with semaphore:
+                counts = scenario_counts[route]
+                counts[scenario] = counts.get(scenario, 0) + 1
+                if route == "chat":
+                    await run_chat_session(client, base_url, turns, stats[route], timeout)
+                else:
+                    await run_ws_session(base_url, turns, stats[route], timeout)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(*item) for item in plan))
+        elapsed = time.perf_counter() - start
+
+        try:
+            server_stats = (await client.get(f"{base_url}/stats", timeout=timeout)).json()
+        except Exception:
+            server_stats = None
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "routes": {
+            f"/{route}" if route == "chat" else "/ws/{session_id}": dict(
+                stats[route].summary(elapsed), sessions=scenario_counts[route]
+            )
+            for route in routes
+        },
+        "server_stats": server_stats,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_offline_server(args):
+    """Chạy server offline ở process con và đợi /health sẵn sàng"""
+    import httpx
+
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+        "--llm-latency-ms", str(args.llm_latency_ms), "--llm-jitter-ms", str(args.llm_jitter_ms),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server offline đã dừng (exit code {process.returncode})")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server offline không khởi động kịp")
+
+
+def print_report(results, baseline=None):
+    print(f"\n⏱️  Thời gian chạy: {results['elapsed_s']}s")
+    llm = (results.get("server_stats") or {}).get("llm")
+    if llm:
+        # Thời gian chờ model, để tách khỏi overhead của pipeline
+        print(f"🤖 LLM ({llm['provider']}): {llm['calls']} lần gọi, trung bình {llm['avg_latency_ms']}ms")
+    for route, summary in results["routes"].items():
+        latency = summary["latency_ms"]
+        print(f"\n📊 {route}")
+        print(f"   Requests: {summary['requests']}  Lỗi: {summary['errors']} ({summary['error_rate']:.2%})")
+        print(f"   Throughput: {summary['throughput_rps']} req/s")
+        print(f"   Latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+        for sample in summary["error_samples"]:
+            print(f"   ⚠️ {sample}")
+
+        old = (baseline or {}).get("results", {}).get("routes", {}).get(route)
+        if old:
+            for key in ("p50", "p95", "p99"):
+                before, after = old["latency_ms"].get(key), latency[key]
+                if before and after:
+                    print(f"   ↔️ {key}: {before} → {after} ms ({(after - before) / before:+.1%})")
+            print(f"   ↔️ throughput: {old['throughput_rps']} → {summary['throughput_rps']} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tải cho /chat và /ws")
+    parser.add_argument("--url", help="Server có sẵn (mặc định: tự chạy server offline)")
+    parser.add_argument("--routes", default="chat,ws", help="chat, ws hoặc chat,ws")
+    parser.add_argument("--sessions", type=int, default=100, help="Số session cho mỗi route")
+    parser.add_argument("--concurrency", type=int, default=20, help="Số session chạy đồng thời")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Tỉ lệ kịch bản, vd policy=5,booking=4,cancel=1")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout mỗi lượt (giây)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Độ trễ LLM giả")
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", default="bench_results.json", help="File JSON kết quả")
+    parser.add_argument("--baseline", help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_offline(args.port, args.llm_latency_ms, args.llm_jitter_ms)
+        return
+
+    routes = [route.strip() for route in args.routes.split(",") if route.strip()]
+    mix = parse_mix(args.mix)
+
+    process = None
+    base_url = args.url
+    if not base_url:
+        print("🚀 Khởi động server offline (LLM/Redis giả)...")
+        process, base_url = start_offline_server(args)
+
+    try:
+        print(f"🔥 {args.sessions} session/route, {args.concurrency} đồng thời → {base_url}")
+        results = asyncio.run(run_load(
+            base_url.rstrip("/"), routes, args.sessions, args.concurrency, mix, args.timeout, args.seed
+        ))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "target": args.url or "offline",
+        "config": {
+            "routes": routes,
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "seed": args.seed,
+            "llm_latency_ms": None if args.url else args.llm_latency_ms,
+            "llm_jitter_ms": None if args.url else args.llm_jitter_ms,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Đã ghi kết quả vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark cho get_intent_entities_from_text.
+
+So sánh cài đặt gốc quét lại text cho từng pattern (reference_intent_entities trong test_nlp_scanner.py)
+với hai cách tìm của get_intent_entities_from_text: từng pattern (câu ngắn) và scanner một lần quét
+(PatternScanner, text từ SCANNER_MIN_LENGTH ký tự) trên câu chat ngắn và các bản OCR vé xe dài dần,
+đồng thời kiểm tra mọi cách cho kết quả giống hệt nhau trên mọi input. Dùng để chọn SCANNER_MIN_LENGTH.
+
+Mỗi cỡ OCR được đo hai lần: chỉ có nội dung vé, và có thêm câu yêu cầu của khách ở đầu
+(cài đặt cũ dừng tìm intent ngay khi gặp, nên đây là trường hợp nó nhanh nhất).
+
+Ví dụ:
+    python bench_nlp.py
+    python bench_nlp.py --sizes 50,5000,50000 --repeat 7
+"""
+import sys
+import os
+import random
+import timeit
+import argparse
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.chatbot.nlp_extractor.nlp_engine import _extract_by_pattern, _extract_by_scanner, SCANNER_MIN_LENGTH
+from test_nlp_scanner import reference_intent_entities
+
+# Các dòng thường gặp trong text OCR từ ảnh vé
+OCR_LINES = [
+    "CÔNG TY TNHH VẬN TẢI PHƯƠNG TRANG", "VÉ XE KHÁCH", "Mã vé: VN123456", "Tuyến: Hà Nội - Sài Gòn",
+    "Ngày đi 12/10/2025", "Giờ khởi hành: 08:30", "Số ghế A12", "Giá vé 350.000 VNĐ", "Số lượng 2 vé",
+    "Điểm đón Bến xe Giáp Bát", "Hotline 19006067", "Cảm ơn quý khách",
+]
+
+CHAT_MESSAGES = [
+    "Tôi muốn đặt 2 vé từ hà nội đến sài gòn lúc 8h sáng ngày mai",
+    "Hủy vé VN123456 giúp tôi",
+    "Đổi giờ vé AB1234567 sang 14:30",
+]
+
+def make_ocr_text(words: int, seed: int = 3) -> str:
+    """Text OCR giả khoảng `words` từ, ghép ngẫu nhiên từ các dòng vé"""
+    rng = random.Random(seed)
+    lines, count = [], 0
+    while count < words:
+        line = rng.choice(OCR_LINES)
+        lines.append(line)
+        count += len(line.split())
+    return "\n".join(lines)
+
+def measure(func, text, repeat):
+    number = max(1, 20000 // max(len(text), 1))
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=repeat)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trích xuất intent/entity")
+    parser.add_argument("--sizes", default="50,500,5000,50000", help="Số từ của các text OCR")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    inputs = [(f"chat #{i + 1}", message) for i, message in enumerate(CHAT_MESSAGES)]
+    for size in map(int, args.sizes.split(",")):
+        ocr_text = make_ocr_text(size)
+        inputs.append((f"ocr {size} từ", ocr_text))
+        inputs.append(("  + yêu cầu", CHAT_MESSAGES[0] + "\n" + ocr_text))
+
+    print(f"{'input':<16}{'ký tự':>10}{'regex gốc':>14}{'từng pattern':>14}{'scanner':>14}{'tăng tốc':>10}")
+    for name, text in inputs:
+        expected = reference_intent_entities(text)
+        if _extract_by_pattern(text) != expected or _extract_by_scanner(text) != expected:
+            raise SystemExit(f"❌ Kết quả khác nhau với input '{name}'")
+        old = measure(reference_intent_entities, text, args.repeat)
+        by_pattern = measure(_extract_by_pattern, text, args.repeat)
+        by_scanner = measure(_extract_by_scanner, text, args.repeat)
+        # Tăng tốc của cách get_intent_entities_from_text chọn cho độ dài này
+        chosen = by_pattern if len(text) < SCANNER_MIN_LENGTH else by_scanner
+        print(f"{name:<16}{len(text):>10}{old * 1000:>12.3f}ms{by_pattern * 1000:>12.3f}ms"
+              f"{by_scanner * 1000:>12.3f}ms{old / chosen:>9.2f}x")
+    print("✅ Kết quả giống hệt nhau trên mọi input")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark truy vấn chính sách: Chroma so với index numpy (float32/float16/int8).
+
+Với mỗi backend đo độ trễ p50/p95 của một truy vấn top-3 (như L1.query_policy) và recall@3 so với
+kết quả chính xác (brute force float32 cùng khoảng cách L2 bình phương của collection).
+
+Mặc định dùng dữ liệu thật: các chunk của file chính sách và câu hỏi FAQ làm truy vấn, encode bằng model
+của config. --synthetic dùng vector ngẫu nhiên theo cụm nên chạy được khi không có model/Chroma.
+
+Ví dụ:
+    python bench_vector.py
+    python bench_vector.py --synthetic --chunks 400 --queries 500
+    python bench_vector.py --backends numpy-int8,numpy-float16
+"""
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.database.vector_index import NumpyVectorIndex
+
+TOP_K = 3
+ALL_BACKENDS = "chroma,numpy-float32,numpy-float16,numpy-int8"
+
+def synthetic_data(chunks, queries, dim, seed):
+    """Chunk thuộc vài chục cụm (như các mục của tài liệu), truy vấn là chunk cộng nhiễu"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, chunks // 10), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), chunks)] + rng.normal(scale=0.5, size=(chunks, dim))
+    query_vectors = vectors[rng.integers(0, chunks, queries)] + rng.normal(scale=0.7, size=(queries, dim))
+    documents = [f"chunk {i}" for i in range(chunks)]
+    metadatas = [{"source": f"mục {i % 12}"} for i in range(chunks)]
+    return vectors.astype(np.float32), documents, metadatas, query_vectors.astype(np.float32)
+
+def policy_data():
+    """Chunk chính sách và câu hỏi FAQ thật, encode bằng model của config"""
+    from config.settings import config
+    from src.database.kg_rag import create_semantic_chunks, faq_kg, document_text_path
+
+    with open(document_text_path, "r", encoding="utf-8") as file:
+        documents, metadatas = create_semantic_chunks(file.read())
+    questions = list(faq_kg())
+    print(f"Encode {len(documents)} chunk và {len(questions)} câu hỏi...")
+    vectors = np.asarray(config.model.encode(documents), dtype=np.float32)
+    query_vectors = np.asarray(config.model.encode(questions), dtype=np.float32)
+    return vectors, documents, metadatas, query_vectors
+
+def exact_top_k(vectors, query_vectors, k):
+    distances = (
+        np.einsum("ij,ij->i", query_vectors, query_vectors)[:, None]
+        - 2 * query_vectors @ vectors.T
+        + np.einsum("ij,ij->i", vectors, vectors)
+    )
+    return np.argsort(distances, axis=1, kind="stable")[:, :k]
+
+def build_backend(name, ids, vectors, documents, metadatas):
+    if name == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        client = chromadb.Client(Settings(anonymized_telemetry=False, allow_reset=True))
+        collection = client.get_or_create_collection(name=f"bench_{int(time.time() * 1000)}")
+        collection.add(ids=ids, embeddings=vectors.tolist(), documents=documents, metadatas=metadatas)
+        return collection, None
+    index = NumpyVectorIndex(dtype=name.split("-", 1)[1], metric="l2")
+    index.build(ids, vectors, documents, metadatas)
+    return index, index.stats()["matrix_bytes"]
+
+def run_backend(store, query_vectors, ids):
+    positions = {doc_id: i for i, doc_id in enumerate(ids)}
+    latencies, found = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        result = store.query(query_embeddings=[query.tolist()], n_results=TOP_K)
+        latencies.append(time.perf_counter() - start)
+        found.append([positions[doc_id] for doc_id in result["ids"][0]])
+    return np.asarray(latencies), found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index vector chính sách")
+    parser.add_argument("--backends", default=ALL_BACKENDS, help=f"Danh sách backend ({ALL_BACKENDS})")
+    parser.add_argument("--synthetic", action="store_true", help="Dùng vector ngẫu nhiên thay cho model")
+    parser.add_argument("--chunks", type=int, default=400, help="Số chunk (--synthetic)")
+    parser.add_argument("--queries", type=int, default=500, help="Số truy vấn (--synthetic)")
+    parser.add_argument("--dim", type=int, default=768, help="Số chiều (--synthetic)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, documents, metadatas, query_vectors = synthetic_data(args.chunks, args.queries, args.dim, args.seed)
+    else:
+        vectors, documents, metadatas, query_vectors = policy_data()
+    ids = [f"chunk_{i}" for i in range(len(vectors))]
+    truth = exact_top_k(vectors, query_vectors, TOP_K)
+    print(f"{len(vectors)} chunk x {vectors.shape[1]} chiều, {len(query_vectors)} truy vấn, top-{TOP_K}\n")
+
+    print(f"{'backend':<16}{'p50':>10}{'p95':>10}{'recall@3':>10}{'bộ nhớ':>12}")
+    for name in args.backends.split(","):
+        try:
+            store, matrix_bytes = build_backend(name, ids, vectors, documents, metadatas)
+        except ImportError as e:
+            print(f"{name:<16}  bỏ qua: {e}")
+            continue
+        run_backend(store, query_vectors[:10], ids)  # làm nóng
+        latencies, found = run_backend(store, query_vectors, ids)
+        recall = np.mean([len(set(f) & set(t)) / TOP_K for f, t in zip(found, truth.tolist())])
+        memory = f"{matrix_bytes / 1024:.0f} KB" if matrix_bytes is not None else "-"
+        p50, p95 = np.percentile(latencies * 1000, [50, 95])
+        print(f"{name:<16}{p50:>8.3f}ms{p95:>8.3f}ms{recall:>10.3f}{memory:>12}")
+
+if __name__ == "__main__":
+    main()
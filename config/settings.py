@@ -4,10 +4,26 @@ from google import genai
 from google.genai import types
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+from src.__modules.core.llm_provider import GeminiProvider, FakeLLMProvider
+from src.__modules.nlp.onnx_embedder import OnnxEmbedder
 
 dotenv.load_dotenv()
 
+def embedding_collection(client, name, identity):
+    """
+    Collection `name` với metadata `identity` (model/backend sinh embedding). Collection có sẵn được tạo
+    bằng model khác thì bị xóa và tạo lại trống để toàn bộ chunk được embed lại bằng model hiện tại.
+    """
+    collection = client.get_or_create_collection(name=name, metadata=identity)
+    metadata = collection.metadata or {}
+    stored = {key: metadata.get(key) for key in identity}
+    if stored == identity:
+        return collection
+    if collection.count():
+        print(f"🔄 Model embedding đã đổi ({stored} -> {identity}), tạo lại collection {name}")
+    client.delete_collection(name)
+    return client.create_collection(name=name, metadata={**metadata, **identity})
+
 class Config:
     # Kiểm tra API key trước khi khởi tạo client
     google_api_key = os.getenv("GOOGLE_API_KEY")
@@ -25,21 +41,133 @@ class Config:
         print("🔄 Hệ thống sẽ chạy ở chế độ fallback")
         agent = None
 
-    client = chromadb.Client(
-    Settings(
-        anonymized_telemetry=False,
-        allow_reset=True
-    )
-)
+    # Backend LLM: "gemini" (cần GOOGLE_API_KEY) hoặc "fake" (không cần mạng, trả lời theo kịch bản
+    # LLM_FAKE_SCRIPT sau LLM_FAKE_LATENCY_MS ± LLM_FAKE_JITTER_MS) để benchmark/profile offline
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+    LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+    LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+    LLM_FAKE_JITTER_MS = float(os.getenv("LLM_FAKE_JITTER_MS", "0"))
+    LLM_FAKE_TOKEN_MS = float(os.getenv("LLM_FAKE_TOKEN_MS", "0"))
+    LLM_FAKE_SCRIPT = os.getenv("LLM_FAKE_SCRIPT")
+    LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+
+    if LLM_PROVIDER == "fake":
+        fake_options = dict(latency_ms=LLM_FAKE_LATENCY_MS, jitter_ms=LLM_FAKE_JITTER_MS,
+                            seed=LLM_FAKE_SEED, model=LLM_MODEL, token_ms=LLM_FAKE_TOKEN_MS)
+        llm = (FakeLLMProvider.from_file(LLM_FAKE_SCRIPT, **fake_options) if LLM_FAKE_SCRIPT
+               else FakeLLMProvider(**fake_options))
+        print(f"🧪 Dùng LLM giả (độ trễ {LLM_FAKE_LATENCY_MS}ms ± {LLM_FAKE_JITTER_MS}ms)")
+    elif LLM_PROVIDER == "gemini":
+        llm = GeminiProvider(agent, model=LLM_MODEL) if agent else None
+    else:
+        raise ValueError(f"LLM_PROVIDER không hợp lệ: {LLM_PROVIDER}")
+
+    # Nếu đặt CHROMA_PERSIST_DIR thì index được lưu xuống đĩa và chỉ embed lại
+    # các chunk mới/thay đổi khi khởi động; nếu không thì dùng client in-memory
+    CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR")
+
+    if CHROMA_PERSIST_DIR:
+        client = chromadb.PersistentClient(
+            path=CHROMA_PERSIST_DIR,
+            settings=Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
+    else:
+        client = chromadb.Client(
+            Settings(
+                anonymized_telemetry=False,
+                allow_reset=True
+            )
+        )
     collection_name = "vexere_policy_gte"
-    collection = client.get_or_create_collection(name=collection_name)
-    model = SentenceTransformer(
-        'Alibaba-NLP/gte-multilingual-base', 
-        trust_remote_code=True
-    )
+
+    # Chia tài liệu chính sách: mỗi chunk tối đa CHUNK_MAX_TOKENS token (ước lượng), lặp lại tối đa
+    # CHUNK_OVERLAP_TOKENS token cuối của chunk trước; chunk mới được embed và thêm theo batch INDEX_BATCH_SIZE
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+    INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+
+    # Truy vấn chính sách: "chroma" (collection.query) hoặc "numpy" (index trong process nạp từ collection
+    # sau khi cập nhật, ma trận VECTOR_DTYPE = int8/float16/float32; Chroma vẫn là nơi lưu embedding)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+    VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "int8")
+
+    # Model embedding: "torch" (SentenceTransformer, mặc định) hoặc "onnx" (bản int8 xuất bằng
+    # `python src/__modules/nlp/onnx_embedder.py export` vào EMBEDDING_ONNX_DIR, chạy ONNX Runtime
+    # và không nạp PyTorch). EMBEDDING_THREADS: số thread ONNX Runtime mỗi worker (0: tự chọn)
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "Alibaba-NLP/gte-multilingual-base")
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./models/gte-multilingual-base-int8")
+    EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+    if EMBEDDING_BACKEND == "onnx":
+        model = OnnxEmbedder.load(EMBEDDING_ONNX_DIR, threads=EMBEDDING_THREADS)
+        print(f"✅ Dùng model embedding ONNX: {EMBEDDING_ONNX_DIR}")
+    elif EMBEDDING_BACKEND == "torch":
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(
+            EMBEDDING_MODEL,
+            trust_remote_code=True
+        )
+    else:
+        raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {EMBEDDING_BACKEND}")
+
+    # Định danh không gian embedding lưu trong metadata của collection: đổi model/backend/lượng tử hóa thì
+    # vector cũ không còn so được với câu hỏi, collection được xóa và embed lại toàn bộ
+    embedding_identity = {
+        "embedding_model": getattr(model, "source_model", None) or EMBEDDING_MODEL,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "embedding_quantized": bool(getattr(model, "quantized", False))
+    }
+    collection = embedding_collection(client, collection_name, embedding_identity)
+
+    # Ngữ cảnh chính sách trong prompt L1: lấy CONTEXT_CANDIDATES đoạn gần nhất, bỏ câu trùng, ghép theo thứ tự
+    # khoảng cách và cắt tại ranh giới câu để tổng không quá CONTEXT_MAX_TOKENS token (ước lượng),
+    # mỗi đoạn không quá CONTEXT_MAX_CHUNK_TOKENS (0: không giới hạn riêng)
+    CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "3"))
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1000"))
+    CONTEXT_MAX_CHUNK_TOKENS = int(os.getenv("CONTEXT_MAX_CHUNK_TOKENS", "0"))
+    CONTEXT_OVERLAP_THRESHOLD = float(os.getenv("CONTEXT_OVERLAP_THRESHOLD", "0.8"))
 
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+    # Lưu lịch sử chat: "list" (append O(1) bằng Redis list) hoặc "json" (một blob JSON như cũ)
+    CHAT_MEMORY_MODE = os.getenv("CHAT_MEMORY_MODE", "list")
+    CHAT_MEMORY_MAX_MESSAGES = int(os.getenv("CHAT_MEMORY_MAX_MESSAGES", "200"))
+    CHAT_MEMORY_TTL = int(os.getenv("CHAT_MEMORY_TTL", "3600"))
+
+    # Số thread tối đa cho các tác vụ blocking/CPU (encode, Chroma) trên luồng async
+    BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "4"))
+
+    # Chế độ cluster (nhiều worker/node sau load balancer): gửi frame giữa các worker qua Redis pub/sub,
+    # worker giữ WebSocket của session ghi trong Redis (TTL CLUSTER_SESSION_TTL giây) và /stats
+    # cộng gộp thống kê mà mỗi worker ghi lại sau mỗi CLUSTER_STATS_INTERVAL giây
+    CLUSTER_MODE = os.getenv("CLUSTER_MODE", "false").lower() == "true"
+    CLUSTER_SESSION_TTL = int(os.getenv("CLUSTER_SESSION_TTL", "300"))
+    CLUSTER_STATS_INTERVAL = float(os.getenv("CLUSTER_STATS_INTERVAL", "5"))
+
+    # Trạng thái hội thoại L23 theo session: LRU trong process + bản serialize trong Redis.
+    # Ở chế độ cluster mặc định tắt LRU vì tin nhắn tiếp theo của session có thể tới worker khác
+    SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "0" if CLUSTER_MODE else "10000"))
+    SESSION_STATE_TTL = int(os.getenv("SESSION_STATE_TTL", "3600"))
+
+    # Gom các lệnh encode câu hỏi đồng thời thành một batch
+    EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+    EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+    # Router cục bộ: chỉ gọi LLM khi độ tin cậy thấp hơn ngưỡng này
+    ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+
+    # WebSocket: hàng đợi gửi có giới hạn cho mỗi kết nối, số tin nhắn chờ xử lý tối đa mỗi session,
+    # timeout gửi (client đọc chậm hơn sẽ bị ngắt), chu kỳ ping và thời gian tối đa không có frame từ client
+    WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+    WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+    WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "120"))
+
     API_KEY = os.getenv("API_KEYS", "test-key").split(",")
     API_KEY_NAME = "x-api-key"
 
@@ -3,6 +3,8 @@ class VexereChatbot {
         this.sessionId = this.generateSessionId();
         this.websocket = null;
         this.isConnected = false;
+        // Tin nhắn bot đang được stream (element và nội dung đã nhận)
+        this.streamingMessage = null;
         
         this.initializeElements();
         this.setupEventListeners();
@@ -79,7 +81,7 @@ class VexereChatbot {
                 console.log('📨 WebSocket message received:', event.data);
                 try {
                     const data = JSON.parse(event.data);
-                    this.handleBotResponse(data);
+                    this.handleServerEvent(data);
                 } catch (error) {
                     console.error('❌ Error parsing WebSocket message:', error);
                 }
@@ -140,6 +142,7 @@ class VexereChatbot {
         const messageData = {
             message: message,
             session_id: this.sessionId,
+            stream: true,
             timestamp: Date.now()
         };
 
@@ -155,7 +158,8 @@ class VexereChatbot {
 
     async sendViaHTTP(message) {
         try {
-            const response = await fetch('/chat', {
+            // Server-Sent Events: nhận câu trả lời theo từng đoạn
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -166,13 +170,30 @@ class VexereChatbot {
                 })
             });
 
-            if (response.ok) {
-                const data = await response.json();
-                console.log('✅ HTTP response received:', data);
-                this.handleBotResponse(data);
-            } else {
+            if (!response.ok || !response.body) {
                 console.error('❌ HTTP request failed:', response.status);
                 this.handleError('Lỗi kết nối server (HTTP ' + response.status + ')');
+                return;
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Mỗi event kết thúc bằng một dòng trống
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                    if (dataLine) {
+                        this.handleServerEvent(JSON.parse(dataLine.slice(6)));
+                    }
+                }
             }
         } catch (error) {
             console.error('❌ HTTP request error:', error);
@@ -180,6 +201,46 @@ class VexereChatbot {
         }
     }
 
+    handleServerEvent(data) {
+        // Heartbeat của server: trả lời pong để kết nối không bị coi là idle
+        if (data.type === 'ping') {
+            if (this.websocket && this.websocket.readyState === WebSocket.OPEN) {
+                this.websocket.send(JSON.stringify({ type: 'pong' }));
+            }
+            return;
+        }
+
+        // Frame streaming: "chunk" (một đoạn câu trả lời) và "final" (câu trả lời đầy đủ)
+        if (data.type === 'chunk') {
+            this.handleStreamChunk(data);
+        } else if (data.type === 'final') {
+            this.handleStreamFinal(data);
+        } else {
+            this.streamingMessage = null;
+            this.handleBotResponse(data);
+        }
+    }
+
+    handleStreamChunk(data) {
+        if (!this.streamingMessage) {
+            this.hideTypingIndicator();
+            this.streamingMessage = { element: this.addMessage('', 'bot'), text: '' };
+        }
+        this.streamingMessage.text += data.delta;
+        this.streamingMessage.element.innerHTML = this.formatMessage(this.streamingMessage.text);
+        this.scrollToBottom();
+    }
+
+    handleStreamFinal(data) {
+        if (this.streamingMessage) {
+            this.streamingMessage.element.innerHTML = this.formatMessage(data.response);
+            this.streamingMessage = null;
+            this.scrollToBottom();
+        } else {
+            this.handleBotResponse(data);
+        }
+    }
+
     handleBotResponse(data) {
         console.log('🤖 Handling bot response:', data);
         
@@ -243,6 +304,7 @@ class VexereChatbot {
         this.scrollToBottom();
         
         console.log(`✅ Message added: ${sender} - ${text.substring(0, 50)}...`);
+        return messageText;
     }
 
     formatMessage(text) {
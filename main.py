@@ -7,11 +7,10 @@ Vexere Chatbot - Main Application
 import os
 import sys
 import uvicorn
-import json
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, HTTPException, WebSocket, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
 
 # Add project root to Python path
@@ -22,8 +21,16 @@ sys.path.insert(0, project_root)
 try:
     from src.api.be import (
         handle_chat_request, 
+        handle_chat_stream_request,
         handle_websocket_message,
         get_system_stats,
+        start_cluster,
+        stop_cluster,
+        get_metrics_text,
+        verify_api_key,
+        run_profiler,
+        get_trace,
+        get_recent_traces,
         get_health_status,
         manager,
         ChatRequest
@@ -49,11 +56,13 @@ async def lifespan(app: FastAPI):
         print(f"⚠️ Lỗi khởi tạo knowledge base: {e}")
         print("🔄 Ứng dụng sẽ tiếp tục chạy nhưng có thể thiếu dữ liệu...")
     
+    await start_cluster()
     print("✅ Vexere Chatbot đã sẵn sàng!")
     
     yield
     
     print("🛑 Đang tắt Vexere Chatbot...")
+    await stop_cluster()
 
 # Create main FastAPI app
 app = FastAPI(
@@ -99,34 +108,59 @@ async def chat_endpoint(request: ChatRequest):
     """
     return await handle_chat_request(request)
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Chat ở chế độ streaming (Server-Sent Events): các event `chunk` mang từng đoạn câu trả lời,
+    event `final` mang câu trả lời đầy đủ
+    """
+    return StreamingResponse(
+        handle_chat_stream_request(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/stats")
 async def get_stats():
     """Lấy thống kê hệ thống"""
-    return get_system_stats()
+    return await get_system_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Metrics cho Prometheus (bộ đếm và histogram độ trễ theo stage)"""
+    return PlainTextResponse(get_metrics_text(), media_type="text/plain; version=0.0.4")
+
+# Admin endpoints (yêu cầu header x-api-key)
+@app.post("/admin/profile", dependencies=[Depends(verify_api_key)])
+async def profile_endpoint(seconds: float = 10.0, interval_ms: float = 5.0,
+                           include_idle: bool = False, format: str = "json"):
+    """
+    Chạy sampling profiler trong `seconds` giây trên worker này.
+    format=collapsed trả về text dùng trực tiếp với flamegraph.pl/speedscope.
+    """
+    result = await run_profiler(seconds, interval_ms, include_idle)
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n")
+    return result
+
+@app.get("/admin/traces", dependencies=[Depends(verify_api_key)])
+async def recent_traces_endpoint(limit: int = 20):
+    """Trace id của các request gần đây"""
+    return get_recent_traces(limit)
+
+@app.get("/admin/traces/{trace_id}", dependencies=[Depends(verify_api_key)])
+async def trace_endpoint(trace_id: str):
+    """Các span (thời gian bắt đầu, độ dài, thuộc tính) của một trace"""
+    return get_trace(trace_id)
 
 # WebSocket endpoint
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint cho real-time chat"""
-    await manager.connect(websocket, session_id)
-    try:
-        while True:
-            # Nhận tin nhắn từ client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            user_message = message_data.get("message", "")
-            if not user_message:
-                continue
-            
-            # Xử lý tin nhắn thông qua be.py
-            await handle_websocket_message(websocket, session_id, user_message)
-                
-    except WebSocketDisconnect:
-        manager.disconnect(session_id)
-    except Exception as e:
-        print(f"❌ WebSocket error for {session_id}: {e}")
-        manager.disconnect(session_id)
+    """
+    WebSocket endpoint cho real-time chat.
+    Gửi {"message": "...", "stream": true} để nhận câu trả lời theo từng đoạn.
+    """
+    await manager.serve(websocket, session_id, handle_websocket_message)
 
 # Main execution
 if __name__ == "__main__":
@@ -136,10 +170,13 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
     debug = os.getenv("DEBUG", "true").lower() == "true"
+    # Nhiều worker cần CLUSTER_MODE=true để session và /stats dùng chung qua Redis
+    workers = int(os.getenv("WORKERS", "1"))
     
     print(f"🌐 Server sẽ chạy tại: http://{host}:{port}")
     print(f"📚 API Documentation: http://{host}:{port}/docs")
     print(f"🔧 Debug mode: {debug}")
+    print(f"👷 Workers: {workers}")
     print("🎯 Chế độ: Miễn phí (không cần API key)")
     
     # Chạy server
@@ -147,7 +184,8 @@ if __name__ == "__main__":
         "main:app",
         host=host,
         port=port,
-        reload=debug,
+        reload=debug and workers == 1,
+        workers=workers,
         access_log=True,
         log_level="info" if not debug else "debug"
     )
\ No newline at end of file
@@ -4,63 +4,166 @@ from sentence_transformers import SentenceTransformer
 import re
 import os
 import sys
+import time
 import dotenv
 from google import genai
-import fuzzywuzzy
-from fuzzywuzzy import process
 
 # Add project root to path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 sys.path.insert(0, project_root)
 
 from config.settings import config
-from src.database.kg_rag import faq_kg, policy_kg
+from src.database.kg_rag import faq_index, policy_kg, policy_index
+from src.__modules.core.executor import run_blocking
+from src.__modules.core.metrics import metrics
+from src.__modules.core.tracing import tracer
+from src.__modules.nlp.embedding_batcher import embedding_batcher
+from src.__modules.chatbot.context_builder import ContextBuilder
 
 dotenv.load_dotenv()
 
-def bot_response(query_text):
-    # Khởi tạo faq_kg
-    faq_data = faq_kg()
-    faq_questions = list(faq_data.keys())
-    
-    best_match, score = process.extractOne(query_text, faq_questions)
-    if score >= 90:
-        content = faq_data[best_match]['content']
-        if isinstance(content, list):
-            return "\n".join(content)
-        return content
-    else:
-    
-
-        # 1. Chuyển câu hỏi thành vector
-        query_embedding = config.model.encode(query_text)
-
-        # 2. Truy vấn trong collection
-        results = config.collection.query(
-            query_embeddings=[query_embedding.tolist()],
-            n_results=3
-        )
-        context = "\n".join(results['documents'][0])
-
-        prompt = f"""
+# Ghép các đoạn chính sách vào prompt trong giới hạn token
+context_builder = ContextBuilder(
+    max_tokens=config.CONTEXT_MAX_TOKENS,
+    max_chunk_tokens=config.CONTEXT_MAX_CHUNK_TOKENS,
+    overlap_threshold=config.CONTEXT_OVERLAP_THRESHOLD
+)
+
+@metrics.timed("faq_match")
+def match_faq(query_text):
+    """Tra cứu FAQ trên index đã nạp sẵn trong process, trả về câu trả lời hoặc None"""
+    best_match, score = faq_index.match(query_text)
+    if best_match is not None and score >= 90:
+        return faq_index.answer(best_match)
+    return None
+
+@metrics.timed("chroma_query")
+def query_policy(query_embedding):
+    """
+    Lấy các đoạn chính sách liên quan nhất theo embedding của câu hỏi (index numpy hoặc Chroma)
+    và ghép thành ngữ cảnh trong giới hạn token; số token được ghi vào span hiện tại
+    """
+    # Index numpy rỗng (chưa nạp được) thì vẫn dùng Chroma
+    store = policy_index if config.VECTOR_BACKEND == "numpy" and len(policy_index) else config.collection
+    results = store.query(
+        query_embeddings=[query_embedding.tolist()],
+        n_results=config.CONTEXT_CANDIDATES,
+        include=["documents", "distances"]
+    )
+    context = context_builder.build(results['documents'][0], results['distances'][0])
+    tracer.annotate(context_tokens=context.tokens, context_raw_tokens=context.raw_tokens,
+                    context_chunks=context.chunks)
+    return context.text
+
+def retrieve_context(query_text):
+    """Encode câu hỏi và lấy các đoạn chính sách liên quan nhất từ collection"""
+    # 1. Chuyển câu hỏi thành vector (gom batch với các request đồng thời)
+    with metrics.time("embedding"):
+        query_embedding = embedding_batcher.encode(query_text)
+
+    # 2. Truy vấn trong collection
+    return query_policy(query_embedding)
+
+def build_prompt(context, query_text):
+    return f"""
         Bạn là một trợ lý AI giúp hệ thống giải thích về chính sách, quy định, thủ tục và các thao tác có trong {context}
         Câu hỏi của khách hàng: {query_text}
         Bạn có thể thân thiện chào hỏi. Hỏi khách hàng thêm thông tin nếu cần.
         Hãy trả lời câu hỏi dựa trên ngữ cảnh ở trên. Nếu không tìm thấy thông tin liên quan, hãy trả lời rằng bạn không biết.
         """
 
+@tracer.traced("l1")
+def bot_response(query_text):
+    answer = match_faq(query_text)
+    if answer is not None:
+        return answer
+
+    prompt = build_prompt(retrieve_context(query_text), query_text)
+
+    try:
+        if config.llm:
+            with metrics.time("llm_answer"):
+                return config.llm.generate(prompt)
+        else:
+            # Không có API key, sử dụng fallback
+            raise Exception("API key không khả dụng")
+    except Exception as e:
+        print(f"⚠️ Lỗi gọi LLM: {e}")
+
+async def _aprepare(query_text):
+    """Trả về (câu trả lời FAQ, None) nếu khớp FAQ, ngược lại (None, prompt cho LLM)"""
+    answer = await run_blocking(match_faq, query_text)
+    if answer is not None:
+        return answer, None
+
+    with metrics.time("embedding"):
+        query_embedding = await embedding_batcher.aencode(query_text)
+    context = await run_blocking(query_policy, query_embedding)
+    return None, build_prompt(context, query_text)
+
+@tracer.traced("l1")
+async def abot_response(query_text):
+    """
+    Phiên bản async của bot_response: tra FAQ và truy vấn Chroma chạy trong executor
+    giới hạn, encode qua embedding batcher, gọi LLM qua provider async nên không chặn event loop.
+    """
+    answer, prompt = await _aprepare(query_text)
+    if answer is not None:
+        return answer
+
+    try:
+        if config.llm:
+            with metrics.time("llm_answer"):
+                return await config.llm.agenerate(prompt)
+        else:
+            # Không có API key, sử dụng fallback
+            raise Exception("API key không khả dụng")
+    except Exception as e:
+        print(f"⚠️ Lỗi gọi LLM: {e}")
+
+async def _timed_stream(stream):
+    """
+    Chuyển tiếp các đoạn của stream LLM, chỉ đo thời gian chờ LLM (không tính lúc client nhận đoạn):
+    llm_first_token là thời gian tới đoạn đầu tiên, llm_answer là tổng thời gian sinh cả câu trả lời.
+    """
+    generating = 0.0
+    first_token = True
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                generating += time.perf_counter() - start
+            if first_token:
+                metrics.observe("llm_first_token", generating)
+                first_token = False
+            yield chunk
+    finally:
+        metrics.observe("llm_answer", generating)
+
+async def abot_response_stream(query_text):
+    """
+    Phiên bản streaming của abot_response: trả về từng đoạn câu trả lời ngay khi LLM sinh ra
+    (câu trả lời FAQ được trả về trong một đoạn). Lỗi LLM giữa chừng thì dừng ở phần đã có.
+    """
+    with tracer.span("l1"):
+        answer, prompt = await _aprepare(query_text)
+        if answer is not None:
+            yield answer
+            return
+
         try:
-            if config.agent:
-                response = config.agent.models.generate_content(
-                    model = "gemini-2.0-flash",
-                    contents = prompt
-                )
-                return response.text
-            else:
+            if not config.llm:
                 # Không có API key, sử dụng fallback
                 raise Exception("API key không khả dụng")
+            async for chunk in _timed_stream(config.llm.astream(prompt)):
+                yield chunk
         except Exception as e:
-            print(f"⚠️ Lỗi API Gemini: {e}")
+            print(f"⚠️ Lỗi gọi LLM: {e}")
 
 if __name__ == "__main__":
     print("Hệ thống đã sẵn sàng để trả lời câu hỏi.")
@@ -0,0 +1,124 @@
+import re
+import threading
+from collections import namedtuple
+
+from src.__modules.nlp.tokens import estimate_tokens
+
+# Ranh giới câu: sau dấu kết thúc câu (hoặc ;) và khoảng trắng, hoặc xuống dòng
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…;])\s+|\s*\n\s*")
+
+ContextResult = namedtuple("ContextResult", "text tokens raw_tokens chunks truncated duplicates")
+
+def split_sentences(text: str):
+    return [sentence for sentence in _SENTENCE_BOUNDARY.split(text.strip()) if sentence]
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+class ContextBuilder:
+    """
+    Ghép các đoạn chính sách truy vấn được thành ngữ cảnh cho prompt, trong giới hạn `max_tokens`.
+
+    Các đoạn được xếp theo khoảng cách tăng dần (gần câu hỏi nhất trước) và ghép theo từng câu:
+    câu đã có trong ngữ cảnh bị bỏ qua, đoạn có ít nhất `overlap_threshold` số câu đã có thì bị bỏ hẳn
+    (các đoạn chồng lấn nhau); khi câu tiếp theo vượt ngân sách thì đoạn bị cắt tại ranh giới câu.
+    Mỗi đoạn dùng tối đa `max_chunk_tokens` token để một đoạn rất dài không chiếm hết chỗ của các đoạn sau.
+    """
+    def __init__(self, max_tokens: int = 1000, max_chunk_tokens: int = None, overlap_threshold: float = 0.8,
+                 separator: str = "\n", count_tokens=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.max_chunk_tokens = max_chunk_tokens or max_tokens
+        self.overlap_threshold = overlap_threshold
+        self.separator = separator
+        self.count_tokens = count_tokens
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.raw_tokens = 0
+        self.truncated_chunks = 0
+        self.duplicate_chunks = 0
+
+    def _fit_words(self, sentence: str, budget: int) -> str:
+        """Phần đầu của một câu dài hơn cả ngân sách, cắt theo từ"""
+        words, used = [], 0
+        for word in sentence.split():
+            cost = self.count_tokens(word)
+            if used + cost > budget:
+                break
+            words.append(word)
+            used += cost
+        return " ".join(words)
+
+    def build(self, documents, distances=None) -> ContextResult:
+        """Ngữ cảnh từ các đoạn `documents` (kèm khoảng cách tới câu hỏi nếu có) và số token đã dùng"""
+        documents = [document or "" for document in documents]
+        order = range(len(documents))
+        if distances is not None:
+            order = sorted(order, key=lambda i: distances[i])
+
+        seen = set()
+        parts = []
+        remaining = self.max_tokens
+        raw_tokens = truncated = duplicates = 0
+        for i in order:
+            sentences = split_sentences(documents[i])
+            costs = [self.count_tokens(sentence) for sentence in sentences]
+            raw_tokens += sum(costs)
+            if remaining <= 0:
+                # Hết ngân sách: đoạn xa hơn bị bỏ
+                truncated += 1
+                continue
+            if not sentences:
+                continue
+            keys = [_sentence_key(sentence) for sentence in sentences]
+            if sum(key in seen for key in keys) >= self.overlap_threshold * len(sentences):
+                duplicates += 1
+                continue
+
+            budget = min(remaining, self.max_chunk_tokens)
+            kept, used = [], 0
+            for sentence, cost, key in zip(sentences, costs, keys):
+                if key in seen:
+                    continue
+                if used + cost > budget:
+                    if not kept and not parts:
+                        # Câu đầu tiên của ngữ cảnh dài hơn ngân sách: vẫn lấy phần đầu câu
+                        sentence = self._fit_words(sentence, budget)
+                        if sentence:
+                            kept.append(sentence)
+                            used += self.count_tokens(sentence)
+                    truncated += 1
+                    break
+                kept.append(sentence)
+                used += cost
+                seen.add(key)
+
+            if kept:
+                parts.append(" ".join(kept))
+                remaining -= used
+
+        text = self.separator.join(parts)
+        result = ContextResult(text, self.count_tokens(text), raw_tokens, len(parts), truncated, duplicates)
+        with self._stats_lock:
+            self.requests += 1
+            self.tokens += result.tokens
+            self.raw_tokens += raw_tokens
+            self.truncated_chunks += truncated
+            self.duplicate_chunks += duplicates
+        return result
+
+    def stats(self) -> dict:
+        """Số token ngữ cảnh đã dùng so với tổng số token của các đoạn truy vấn được"""
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "tokens": self.tokens,
+                "raw_tokens": self.raw_tokens,
+                "avg_tokens": round(self.tokens / self.requests, 1) if self.requests else 0.0,
+                "truncated_chunks": self.truncated_chunks,
+                "duplicate_chunks": self.duplicate_chunks,
+                "max_tokens": self.max_tokens
+            }
@@ -9,6 +9,7 @@ from datetime import datetime
 # Import nlp_engine từ module cha
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from nlp_extractor.nlp_engine import get_intent_entities_from_text
+from src.__modules.nlp.normalization import cities
 
 class TicketImageExtractor:
     """Trích xuất thông tin vé từ hình ảnh sử dụng PaddleOCR"""
@@ -159,28 +160,12 @@ class TicketImageExtractor:
         """Chuẩn hóa thông tin vé"""
         normalized = info.copy()
         
-        # Chuẩn hóa tên thành phố
-        city_mapping = {
-            'hà nội': 'hà nội',
-            'ha noi': 'hà nội',
-            'hanoi': 'hà nội',
-            'sài gòn': 'sài gòn',
-            'sai gon': 'sài gòn',
-            'hồ chí minh': 'sài gòn',
-            'ho chi minh': 'sài gòn',
-            'hcm': 'sài gòn',
-            'đà nẵng': 'đà nẵng',
-            'da nang': 'đà nẵng',
-            'danang': 'đà nẵng'
-        }
-        
+        # Chuẩn hóa tên thành phố (có dấu/không dấu/viết tắt đều về tên chuẩn)
         for field in ['departure', 'destination']:
             if field in normalized:
-                city = normalized[field].lower().strip()
-                for key, value in city_mapping.items():
-                    if key in city:
-                        normalized[field] = value
-                        break
+                city = cities.find(normalized[field])
+                if city:
+                    normalized[field] = city
         
         # Chuẩn hóa thời gian
         if 'departure_time' in normalized:
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Trích xuất intent/entity hàng loạt cho log chat và text OCR (chạy offline, không qua API server).
+
+    python src/__modules/chatbot/nlp_extractor/batch.py logs.jsonl -o nlp.jsonl --workers 0
+    cat ocr.jsonl | python src/__modules/chatbot/nlp_extractor/batch.py - --field full_text > nlp.jsonl
+
+Mỗi dòng input là một JSON object (lấy text ở --field) hoặc một chuỗi JSON. Mỗi dòng output là
+object đó kèm kết quả ở --output-field, đúng thứ tự input; dòng lỗi được ghi lại với key "error".
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+sys.path.insert(0, project_root)
+
+from src.__modules.chatbot.nlp_extractor.nlp_engine import get_intent_entities_from_text
+
+DEFAULT_CHUNK_SIZE = 256
+
+def _extract_chunk(texts):
+    return [get_intent_entities_from_text(text) for text in texts]
+
+def _chunks(texts, size):
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def extract_batch(texts, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE, max_pending: int = None):
+    """
+    Phân tích một iterable text, trả về (generator) kết quả của get_intent_entities_from_text theo đúng thứ tự.
+
+    workers=1 chạy ngay trong process hiện tại; workers>1 (hoặc 0 = số CPU) chia text thành từng chunk
+    `chunk_size` phần tử và gửi cho process pool. Chỉ giữ tối đa `max_pending` chunk đang xử lý
+    (mặc định 2 chunk mỗi worker) nên input rất lớn vẫn được đọc dần, không nạp hết vào bộ nhớ.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for text in texts:
+            yield get_intent_entities_from_text(text)
+        return
+
+    max_pending = max_pending or workers * 2
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in _chunks(texts, chunk_size):
+            pending.append(pool.submit(_extract_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Người gọi dừng giữa chừng: bỏ các chunk chưa chạy thay vì chờ chúng xong
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _read_records(lines, field, records):
+    """Đọc từng dòng JSONL, đưa record vào `records` (hàng đợi chờ kết quả) và trả về text cần phân tích"""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+            if isinstance(value, str):
+                record, text = {"text": value}, value
+            elif isinstance(value, dict) and isinstance(value.get(field), str):
+                record, text = value, value[field]
+            else:
+                raise ValueError(f"thiếu trường '{field}' kiểu chuỗi")
+            records.append((record, None))
+        except ValueError as e:
+            text = ""
+            records.append(({"line": line_number}, str(e)))
+        yield text
+
+def process_jsonl(lines, output, field: str = "text", output_field: str = "nlp",
+                  workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """Phân tích các dòng JSONL và ghi kết quả ra `output` (file text); trả về thống kê"""
+    records = deque()
+    stats = {"records": 0, "errors": 0}
+    start = time.perf_counter()
+    for result in extract_batch(_read_records(lines, field, records), workers=workers, chunk_size=chunk_size):
+        record, error = records.popleft()
+        if error:
+            record = {**record, "error": error}
+            stats["errors"] += 1
+        else:
+            record = {**record, output_field: result}
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        stats["records"] += 1
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trích xuất intent/entity hàng loạt từ file JSONL")
+    parser.add_argument("input", help="File JSONL đầu vào, '-' để đọc stdin")
+    parser.add_argument("-o", "--output", default="-", help="File JSONL kết quả, '-' để ghi stdout")
+    parser.add_argument("--field", default="text", help="Trường chứa text trong mỗi object")
+    parser.add_argument("--output-field", default="nlp", help="Trường chứa kết quả trong object output")
+    parser.add_argument("--workers", type=int, default=1, help="Số process (1: không dùng pool, 0: số CPU)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Số text mỗi lần gửi cho worker")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        stats = process_jsonl(source, target, field=args.field, output_field=args.output_field,
+                              workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    rate = stats["records"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"✅ {stats['records']} dòng ({stats['errors']} lỗi) trong {stats['seconds']}s, {rate:.0f} dòng/s",
+          file=sys.stderr)
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,16 @@
 import re
+import sys
+import os
 from datetime import datetime, timedelta
 
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+sys.path.insert(0, project_root)
+
+from src.database.schemas import SimpleDatabase as BaseSimpleDatabase, normalize_time
+from src.__modules.chatbot.nlp_extractor.scanner import PatternScanner
+from src.__modules.nlp.normalization import normalize_text, cities
+
 # Patterns để nhận diện intent và entities
 INTENT_PATTERNS = {
     'dat_ve': re.compile(r'đặt|mua|book.*vé', re.I),
@@ -18,80 +28,75 @@ ENTITY_PATTERNS = {
     'city': re.compile(r'hà nội|sài gòn|đà nẵng|hồ chí minh|huế|cần thơ|hải phòng', re.I)
 }
 
+# Pattern tuyến đường, chỉ thử tại vị trí có từ khóa "từ"/"đi"
+ROUTE_PATTERN = re.compile(r'từ\s+([\w\s]+?)\s+đến\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)')
+GO_PATTERN = re.compile(r'đi\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)')
+
+# Thứ tự entity trong kết quả
+EXTRACTED_ENTITIES = ('time', 'date', 'quantity', 'ticket_code')
+# Entity giữ nguyên hoa thường như pattern gốc, được tìm trên text chưa lowercase
+ORIGINAL_CASE_ENTITIES = ('ticket_code',)
+
+# Text ngắn hơn ngưỡng này (câu chat) chạy từng pattern trực tiếp, nhanh hơn scanner vì không phải
+# chạy trigger và dựng kết quả; text dài hơn (OCR) quét một lần bằng scanner (xem bench_nlp.py)
+SCANNER_MIN_LENGTH = 256
+
+# Quét một lần cho mọi intent, entity (kể cả city) và từ khóa tuyến đường
+scanner = PatternScanner(INTENT_PATTERNS, ENTITY_PATTERNS, keywords=('từ', 'đến', 'đi'),
+                         original_case=ORIGINAL_CASE_ENTITIES)
+
 def get_intent_entities_from_text(text):
-    """Phân tích intent và entities từ text"""
+    """Phân tích intent và entities từ text (kết quả như nhau với cả hai cách tìm)"""
+    if len(text) < SCANNER_MIN_LENGTH:
+        return _extract_by_pattern(text)
+    return _extract_by_scanner(text)
+
+def _extract_by_pattern(text):
+    """Mỗi pattern tìm trực tiếp trên text (câu ngắn)"""
     text_lower = text.lower()
-    
-    # Tìm intent
     intent = 'unknown'
-    for intent_name, pattern in INTENT_PATTERNS.items():
+    for name, pattern in INTENT_PATTERNS.items():
         if pattern.search(text_lower):
-            intent = intent_name
+            intent = name
             break
-    
-    # Tìm entities
     entities = []
-    
-    # Tìm time
-    for match in ENTITY_PATTERNS['time'].finditer(text_lower):
-        entities.append({
-            'entity': 'time',
-            'value': match.group().strip(),
-            'confidence': 0.8
-        })
-    
-    # Tìm date
-    for match in ENTITY_PATTERNS['date'].finditer(text_lower):
-        entities.append({
-            'entity': 'date', 
-            'value': match.group().strip(),
-            'confidence': 0.8
-        })
-    
-    # Tìm quantity
-    for match in ENTITY_PATTERNS['quantity'].finditer(text_lower):
-        entities.append({
-            'entity': 'quantity',
-            'value': match.group().strip(),
-            'confidence': 0.8
-        })
-    
-    # Tìm ticket_code
-    for match in ENTITY_PATTERNS['ticket_code'].finditer(text):
-        entities.append({
-            'entity': 'ticket_code',
-            'value': match.group().strip(),
-            'confidence': 0.8
-        })
-    
-    # Xử lý location đặc biệt - SỬA LẠI
+    for label in EXTRACTED_ENTITIES:
+        source = text if label in ORIGINAL_CASE_ENTITIES else text_lower
+        for match in ENTITY_PATTERNS[label].finditer(source):
+            entities.append({'entity': label, 'value': match.group().strip(), 'confidence': 0.8})
+    route_match = go_match = None
     if 'từ' in text_lower and 'đến' in text_lower:
-        # Pattern: "từ X đến Y"
-        location_match = re.search(r'từ\s+([\w\s]+?)\s+đến\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)', text_lower)
-        if location_match:
-            departure = location_match.group(1).strip()
-            destination = location_match.group(2).strip()
-            entities.append({
-                'entity': 'departure',
-                'value': departure,
-                'confidence': 0.8
-            })
-            entities.append({
-                'entity': 'destination', 
-                'value': destination,
-                'confidence': 0.8
-            })
+        route_match = ROUTE_PATTERN.search(text_lower)
     elif 'đi' in text_lower:
-        # Pattern: "đi X" - SỬA LẠI để không bao gồm thời gian
-        go_match = re.search(r'đi\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)', text_lower)
-        if go_match:
-            destination = go_match.group(1).strip()
-            entities.append({
-                'entity': 'destination',
-                'value': destination,
-                'confidence': 0.8
-            })
-    
+        go_match = GO_PATTERN.search(text_lower)
+    return _build_result(intent, entities, route_match, go_match)
+
+def _extract_by_scanner(text):
+    """Một lần quét cho mọi pattern (text dài)"""
+    result = scanner.scan(text)
+    intent = result.first_intent(scanner.intent_labels) or 'unknown'
+    entities = [
+        {'entity': label, 'value': value, 'confidence': 0.8}
+        for label in EXTRACTED_ENTITIES
+        for value in result.values(label)
+    ]
+
+    # Tuyến đường: khớp đầu tiên tại một vị trí có từ khóa (như re.search)
+    keywords = result.keywords
+    route_match = go_match = None
+    if keywords['từ'] and keywords['đến']:
+        route_match = next(filter(None, (ROUTE_PATTERN.match(result.text_lower, p) for p in keywords['từ'])), None)
+    elif keywords['đi']:
+        go_match = next(filter(None, (GO_PATTERN.match(result.text_lower, p) for p in keywords['đi'])), None)
+    return _build_result(intent, entities, route_match, go_match)
+
+def _build_result(intent, entities, route_match, go_match):
+    """Thêm entity tuyến đường vào danh sách entity và dựng kết quả"""
+    if route_match:
+        entities.append({'entity': 'departure', 'value': route_match.group(1).strip(), 'confidence': 0.8})
+        entities.append({'entity': 'destination', 'value': route_match.group(2).strip(), 'confidence': 0.8})
+    elif go_match:
+        entities.append({'entity': 'destination', 'value': go_match.group(1).strip(), 'confidence': 0.8})
     return {
         'intent': intent,
         'entities': entities,
@@ -100,11 +105,33 @@ def get_intent_entities_from_text(text):
 
 class ConversationState:
     """Lưu trạng thái cuộc hội thoại"""
+    # Số lượt lịch sử giữ lại khi serialize để bản lưu luôn gọn
+    MAX_SERIALIZED_HISTORY = 10
+
     def __init__(self):
         self.current_intent = None
         self.collected_entities = {}
         self.conversation_history = []
         self.completed_actions = {}
+
+    def to_dict(self):
+        """Serialize trạng thái thành dict gọn (chỉ giữ vài lượt lịch sử gần nhất)"""
+        return {
+            'current_intent': self.current_intent,
+            'collected_entities': self.collected_entities,
+            'conversation_history': self.conversation_history[-self.MAX_SERIALIZED_HISTORY:],
+            'completed_actions': self.completed_actions
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Khôi phục trạng thái từ dict của to_dict"""
+        state = cls()
+        state.current_intent = data.get('current_intent')
+        state.collected_entities = data.get('collected_entities', {})
+        state.conversation_history = data.get('conversation_history', [])
+        state.completed_actions = data.get('completed_actions', {})
+        return state
     
     def add_to_history(self, user_input, intent, entities):
         self.conversation_history.append({
@@ -117,8 +144,8 @@ class ConversationState:
         self.current_intent = None
         self.collected_entities = {}
 
-class SimpleDatabase:
-    """Database đơn giản để demo"""
+class SimpleDatabase(BaseSimpleDatabase):
+    """Database dùng chung (singleton) cho mọi ConversationManager"""
     _instance = None
     
     def __new__(cls):
@@ -131,171 +158,12 @@ class SimpleDatabase:
         if self._initialized:
             return
         self._initialized = True
-        
-        self.schedules = [
-            {
-                'id': 'TN001',
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '08:00',
-                'date': '2025-09-05',
-                'available_seats': 50
-            },
-            {
-                'id': 'TN002', 
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '09:00',  # THÊM CHUYẾN 9H
-                'date': '2025-09-05',
-                'available_seats': 30
-            },
-            {
-                'id': 'TN003',
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '14:00',
-                'date': '2025-09-05',
-                'available_seats': 30
-            },
-            {
-                'id': 'TN004',
-                'departure': 'sài gòn',
-                'destination': 'hà nội', 
-                'time': '09:00',
-                'date': '2025-09-05',
-                'available_seats': 40
-            }
-        ]
-        self.bookings = {}
-    
-    def find_available_schedules(self, departure, destination, date, quantity=1):
-        """Tìm chuyến có sẵn"""
-        available = []
-        for schedule in self.schedules:
-            if (schedule['departure'] == departure.lower() and 
-                schedule['destination'] == destination.lower() and
-                schedule['date'] == date and
-                schedule['available_seats'] >= quantity):
-                available.append(schedule)
-        return available
-    
-    def book_ticket(self, schedule_id, quantity, passenger_info):
-        """Đặt vé"""
-        # Tìm schedule
-        schedule = None
-        for s in self.schedules:
-            if s['id'] == schedule_id:
-                schedule = s
-                break
-        
-        if not schedule or schedule['available_seats'] < quantity:
-            return None, "Không đủ chỗ trống"
-        
-        # Tạo mã vé
-        ticket_code = f"VN{len(self.bookings)+1:06d}"
-        
-        # Lưu booking
-        self.bookings[ticket_code] = {
-            'ticket_code': ticket_code,
-            'schedule_id': schedule_id,
-            'departure': schedule['departure'],
-            'destination': schedule['destination'],
-            'time': schedule['time'],
-            'date': schedule['date'],
-            'quantity': quantity,
-            'status': 'booked'
-        }
-        
-        # Giảm ghế trống
-        schedule['available_seats'] -= quantity
-        
-        return ticket_code, "Đặt vé thành công"
-    
-    def get_booking(self, ticket_code):
-        """Lấy thông tin booking"""
-        return self.bookings.get(ticket_code)
-    
-    def cancel_ticket(self, ticket_code):
-        """Hủy vé"""
-        booking = self.bookings.get(ticket_code)
-        if not booking:
-            return False, "Không tìm thấy vé"
-        
-        if booking['status'] == 'cancelled':
-            return False, "Vé đã được hủy"
-        
-        # Hủy vé
-        booking['status'] = 'cancelled'
-        
-        # Hoàn ghế
-        for schedule in self.schedules:
-            if schedule['id'] == booking['schedule_id']:
-                schedule['available_seats'] += booking['quantity']
-                break
-        
-        return True, "Hủy vé thành công"
-    
-    def change_time(self, ticket_code, new_time):
-        """Đổi giờ"""
-        booking = self.bookings.get(ticket_code)
-        if not booking:
-            return False, "Không tìm thấy vé"
-        
-        # Tìm chuyến mới cùng tuyến
-        new_schedule = None
-        for schedule in self.schedules:
-            if (schedule['departure'] == booking['departure'] and
-                schedule['destination'] == booking['destination'] and 
-                schedule['time'] == new_time and
-                schedule['available_seats'] >= booking['quantity']):
-                new_schedule = schedule
-                break
-        
-        if not new_schedule:
-            return False, f"Không có chuyến lúc {new_time}"
-        
-        # Hoàn ghế cho chuyến cũ
-        for schedule in self.schedules:
-            if schedule['id'] == booking['schedule_id']:
-                schedule['available_seats'] += booking['quantity']
-                break
-        
-        # Đặt chỗ chuyến mới
-        new_schedule['available_seats'] -= booking['quantity']
-        booking['schedule_id'] = new_schedule['id']
-        booking['time'] = new_time
-        
-        return True, f"Đổi giờ thành công sang {new_time}"
-
-def normalize_time(time_str):
-    """Chuẩn hóa format thời gian"""
-    time_str = time_str.strip().lower()
-    
-    # Xử lý "9h" -> "09:00"
-    if 'h' in time_str and ':' not in time_str:
-        time_str = time_str.replace('h', ':00')
-        if 'sáng' in time_str:
-            time_str = time_str.replace(' sáng', '')
-    
-    # Xử lý "9" -> "09:00"  
-    if ':' not in time_str and time_str.isdigit():
-        hour = int(time_str)
-        time_str = f"{hour:02d}:00"
-    
-    # Xử lý "9:0" -> "09:00"
-    if ':' in time_str:
-        parts = time_str.split(':')
-        if len(parts) == 2:
-            hour = int(parts[0])
-            minute = int(parts[1])
-            time_str = f"{hour:02d}:{minute:02d}"
-    
-    return time_str
+        super().__init__()
 
 class ConversationManager:
     """Quản lý cuộc hội thoại"""
-    def __init__(self):
-        self.state = ConversationState()
+    def __init__(self, state=None):
+        self.state = state if state is not None else ConversationState()
         self.db = SimpleDatabase()
         
         # Entity bắt buộc cho mỗi intent
@@ -340,6 +208,9 @@ class ConversationManager:
             entity_type = entity['entity']
             if entity_type == 'time' and self.state.current_intent == 'doi_gio':
                 self.state.collected_entities['new_time'] = entity['value']
+            elif entity_type in ('departure', 'destination'):
+                # "hcm", "Ha Noi"... -> tên thành phố chuẩn trong dữ liệu chuyến
+                self.state.collected_entities[entity_type] = cities.canonical(entity['value'], entity['value'])
             else:
                 self.state.collected_entities[entity_type] = entity['value']
         
@@ -362,20 +233,17 @@ class ConversationManager:
         
         next_entity = missing[0]
         user_input = user_input.strip()
+        text = normalize_text(user_input)
         
         print(f"   🔧 [Debug] Xử lý entity '{next_entity}' với input '{user_input}'")
         
         if next_entity in ['departure', 'destination']:
-            # Tìm tên thành phố
-            city_match = ENTITY_PATTERNS['city'].search(user_input.lower())
-            if city_match:
-                self.state.collected_entities[next_entity] = city_match.group()
-            else:
-                self.state.collected_entities[next_entity] = user_input.lower()
+            # Tìm tên thành phố (kể cả viết tắt/không dấu)
+            self.state.collected_entities[next_entity] = cities.find(text) or text
         
         elif next_entity in ['time', 'new_time']:
             # Xử lý time hoặc new_time
-            time_match = ENTITY_PATTERNS['time'].search(user_input.lower())
+            time_match = ENTITY_PATTERNS['time'].search(text)
             if time_match:
                 self.state.collected_entities[next_entity] = time_match.group()
             else:
@@ -383,10 +251,10 @@ class ConversationManager:
                 self.state.collected_entities[next_entity] = user_input
         
         elif next_entity == 'date':
-            date_match = ENTITY_PATTERNS['date'].search(user_input.lower())
+            date_match = ENTITY_PATTERNS['date'].search(text)
             if date_match:
                 self.state.collected_entities['date'] = date_match.group()
-            elif 'mai' in user_input.lower():
+            elif 'mai' in text:
                 self.state.collected_entities['date'] = 'ngày mai'
             else:
                 self.state.collected_entities['date'] = user_input
@@ -0,0 +1,378 @@
+import re
+from collections import namedtuple
+
+# Một kết quả khớp: kind là "intent" hoặc "entity", label là tên intent/entity,
+# [start, end) là vị trí trong text đã lowercase (text gốc với pattern giữ hoa thường), value là đoạn text đã strip
+Span = namedtuple("Span", ["kind", "label", "start", "end", "value"])
+
+# Ký tự đặc biệt của regex: phần literal ở đầu một nhánh dừng tại đây
+_META = set("\\.^$*+?{}[]()|")
+
+# Nhánh bắt đầu bằng một dãy chữ số: (\d+), \d+ hoặc \d{1,2} rồi phần đuôi
+_DIGIT_LED = re.compile(r"^(\(\\d\+\)|\\d\+|\\d\{1,2\})(.+)$")
+# Nhánh 2-3 chữ cái rồi một dãy chữ số, vd. [A-Z]{2,3}\d{6,}
+_LETTER_DIGIT_LED = re.compile(r"^(\[[^\]]+\])\{(\d+),(\d+)\}(\\d.*)$")
+
+def _split_alternatives(pattern: str):
+    """Tách pattern thành các nhánh `|` ở cấp ngoài cùng"""
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    parts.append(pattern[start:])
+    return parts
+
+def _leading_literal(alternative: str) -> str:
+    """Phần literal bắt buộc ở đầu nhánh (bỏ ký tự cuối nếu nó đi kèm quantifier cho phép 0 lần)"""
+    literal = []
+    for char in alternative:
+        if char in _META:
+            if char in "?*{" and literal:
+                literal.pop()
+            break
+        literal.append(char)
+    return "".join(literal)
+
+def _case_variants(alphabet):
+    """
+    Với mỗi ký tự, các ký tự khác có thể có trong text đã lowercase mà re.I vẫn coi là khớp
+    (vd. 'ı' cho 'i', 'ſ' cho 's'). Đó là các ký tự thường có cùng chữ hoa; các cặp này cho
+    chữ Latin/tiếng Việt đều nằm trong BMP nên chỉ cần duyệt BMP (vài ms, một lần khi khởi tạo).
+    """
+    by_upper = {}
+    for char in alphabet:
+        by_upper.setdefault(char.upper(), []).append(char)
+    variants = {}
+    for code in range(0x10000):
+        other = chr(code)
+        chars = by_upper.get(other.upper())
+        if not chars or other.lower() != other:
+            continue
+        for char in chars:
+            if other != char and re.fullmatch(re.escape(char), other, re.I):
+                variants.setdefault(char, [char]).append(other)
+    return variants
+
+def _trie_pattern(words, variants=None):
+    """
+    Regex dạng trie cho một tập từ: các từ chung tiền tố dùng chung nhánh nên engine thử ít nhánh hơn.
+    Ký tự có trong `variants` được thay bằng lớp ký tự tương đương.
+    """
+    variants = variants or {}
+
+    def char_pattern(char):
+        if char in variants:
+            return "[" + "".join(re.escape(c) for c in variants[char]) + "]"
+        return re.escape(char)
+
+    tree = {}
+    for word in words:
+        node = tree
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node):
+        branches = [char_pattern(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + body + ")?" if len(branches) == 1 else body + "?"
+        return body
+
+    return emit(tree)
+
+class _Rule:
+    """
+    Một pattern cần quét, với các vị trí có thể bắt đầu khớp của từng nhánh:
+    - nhánh bắt đầu bằng literal: vị trí có literal đó
+    - nhánh (\\d+)/\\d+/\\d{1,2} + đuôi: trong một dãy chữ số mà ngay sau dãy là phần đuôi
+    - nhánh [..]{m,n} + \\d...: m-n ký tự ngay trước một dãy chữ số
+    Pattern có nhánh không tách được theo các dạng trên (vd. bắt đầu bằng \\b, [..] hay một nhóm)
+    không tham gia trigger mà được quét riêng bằng finditer trên cả text (fallback).
+    """
+    def __init__(self, index, kind, label, pattern, original_case=False):
+        self.index = index
+        self.kind = kind
+        self.label = label
+        self.pattern = pattern
+        self.original_case = original_case
+        self.branches = []           # (literal hoặc None, nhánh chỉ gồm literal) theo thứ tự trong pattern
+        self.digit_suffixes = []     # phần đuôi sau dãy chữ số
+        self.digit_any_start = False  # có nhánh \d+ (khớp từ bất kỳ chữ số nào của dãy)
+        self.digit_tail_start = False  # có nhánh \d{1,2} (chỉ khớp từ 1-2 chữ số cuối dãy)
+        self.letter_digit = []       # (lớp ký tự, số ký tự tối thiểu, tối đa, phần chữ số)
+        self.fallback = False
+
+        for alternative in _split_alternatives(pattern.pattern):
+            if not self._add_branch(alternative):
+                self.fallback = True
+                self.branches, self.digit_suffixes, self.letter_digit = [], [], []
+                self.digit_any_start = self.digit_tail_start = False
+                break
+
+    def _add_branch(self, alternative: str) -> bool:
+        """Ghi nhận vị trí bắt đầu của một nhánh; False nếu nhánh không thuộc dạng nào quét được"""
+        digit_led = _DIGIT_LED.match(alternative)
+        letter_digit_led = _LETTER_DIGIT_LED.match(alternative)
+        if digit_led:
+            prefix, suffix = digit_led.groups()
+            # Đuôi bắt đầu bằng chữ số thì lập luận "chỉ phụ thuộc phần sau dãy số" không còn đúng
+            if suffix[0] in _META and not suffix.startswith(("\\s", "(?:")):
+                return False
+            self.digit_suffixes.append(suffix)
+            if prefix == "\\d{1,2}":
+                self.digit_tail_start = True
+            else:
+                self.digit_any_start = True
+            self.branches.append((None, False))
+        elif letter_digit_led:
+            char_class, low, high, digits = letter_digit_led.groups()
+            self.letter_digit.append((char_class, int(low), int(high), digits))
+            self.branches.append((None, False))
+        else:
+            literal = _leading_literal(alternative)
+            if not literal:
+                return False
+            self.branches.append((literal.lower(), literal == alternative))
+        return True
+
+    @property
+    def literals(self):
+        return [literal for literal, _ in self.branches if literal]
+
+    def literal_length(self, found: str) -> int:
+        """
+        Độ dài khớp tại vị trí mà trie báo literal dài nhất là `found`, nếu biết trước mà không cần chạy
+        pattern: nhánh đầu tiên (theo thứ tự thử của regex) có thể khớp tại đó chỉ gồm literal.
+        Nhánh literal không phải tiền tố của `found` chắc chắn không khớp (nếu không trie đã báo literal
+        dài hơn). Trả về 0 khi phải chạy pattern để biết.
+        """
+        if self.original_case or not self.pattern.flags & re.I or found[0].isdigit():
+            return 0
+        for literal, pure in self.branches:
+            if literal is None:
+                # Nhánh chữ cái + chữ số có thể khớp tại vị trí chữ cái
+                if self.letter_digit:
+                    return 0
+                continue
+            if found.startswith(literal):
+                return len(literal) if pure else 0
+        return 0
+
+
+class ScanResult:
+    """
+    Kết quả quét một text: vị trí khớp theo từng pattern và vị trí các từ khóa.
+    Span chỉ được tạo khi cần (spans/values) để text dài có nhiều kết quả không tốn thêm chi phí.
+    """
+    __slots__ = ("text", "text_lower", "keywords", "_rules", "_found", "_spans")
+
+    def __init__(self, text, text_lower, rules, found, keywords):
+        self.text = text
+        self.text_lower = text_lower
+        self.keywords = keywords  # từ khóa -> [vị trí]
+        self._rules = rules       # label -> _Rule
+        self._found = found       # chỉ số rule -> [(start, end)] theo thứ tự vị trí
+        self._spans = None
+
+    def _source(self, rule):
+        return self.text if rule.original_case else self.text_lower
+
+    def has(self, label) -> bool:
+        return bool(self._found[self._rules[label].index])
+
+    def values(self, label):
+        """Đoạn text (đã strip) của các lần khớp pattern `label`"""
+        rule = self._rules[label]
+        source = self._source(rule)
+        return [source[start:end].strip() for start, end in self._found[rule.index]]
+
+    @property
+    def spans(self):
+        """label -> [Span] theo thứ tự vị trí"""
+        if self._spans is None:
+            self._spans = {}
+            for label, rule in self._rules.items():
+                source = self._source(rule)
+                self._spans[label] = [
+                    Span(rule.kind, label, start, end, source[start:end].strip())
+                    for start, end in self._found[rule.index]
+                ]
+        return self._spans
+
+    def first_intent(self, labels):
+        """Intent đầu tiên (theo thứ tự `labels`) có ít nhất một lần khớp"""
+        for label in labels:
+            if self.has(label):
+                return label
+        return None
+
+    def all_spans(self):
+        """Mọi span, sắp theo vị trí"""
+        return sorted((span for spans in self.spans.values() for span in spans), key=lambda s: (s.start, s.end))
+
+
+class PatternScanner:
+    """
+    Quét một lần qua text (đã lowercase) cho nhiều pattern intent/entity và từ khóa.
+
+    Một regex trigger duy nhất báo mọi vị trí có thể bắt đầu khớp: literal ở đầu các pattern được gộp
+    thành một trie, dãy chữ số chỉ được báo khi theo sau là phần đuôi của một pattern số
+    (":", "h", "/", " vé"...) hoặc đứng sau 2-3 chữ cái (mã vé). Chỉ tại các vị trí đó pattern gốc
+    của từng rule mới được thử bằng `match` (hoặc không cần thử khi nhánh khớp chỉ là literal),
+    nên kết quả giống hệt `pattern.finditer(text)` của từng rule (không chồng lấn trong cùng một rule,
+    khớp trái nhất trước) mà không phải quét lại toàn bộ text cho mỗi pattern. Rule fallback (nhánh
+    không tách được) vẫn chạy finditer riêng nên thêm pattern mới không bao giờ làm hỏng scanner.
+    """
+    def __init__(self, intent_patterns: dict, entity_patterns: dict, keywords=(), original_case=()):
+        self.intent_labels = list(intent_patterns)
+        self.rules = []
+        for kind, patterns in (("intent", intent_patterns), ("entity", entity_patterns)):
+            for label, pattern in patterns.items():
+                self.rules.append(_Rule(len(self.rules), kind, label, pattern, label in original_case))
+        self._rules_by_label = {rule.label: rule for rule in self.rules}
+        self.keywords = tuple(keywords)
+
+        # Literal ngắn hơn là tiền tố của literal dài hơn thì cả hai cùng khớp tại một vị trí:
+        # trie báo literal dài nhất, nên mỗi literal ứng với mọi rule/từ khóa có literal là tiền tố của nó.
+        # Với mỗi literal tính sẵn (chỉ số rule, độ dài khớp nếu biết trước, pattern, phân biệt hoa thường)
+        literals = sorted({lit for rule in self.rules for lit in rule.literals} | set(self.keywords))
+        self._literal_actions = {
+            literal: (
+                tuple(
+                    (rule.index, rule.literal_length(literal), rule.pattern, rule.original_case)
+                    for rule in self.rules if any(literal.startswith(lit) for lit in rule.literals)
+                ),
+                tuple(kw for kw in self.keywords if literal.startswith(kw))
+            )
+            for literal in literals
+        }
+        # Phần chữ số của trigger: dãy chữ số được báo khi ngay sau dãy là đuôi của một pattern số hoặc
+        # ngay trước dãy là 2-3 chữ cái; mỗi rule có một group (lookahead tùy chọn) cho biết điều kiện
+        # của riêng nó có thỏa không, để chỉ chạy `match` cho các rule có thể khớp
+        group_count = 1  # group 1: literal của trie
+        letter_digit_flags, letter_digit_conditions, self._letter_digit_rules = [], [], []
+        for rule in self.rules:
+            for char_class, low, high, digits in rule.letter_digit:
+                condition = f"(?<={char_class}{{{low}}})(?:{digits})"
+                group_count += 1
+                self._letter_digit_rules.append((group_count, rule.index, low, high, rule.pattern, rule.original_case))
+                group_count += re.compile(condition).groups
+                letter_digit_flags.append(f"(?=({condition}))")
+                letter_digit_conditions.append(condition)
+        self._run_group = group_count = group_count + 1
+        suffix_flags, suffix_conditions, self._digit_rules = [], [], []
+        for rule in self.rules:
+            if rule.digit_suffixes:
+                condition = "|".join(f"(?:{suffix})" for suffix in rule.digit_suffixes)
+                group_count += 1
+                self._digit_rules.append((group_count, rule.index, rule.digit_any_start, rule.digit_tail_start,
+                                          rule.pattern, rule.original_case))
+                group_count += re.compile(condition).groups
+                suffix_flags.append(f"(?=({condition}))")
+                suffix_conditions.append(condition)
+
+        digit_conditions = [r"\d+(?!\d)(?:" + "|".join(suffix_conditions) + ")"] if suffix_conditions else []
+        digit_conditions += letter_digit_conditions
+        # Trie phân biệt hoa thường (engine so khớp literal nhanh hơn nhiều so với re.I) nhưng mỗi ký tự
+        # được mở rộng thành các dạng re.I coi là tương đương, nên không bỏ sót vị trí nào pattern gốc khớp.
+        # Phần chữ số vẫn dùng re.I như pattern gốc.
+        variants = _case_variants({char for literal in literals for char in literal})
+        alternatives = [f"({_trie_pattern(literals, variants) if literals else '(?!)'})"]
+        first_chars = {c for literal in literals for c in variants.get(literal[0], literal[0])}
+        if digit_conditions:
+            alternatives.append(
+                "(?i:(?<!\\d)(?=" + "|".join(digit_conditions) + ")"
+                + "".join(f"(?:{flag})?" for flag in letter_digit_flags)
+                + "(\\d+)(?!\\d)"
+                + "".join(f"(?:{flag})?" for flag in suffix_flags) + ")"
+            )
+        # Mọi trigger bắt đầu bằng ký tự đầu của một literal hoặc một chữ số. Đặt lớp ký tự đó ra ngoài
+        # (tiêu thụ đúng 1 ký tự, phần còn lại kiểm tra bằng lookahead trong lookbehind) để engine
+        # nhảy nhanh tới các vị trí ứng viên thay vì thử cả alternation ở mọi vị trí; vẫn không bỏ sót
+        # trigger chồng lấn vì mỗi lần khớp chỉ tiến 1 ký tự.
+        first_class = "".join(re.escape(c) for c in sorted(first_chars)) + ("\\d" if digit_conditions else "")
+        self._trigger = re.compile(f"[{first_class}](?<=(?={'|'.join(alternatives)}).)" if first_class else "(?!)")
+
+    def _fold_literal(self, found: str):
+        """Literal khớp qua ký tự tương đương (vd. 'ſ' cho 's'): tìm lại literal tương ứng"""
+        literal = next(lit for lit in self._literal_actions if re.fullmatch(re.escape(lit), found, re.I))
+        return self._literal_actions[literal]
+
+    def scan(self, text: str) -> ScanResult:
+        text_lower = text.lower()
+        # Lowercase đổi độ dài (vd. 'İ') thì vị trí trong text gốc và text thường lệch nhau:
+        # các rule phân biệt hoa thường khi đó được quét riêng trên text gốc ở cuối
+        aligned = len(text_lower) == len(text)
+        found = [[] for _ in self.rules]
+        next_start = [0] * len(self.rules)
+        keywords = {kw: [] for kw in self.keywords}
+        literal_actions = self._literal_actions
+
+        for trigger in self._trigger.finditer(text_lower):
+            position = trigger.start()
+            literal = trigger.group(1)
+            if literal is not None:
+                actions, literal_keywords = literal_actions.get(literal) or self._fold_literal(literal)
+                for index, length, pattern, original_case in actions:
+                    if position < next_start[index]:
+                        continue
+                    if length:
+                        end = position + length
+                    else:
+                        if original_case and not aligned:
+                            continue
+                        match = pattern.match(text if original_case else text_lower, position)
+                        if match is None:
+                            continue
+                        end = match.end()
+                    found[index].append((position, end))
+                    next_start[index] = end
+                for keyword in literal_keywords:
+                    if text_lower.startswith(keyword, position):
+                        keywords[keyword].append(position)
+                continue
+
+            # Dãy chữ số [position, run_end)
+            run_end = trigger.end(self._run_group)
+            for group, index, any_start, tail_start, pattern, original_case in self._digit_rules:
+                first = max(position, next_start[index])
+                if trigger.start(group) < 0 or first >= run_end or (original_case and not aligned):
+                    continue
+                source = text if original_case else text_lower
+                match = pattern.match(source, first) if any_start else None
+                if match is None and tail_start:
+                    tail = max(first, run_end - 2)
+                    if tail != first or not any_start:
+                        match = pattern.match(source, tail)
+                if match is not None:
+                    found[index].append(match.span())
+                    next_start[index] = match.end()
+            for group, index, low, high, pattern, original_case in self._letter_digit_rules:
+                if trigger.start(group) < 0 or (original_case and not aligned):
+                    continue
+                source = text if original_case else text_lower
+                for candidate in range(max(position - high, next_start[index], 0), position - low + 1):
+                    match = pattern.match(source, candidate)
+                    if match is not None:
+                        found[index].append(match.span())
+                        next_start[index] = match.end()
+                        break
+
+        for rule in self.rules:
+            if rule.fallback or (rule.original_case and not aligned):
+                source = text if rule.original_case else text_lower
+                found[rule.index] = [match.span() for match in rule.pattern.finditer(source)]
+        return ScanResult(text, text_lower, self._rules_by_label, found, keywords)
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import uuid
+
+from redis.exceptions import WatchError
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+from config.settings import Config
+from src.__modules.core import conversation_manager as memory
+
+class ClusterCoordinator:
+    """
+    Phối hợp các worker (process uvicorn hoặc container) chạy sau cùng một load balancer qua Redis:
+    - Mỗi worker có một channel pub/sub riêng; frame gửi cho session đang kết nối WebSocket ở worker
+      khác được publish vào channel của worker đó thay vì bị mất.
+    - Worker đang giữ WebSocket của session được ghi trong Redis (key có TTL, gia hạn theo heartbeat),
+      session kết nối lại ở worker khác thì kết nối cũ được yêu cầu đóng.
+    - Mỗi worker định kỳ ghi bản thống kê của mình vào Redis để /stats cộng gộp được cả cluster.
+    Chỉ hoạt động khi CLUSTER_MODE bật và có Redis; ngoài ra mọi thao tác đều là no-op.
+    """
+    KEY_PREFIX = "vexere:cluster:"
+    WORKERS_KEY = KEY_PREFIX + "workers"
+
+    def __init__(self, redis_client=None, worker_id: str = None, enabled: bool = None,
+                 session_ttl: int = None, stats_interval: float = None):
+        self._redis = redis_client
+        self._enabled = Config.CLUSTER_MODE if enabled is None else enabled
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.session_ttl = session_ttl or Config.CLUSTER_SESSION_TTL
+        self.stats_interval = stats_interval or Config.CLUSTER_STATS_INTERVAL
+        self._handlers = {}  # loại message -> coroutine function(payload)
+        self._tasks = []
+        self._pubsub = None
+
+        # Metrics
+        self.published = 0
+        self.received = 0
+        self.undelivered = 0
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else memory.async_redis_client
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and self.redis is not None
+
+    def channel(self, worker_id: str) -> str:
+        return f"{self.KEY_PREFIX}worker:{worker_id}"
+
+    def _owner_key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}session:{session_id}"
+
+    def _stats_key(self, worker_id: str) -> str:
+        return f"{self.KEY_PREFIX}stats:{worker_id}"
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def on(self, message_type: str, handler):
+        """Đăng ký coroutine xử lý message loại `message_type` gửi tới worker này"""
+        self._handlers[message_type] = handler
+
+    async def start(self, stats_provider):
+        """
+        Subscribe channel của worker và bắt đầu ghi thống kê định kỳ (gọi khi app khởi động).
+        Không kết nối được Redis thì tắt chế độ cluster và chạy như một worker đơn lẻ.
+        """
+        if not self.enabled or self._tasks:
+            return
+        try:
+            self._pubsub = self.redis.pubsub()
+            await self._pubsub.subscribe(self.channel(self.worker_id))
+        except Exception as e:
+            print(f"⚠️ Không tham gia được cluster, chạy như worker đơn lẻ: {e}")
+            self._enabled = False
+            self._pubsub = None
+            return
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._publish_stats_loop(stats_provider))
+        ]
+        print(f"🌐 Cluster mode: worker {self.worker_id}")
+
+    async def stop(self):
+        """Dừng nhận message và rút worker khỏi danh sách thống kê (gọi khi app tắt)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe()
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+            self._pubsub = None
+        if self.enabled:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.delete(self._stats_key(self.worker_id))
+                pipe.srem(self.WORKERS_KEY, self.worker_id)
+                await pipe.execute()
+            except Exception:
+                pass
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Lỗi nhận message cluster: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None:
+                continue
+            self.received += 1
+            try:
+                payload = json.loads(message["data"])
+                handler = self._handlers.get(payload.get("type"))
+                if handler is not None:
+                    await handler(payload)
+            except Exception as e:
+                print(f"⚠️ Lỗi xử lý message cluster: {e}")
+
+    async def publish(self, worker_id: str, payload: dict) -> bool:
+        """Gửi message cho một worker; False nếu không có worker nào đang nghe channel đó"""
+        receivers = await self.redis.publish(self.channel(worker_id), json.dumps(payload, ensure_ascii=False))
+        self.published += 1
+        if not receivers:
+            self.undelivered += 1
+        return bool(receivers)
+
+    async def claim_session(self, session_id: str):
+        """Ghi nhận worker này đang giữ WebSocket của session; đóng kết nối cũ nếu nó ở worker khác"""
+        previous = self._decode(
+            await self.redis.set(self._owner_key(session_id), self.worker_id, ex=self.session_ttl, get=True)
+        )
+        if previous and previous != self.worker_id:
+            await self.publish(previous, {"type": "close_session", "session_id": session_id})
+
+    async def refresh_session(self, session_id: str):
+        """Gia hạn quyền giữ session (gọi theo nhịp heartbeat của kết nối)"""
+        await self.redis.expire(self._owner_key(session_id), self.session_ttl)
+
+    async def release_session(self, session_id: str):
+        """
+        Bỏ quyền giữ session, trừ khi session đã chuyển sang worker khác. So sánh và xóa trong
+        một transaction WATCH/MULTI: nếu worker khác claim giữa GET và DELETE thì transaction bị hủy
+        và owner được đọc lại, nên không bao giờ xóa nhầm quyền giữ của worker khác.
+        """
+        key = self._owner_key(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    if self._decode(await pipe.get(key)) != self.worker_id:
+                        await pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.delete(key)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def deliver(self, session_id: str, message: dict) -> bool:
+        """Chuyển frame tới worker đang giữ WebSocket của session; False nếu session không kết nối ở đâu"""
+        owner = self._decode(await self.redis.get(self._owner_key(session_id)))
+        if not owner or owner == self.worker_id:
+            return False
+        return await self.publish(owner, {"type": "deliver", "session_id": session_id, "message": message})
+
+    async def publish_stats(self, snapshot: dict):
+        """Ghi thống kê của worker; bản ghi tự hết hạn nếu worker ngừng cập nhật"""
+        pipe = self.redis.pipeline()
+        pipe.set(self._stats_key(self.worker_id), json.dumps(snapshot, ensure_ascii=False),
+                 ex=max(1, int(self.stats_interval * 3)))
+        pipe.sadd(self.WORKERS_KEY, self.worker_id)
+        await pipe.execute()
+
+    async def _publish_stats_loop(self, stats_provider):
+        while True:
+            try:
+                await self.publish_stats(stats_provider())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Lỗi ghi thống kê cluster: {e}")
+            await asyncio.sleep(self.stats_interval)
+
+    async def worker_stats(self) -> dict:
+        """Thống kê mới nhất của các worker còn sống (worker_id -> snapshot)"""
+        worker_ids = sorted(self._decode(w) for w in await self.redis.smembers(self.WORKERS_KEY))
+        if not worker_ids:
+            return {}
+        values = await self.redis.mget([self._stats_key(w) for w in worker_ids])
+        result, stale = {}, []
+        for worker_id, raw in zip(worker_ids, values):
+            if raw is None:
+                stale.append(worker_id)
+            else:
+                result[worker_id] = json.loads(raw)
+        if stale:
+            await self.redis.srem(self.WORKERS_KEY, *stale)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "enabled": self.enabled,
+            "published": self.published,
+            "received": self.received,
+            "undelivered": self.undelivered
+        }
+
+
+def merge_counters(snapshots, counters: dict):
+    """
+    Cộng gộp các bộ đếm trong các bản thống kê cùng cấu trúc. `counters` liệt kê rõ những gì cộng được:
+    {khóa: True} cộng giá trị số, {khóa: {...}} gộp đệ quy dict con, khóa "*" áp dụng cho mọi khóa còn lại.
+    Khóa không có trong `counters` (thiết lập, gauge, giá trị trung bình) không được cộng.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in (snapshot or {}).items():
+            spec = counters.get(key, counters.get("*"))
+            if not spec:
+                continue
+            if isinstance(spec, dict):
+                if isinstance(value, dict):
+                    merged[key] = merge_counters([merged.get(key, {}), value], spec)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+# Coordinator dùng chung của process
+cluster = ClusterCoordinator()
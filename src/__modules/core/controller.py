@@ -1,5 +1,6 @@
 import sys
 import os
+import json
 
 # Add project root to path
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -7,13 +8,26 @@ sys.path.insert(0, project_root)
 
 # Controller for get and post requests
 from src.__modules.chatbot.L23 import main, Signal
-from src.__modules.chatbot.L1 import bot_response
+from src.__modules.chatbot.L1 import bot_response, abot_response, abot_response_stream
+from src.__modules.chatbot.nlp_extractor.nlp_engine import ConversationManager
+from config.settings import Config
+from src.__modules.core import conversation_manager as memory
 from src.__modules.core.conversation_manager import ChatMemory
-from src.__modules.nlp.threading import threaded_main
+from src.__modules.core.session_store import session_store
+from src.__modules.core.executor import run_blocking
+from src.__modules.core.metrics import metrics
+from src.__modules.core.tracing import tracer
+from src.__modules.nlp.router import route_message, aroute_message
 from src.database.schemas import db
 
 # Global ticket tracking để chia sẻ giữa sessions
 class GlobalTicketManager:
+    """
+    Vé vừa đặt của từng session (để các thao tác L3 như hủy/đổi giờ dùng lại mã vé).
+    Lưu trong Redis với TTL như trạng thái hội thoại nên mọi worker đều đọc được;
+    chỉ giữ trong process khi không có Redis.
+    """
+    KEY_PREFIX = "recent_ticket:"
     _instance = None
     
     def __new__(cls):
@@ -28,137 +42,291 @@ class GlobalTicketManager:
         self._initialized = True
         self.recent_tickets = {}  # session_id -> ticket_info
     
+    def _key(self, session_id):
+        return f"{self.KEY_PREFIX}{session_id}"
+
     def store_ticket(self, session_id, ticket_info):
         """Lưu thông tin vé cho session"""
-        self.recent_tickets[session_id] = ticket_info
+        if memory.redis_client:
+            memory.redis_client.set(self._key(session_id), json.dumps(ticket_info, ensure_ascii=False),
+                                    ex=Config.SESSION_STATE_TTL)
+        else:
+            self.recent_tickets[session_id] = ticket_info
     
     def get_ticket(self, session_id):
         """Lấy thông tin vé của session"""
+        if memory.redis_client:
+            raw = memory.redis_client.get(self._key(session_id))
+            return json.loads(raw) if raw else None
+        return self.recent_tickets.get(session_id)
+
+    async def astore_ticket(self, session_id, ticket_info):
+        """Phiên bản async của store_ticket (dùng trên event loop)"""
+        if memory.async_redis_client:
+            await memory.async_redis_client.set(self._key(session_id), json.dumps(ticket_info, ensure_ascii=False),
+                                                ex=Config.SESSION_STATE_TTL)
+        else:
+            self.recent_tickets[session_id] = ticket_info
+
+    async def aget_ticket(self, session_id):
+        """Phiên bản async của get_ticket"""
+        if memory.async_redis_client:
+            raw = await memory.async_redis_client.get(self._key(session_id))
+            return json.loads(raw) if raw else None
         return self.recent_tickets.get(session_id)
 
 global_ticket_manager = GlobalTicketManager()
 
 class ChatController:
+    FALLBACK_RESPONSE = "Xin lỗi, tôi không hiểu câu hỏi của bạn. Bạn có thể hỏi về chính sách vé xe hoặc đặt vé không?"
+    CANCEL_COMMANDS = ['hủy', 'cancel', 'dừng', 'stop', 'thoát flow', 'reset']
+
     def __init__(self, session_id):
         self.session_id = session_id
         self.session = ChatMemory(session_id)
         self.action = None
-        # Quản lý conversation cho L23
+        # Quyết định định tuyến gần nhất (route, confidence, source)
+        self.route_decision = None
+        # Mức xử lý của lượt gần nhất cho thống kê: L1 (chính sách), L2 (đặt vé), L3 (thao tác vé khác), fallback
+        self.last_level = None
+        # Quản lý conversation cho L23 (được khôi phục từ session_store ở đầu mỗi lượt)
         self.conversation_manager = None
+        self._has_stored_state = False
 
     def handle_user_message(self, user_message: str) -> str:
-        # Lưu tin nhắn của user
-        self.session.add_message("user", user_message)
+        # Khôi phục flow L23 đang dở của session (nếu có)
+        if self.conversation_manager is None:
+            self._restore_state(session_store.get(self.session_id))
         
         try:
-            # Kiểm tra lệnh hủy flow
-            if user_message.lower().strip() in ['hủy', 'cancel', 'dừng', 'stop', 'thoát flow', 'reset']:
-                if self.conversation_manager:
-                    self.conversation_manager = None
-                    response = "✅ Đã hủy giao dịch hiện tại. Bạn có thể bắt đầu lại hoặc hỏi tôi điều gì khác."
-                    self.session.add_message("bot", response)
-                    return response
-            
-            # Kiểm tra nếu đang trong conversation flow thì ưu tiên L23
-            if self.is_in_conversation_flow():
-                # Đang trong flow đặt vé, tiếp tục xử lý ở L23
-                
-                # Inject ticket info từ global manager nếu có
-                recent_ticket = global_ticket_manager.get_ticket(self.session_id)
-                if recent_ticket and 'dat_ve' not in self.conversation_manager.state.completed_actions:
-                    self.conversation_manager.state.completed_actions['dat_ve'] = recent_ticket
-                
-                signal = Signal(context=user_message)
-                
-                print(f"🔄 [Tiếp tục flow] Intent: {signal.intent}, Entities: {[e['entity'] + ':' + e['value'] for e in signal.entities]}")
-        
-                # Xử lý với conversation manager đã lưu trạng thái
-                result = self.conversation_manager.process_turn(user_message, signal.intent, signal.entities)
-                
-                # Kiểm tra nếu action đã hoàn thành thì reset conversation manager
-                if result['status'] == 'completed':
-                    print(f"   ✅ Hoàn thành: {result.get('executed_action')}")
-                    
-                    # Lưu thông tin vé nếu là đặt vé thành công  
-                    if result.get('executed_action') == 'dat_ve':
-                        ticket_info = self.conversation_manager.state.completed_actions.get('dat_ve')
-                        print(f"   🔍 [Tiếp tục] Ticket info: {ticket_info}")
-                        if ticket_info:
-                            global_ticket_manager.store_ticket(self.session_id, ticket_info)
-                            print(f"   💾 [Tiếp tục] Đã lưu mã vé {ticket_info['ticket_code']} cho session {self.session_id}")
-                    
-                    # Reset conversation manager sau khi hoàn thành action
-                    self.conversation_manager = None
-                elif result['status'] == 'failed':
-                    print("   ❌ Giao dịch thất bại")
-                    # Reset conversation manager khi thất bại
-                    self.conversation_manager = None
-                
-                response = result['message']
-                self.session.add_message("bot", response)
-                return response
-            
-            # Phân tích xem nên chuyển đến L1 hay L23
-            self.action = threaded_main(user_message)
-            
-            if self.action and self.action.strip():
-                if "L1" in self.action:
+            self.last_level = None
+            response = self._handle_in_flow(user_message)
+            if response is None:
+                # Phân tích xem nên chuyển đến L1 hay L23 (router cục bộ, LLM khi không chắc chắn)
+                self._set_route(route_message(user_message))
+                if self.action == "L1":
                     response = bot_response(user_message)
-                    self.session.add_message("bot", response)
-                    return response
-                elif "L23" in self.action:
-                    # Khởi tạo conversation manager nếu chưa có
-                    if not self.conversation_manager:
-                        from src.__modules.chatbot.nlp_extractor.nlp_engine import ConversationManager
-                        self.conversation_manager = ConversationManager()
-                        
-                        # Nếu có database từ conversation manager trước đó thì sử dụng lại
-                        # (Database đã là singleton nên sẽ tự động chia sẻ)
-                        
-                        # Inject ticket info từ global manager nếu có
-                        recent_ticket = global_ticket_manager.get_ticket(self.session_id)
-                        if recent_ticket:
-                            self.conversation_manager.state.completed_actions['dat_ve'] = recent_ticket
-                            print(f"   🔗 Đã inject mã vé: {recent_ticket['ticket_code']}")
-                    
-                    # Phân tích intent và entities
-                    signal = Signal(context=user_message)
-                    
-                    print(f"🔍 [Debug] Intent: {signal.intent}, Entities: {[e['entity'] + ':' + e['value'] for e in signal.entities]}")
-            
-                    # Xử lý với conversation manager đã lưu trạng thái
-                    result = self.conversation_manager.process_turn(user_message, signal.intent, signal.entities)
-                         # Kiểm tra nếu action đã hoàn thành thì reset conversation manager
-                if result['status'] == 'completed':
-                    print(f"   ✅ Hoàn thành: {result.get('executed_action')}")
-                    
-                    # Lưu thông tin vé nếu là đặt vé thành công
-                    if result.get('executed_action') == 'dat_ve':
-                        ticket_info = self.conversation_manager.state.completed_actions.get('dat_ve')
-                        print(f"   🔍 Ticket info: {ticket_info}")
-                        if ticket_info:
-                            global_ticket_manager.store_ticket(self.session_id, ticket_info)
-                            print(f"   💾 Đã lưu mã vé {ticket_info['ticket_code']} cho session {self.session_id}")
-                    
-                    # Reset conversation manager sau khi hoàn thành action
-                    self.conversation_manager = None
-                elif result['status'] == 'failed':
-                    print("   ❌ Giao dịch thất bại")
-                    # Reset conversation manager khi thất bại
-                    self.conversation_manager = None
-                    
-                    response = result['message']
-                    
-                    # Lưu tin nhắn của bot
-                    self.session.add_message("bot", response)
-                    return response
+                    self.last_level = "L1" if response is not None else "fallback"
+                else:
+                    response = self._run_booking_turn(user_message)
         except Exception as e:
             print(f"❌ Lỗi trong controller: {str(e)}")
+            # Fallback
+            response = self.FALLBACK_RESPONSE
+            self.last_level = "fallback"
+        
+        # Lưu trạng thái flow cho lượt sau
+        self._persist_state()
         
-        # Fallback
-        response = "Xin lỗi, tôi không hiểu câu hỏi của bạn. Bạn có thể hỏi về chính sách vé xe hoặc đặt vé không?"
-        self.session.add_message("bot", response)
+        # Lưu tin nhắn của user và bot trong một lần ghi
+        self.session.add_turn(user_message, response)
         return response
+
+    async def ahandle_user_message(self, user_message: str) -> str:
+        """
+        Phiên bản async của handle_user_message: Redis và Gemini dùng client async,
+        encode/Chroma chạy trong executor giới hạn nên không chặn event loop.
+        """
+        # Khôi phục flow L23 đang dở của session (nếu có)
+        if self.conversation_manager is None:
+            self._restore_state(await session_store.aget(self.session_id))
+        
+        try:
+            self.last_level = None
+            response = await self._ahandle_in_flow(user_message)
+            if response is None:
+                self._set_route(await aroute_message(user_message))
+                if self.action == "L1":
+                    response = await abot_response(user_message)
+                    self.last_level = "L1" if response is not None else "fallback"
+                else:
+                    response = await self._arun_booking_turn(user_message)
+        except Exception as e:
+            print(f"❌ Lỗi trong controller: {str(e)}")
+            # Fallback
+            response = self.FALLBACK_RESPONSE
+            self.last_level = "fallback"
+        
+        # Lưu trạng thái flow cho lượt sau
+        await self._apersist_state()
+        
+        # Lưu tin nhắn của user và bot trong một lần ghi
+        await self.session.aadd_turn(user_message, response)
+        return response
+
+    async def astream_user_message(self, user_message: str):
+        """
+        Phiên bản streaming của ahandle_user_message: trả về từng đoạn câu trả lời (L1 stream theo
+        token từ LLM, L23 và fallback là một đoạn). Lịch sử chat lưu câu trả lời đầy đủ sau đoạn cuối.
+        """
+        if self.conversation_manager is None:
+            self._restore_state(await session_store.aget(self.session_id))
+
+        chunks = []
+        try:
+            self.last_level = None
+            response = await self._ahandle_in_flow(user_message)
+            if response is None:
+                self._set_route(await aroute_message(user_message))
+                if self.action == "L1":
+                    async for chunk in abot_response_stream(user_message):
+                        chunks.append(chunk)
+                        yield chunk
+                    response = "".join(chunks) or None
+                    self.last_level = "L1" if response is not None else "fallback"
+                else:
+                    response = await self._arun_booking_turn(user_message)
+        except Exception as e:
+            print(f"❌ Lỗi trong controller: {str(e)}")
+            # Giữ phần đã gửi cho client nếu lỗi xảy ra giữa chừng
+            response = "".join(chunks) or None
+            self.last_level = "fallback"
+
+        if not chunks:
+            response = response or self.FALLBACK_RESPONSE
+            yield response
+
+        await self._apersist_state()
+        await self.session.aadd_turn(user_message, response)
+
+    def _restore_state(self, state):
+        """Dựng lại conversation manager từ trạng thái đã lưu của session"""
+        if state is not None:
+            self.conversation_manager = ConversationManager(state=state)
+            self._has_stored_state = True
+
+    def _persist_state(self):
+        """Lưu trạng thái nếu session còn conversation manager, xóa bản lưu nếu flow đã kết thúc"""
+        if self.conversation_manager is not None:
+            session_store.put(self.session_id, self.conversation_manager.state)
+            self._has_stored_state = True
+        elif self._has_stored_state:
+            session_store.delete(self.session_id)
+            self._has_stored_state = False
+
+    async def _apersist_state(self):
+        """Phiên bản async của _persist_state"""
+        if self.conversation_manager is not None:
+            await session_store.aput(self.session_id, self.conversation_manager.state)
+            self._has_stored_state = True
+        elif self._has_stored_state:
+            await session_store.adelete(self.session_id)
+            self._has_stored_state = False
+
+    def _set_route(self, decision):
+        self.route_decision = decision
+        self.action = decision['route']
+        tracer.annotate(route=self.action, confidence=decision['confidence'], route_source=decision['source'])
+        print(f"🧭 [Router] {self.action} (confidence={decision['confidence']}, source={decision['source']})")
+
+    def _cancel_flow(self, user_message: str):
+        """Câu trả lời nếu tin nhắn là lệnh hủy flow đang dở, None nếu không"""
+        if user_message.lower().strip() in self.CANCEL_COMMANDS and self.conversation_manager:
+            self.conversation_manager = None
+            return "✅ Đã hủy giao dịch hiện tại. Bạn có thể bắt đầu lại hoặc hỏi tôi điều gì khác."
+        return None
+
+    def _handle_in_flow(self, user_message: str):
+        """
+        Xử lý lệnh hủy flow và các lượt tiếp theo của flow đặt vé đang dở.
+        Trả về None nếu tin nhắn cần được định tuyến.
+        """
+        response = self._cancel_flow(user_message)
+        if response is not None:
+            return response
+
+        # Kiểm tra nếu đang trong conversation flow thì ưu tiên L23
+        if self.is_in_conversation_flow():
+            # Đang trong flow đặt vé, tiếp tục xử lý ở L23
+            return self._run_booking_turn(user_message, continuing=True)
+        
+        return None
+
+    async def _ahandle_in_flow(self, user_message: str):
+        """Phiên bản async của _handle_in_flow"""
+        response = self._cancel_flow(user_message)
+        if response is not None:
+            return response
+        if self.is_in_conversation_flow():
+            return await self._arun_booking_turn(user_message, continuing=True)
+        return None
+
+    @tracer.traced("l23")
+    def _run_booking_turn(self, user_message: str, continuing: bool = False) -> str:
+        """Xử lý một lượt L23 với conversation manager của session"""
+        recent_ticket = global_ticket_manager.get_ticket(self.session_id)
+        message, ticket_info = self._booking_turn(user_message, continuing, recent_ticket)
+        if ticket_info:
+            global_ticket_manager.store_ticket(self.session_id, ticket_info)
+            print(f"   💾 Đã lưu mã vé {ticket_info['ticket_code']} cho session {self.session_id}")
+        return message
+
+    @tracer.traced("l23")
+    async def _arun_booking_turn(self, user_message: str, continuing: bool = False) -> str:
+        """
+        Phiên bản async của _run_booking_turn: đọc/ghi vé gần nhất qua Redis async, phần xử lý chạy trong
+        executor giới hạn vì storage có thể chặn (SQLite chờ write lock của worker khác tới busy_timeout)
+        """
+        recent_ticket = await global_ticket_manager.aget_ticket(self.session_id)
+        message, ticket_info = await run_blocking(self._booking_turn, user_message, continuing, recent_ticket)
+        if ticket_info:
+            await global_ticket_manager.astore_ticket(self.session_id, ticket_info)
+            print(f"   💾 Đã lưu mã vé {ticket_info['ticket_code']} cho session {self.session_id}")
+        return message
+
+    def _booking_turn(self, user_message: str, continuing: bool, recent_ticket):
+        """
+        Phần xử lý của một lượt L23 (không gọi Redis): trả về (câu trả lời, thông tin vé cần lưu
+        nếu vừa đặt vé thành công)
+        """
+        stored_ticket = None
+        if continuing:
+            # Inject ticket info từ global manager nếu có
+            if recent_ticket and 'dat_ve' not in self.conversation_manager.state.completed_actions:
+                self.conversation_manager.state.completed_actions['dat_ve'] = recent_ticket
+        elif not self.conversation_manager:
+            # Khởi tạo conversation manager nếu chưa có
+            # (Database đã là singleton nên sẽ tự động chia sẻ)
+            self.conversation_manager = ConversationManager()
+            
+            # Inject ticket info từ global manager nếu có
+            if recent_ticket:
+                self.conversation_manager.state.completed_actions['dat_ve'] = recent_ticket
+                print(f"   🔗 Đã inject mã vé: {recent_ticket['ticket_code']}")
+        
+        # Phân tích intent và entities
+        with metrics.time("nlp_extract"):
+            signal = Signal(context=user_message)
+        
+        label = "🔄 [Tiếp tục flow]" if continuing else "🔍 [Debug]"
+        print(f"{label} Intent: {signal.intent}, Entities: {[e['entity'] + ':' + e['value'] for e in signal.entities]}")
+
+        # Xử lý với conversation manager đã lưu trạng thái
+        with metrics.time("process_turn"):
+            result = self.conversation_manager.process_turn(user_message, signal.intent, signal.entities)
+        intent = self.conversation_manager.state.current_intent or result.get('executed_action') or signal.intent
+        self.last_level = "L2" if intent == 'dat_ve' else "L3"
+        tracer.annotate(intent=intent, status=result['status'])
+        
+        # Kiểm tra nếu action đã hoàn thành thì reset conversation manager
+        if result['status'] == 'completed':
+            print(f"   ✅ Hoàn thành: {result.get('executed_action')}")
+            
+            # Lưu thông tin vé nếu là đặt vé thành công
+            if result.get('executed_action') == 'dat_ve':
+                ticket_info = self.conversation_manager.state.completed_actions.get('dat_ve')
+                print(f"   🔍 Ticket info: {ticket_info}")
+                if ticket_info:
+                    stored_ticket = ticket_info
+            
+            # Reset conversation manager sau khi hoàn thành action
+            self.conversation_manager = None
+        elif result['status'] == 'failed':
+            print("   ❌ Giao dịch thất bại")
+            # Reset conversation manager khi thất bại
+            self.conversation_manager = None
+        
+        return result['message'], stored_ticket
     
     def reset_conversation(self):
         """Reset conversation manager khi cần bắt đầu lại"""
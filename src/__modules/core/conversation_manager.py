@@ -1,5 +1,6 @@
 import json
 import redis
+import redis.asyncio as aioredis
 from datetime import datetime, timezone
 import sys
 import os
@@ -9,6 +10,7 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(o
 sys.path.insert(0, project_root)
 
 from config.settings import Config
+from src.__modules.core.metrics import metrics
 
 try:
     redis_client = redis.Redis.from_url(Config.REDIS_URL)
@@ -18,9 +20,13 @@ except redis.exceptions.ConnectionError as e:
     print(f"Could not connect to Redis: {e}")
     redis_client = None
 
+# Client async dùng chung cho luồng xử lý async (kết nối được mở khi dùng lần đầu)
+async_redis_client = aioredis.Redis.from_url(Config.REDIS_URL) if redis_client else None
+
 class RedisMemoryStore:
     """
     Lớp cấp thấp, tương tác trực tiếp với Redis để lưu/tải/xóa dữ liệu của một session.
+    Lưu toàn bộ lịch sử thành một blob JSON (chế độ "json"): mỗi lần ghi phải đọc-sửa-ghi cả lịch sử.
     """
     def __init__(self, session_id: str):
         if not redis_client:
@@ -34,14 +40,195 @@ class RedisMemoryStore:
             return json.loads(raw)
         return []
 
+    def load_recent(self, count: int) -> list:
+        """Tải `count` tin nhắn gần nhất."""
+        if count <= 0:
+            return []
+        return self.load()[-count:]
+
     def save(self, memory: list):
-        """Lưu lịch sử hội thoại vào Redis với TTL là 1 giờ."""
-        redis_client.set(self.session_id, json.dumps(memory, ensure_ascii=False), ex=3600)
+        """Lưu lịch sử hội thoại vào Redis với TTL."""
+        redis_client.set(self.session_id, json.dumps(memory, ensure_ascii=False), ex=Config.CHAT_MEMORY_TTL)
+
+    def append(self, entries: list):
+        """Thêm các tin nhắn vào cuối lịch sử."""
+        history = self.load()
+        history.extend(entries)
+        self.save(history)
 
     def clear(self):
         """Xóa lịch sử hội thoại của session."""
         redis_client.delete(self.session_id)
 
+    async def aload(self) -> list:
+        """Phiên bản async của load."""
+        raw = await async_redis_client.get(self.session_id)
+        if raw:
+            return json.loads(raw)
+        return []
+
+    async def aload_recent(self, count: int) -> list:
+        """Phiên bản async của load_recent."""
+        if count <= 0:
+            return []
+        return (await self.aload())[-count:]
+
+    async def asave(self, memory: list):
+        """Phiên bản async của save."""
+        await async_redis_client.set(self.session_id, json.dumps(memory, ensure_ascii=False), ex=Config.CHAT_MEMORY_TTL)
+
+    async def aappend(self, entries: list):
+        """Phiên bản async của append."""
+        history = await self.aload()
+        history.extend(entries)
+        await self.asave(history)
+
+    async def aclear(self):
+        """Phiên bản async của clear."""
+        await async_redis_client.delete(self.session_id)
+
+
+class RedisListMemoryStore:
+    """
+    Lưu lịch sử dưới dạng Redis list (chế độ "list"): mỗi tin nhắn là một phần tử JSON.
+    Mỗi lần ghi là RPUSH + LTRIM + EXPIRE trong một pipeline (một round-trip, O(1) theo độ dài lịch sử),
+    Redis tự cắt lịch sử về `max_messages` và TTL được gia hạn sau mỗi lần ghi.
+
+    Nâng cấp từ chế độ "json": khi list của session còn trống (lần đọc đầu, hoặc lần ghi đầu tạo list),
+    blob JSON cũ dưới key `session_id` được lấy-và-xóa trong một transaction rồi chèn vào đầu list,
+    nên session đang dở không mất ngữ cảnh và chỉ một request nhập blob đó.
+    """
+    KEY_PREFIX = "chat_history:"
+
+    def __init__(self, session_id: str, max_messages: int = None, ttl: int = None):
+        if not redis_client:
+            raise ConnectionError("Redis client is not available.")
+        self.session_id = session_id
+        self.key = f"{self.KEY_PREFIX}{session_id}"
+        self.max_messages = max_messages or Config.CHAT_MEMORY_MAX_MESSAGES
+        self.ttl = ttl or Config.CHAT_MEMORY_TTL
+
+    @staticmethod
+    def _decode(raw_entries: list) -> list:
+        return [json.loads(raw) for raw in raw_entries]
+
+    def _encode(self, entries: list) -> list:
+        return [json.dumps(entry, ensure_ascii=False) for entry in entries]
+
+    @staticmethod
+    def _legacy_entries(raw) -> list:
+        """Các tin nhắn trong blob JSON của chế độ "json" (rỗng nếu không có hoặc không hợp lệ)"""
+        if not raw:
+            return []
+        try:
+            entries = json.loads(raw)
+        except ValueError:
+            return []
+        return entries if isinstance(entries, list) else []
+
+    def _prepend_pipeline(self, pipe, entries: list):
+        pipe.lpush(self.key, *reversed(self._encode(entries)))
+        pipe.ltrim(self.key, -self.max_messages, -1)
+        pipe.expire(self.key, self.ttl)
+
+    def _import_legacy(self) -> bool:
+        """Chuyển blob JSON cũ (nếu có) vào đầu list; True nếu đã nhập"""
+        pipe = redis_client.pipeline()
+        pipe.get(self.session_id)
+        pipe.delete(self.session_id)
+        entries = self._legacy_entries(pipe.execute()[0])
+        if not entries:
+            return False
+        pipe = redis_client.pipeline()
+        self._prepend_pipeline(pipe, entries)
+        pipe.execute()
+        return True
+
+    def load(self) -> list:
+        """Tải toàn bộ lịch sử hội thoại."""
+        raw_entries = redis_client.lrange(self.key, 0, -1)
+        if not raw_entries and self._import_legacy():
+            raw_entries = redis_client.lrange(self.key, 0, -1)
+        return self._decode(raw_entries)
+
+    def load_recent(self, count: int) -> list:
+        """Chỉ tải `count` tin nhắn gần nhất từ Redis."""
+        if count <= 0:
+            return []
+        raw_entries = redis_client.lrange(self.key, -count, -1)
+        if not raw_entries and self._import_legacy():
+            raw_entries = redis_client.lrange(self.key, -count, -1)
+        return self._decode(raw_entries)
+
+    def append(self, entries: list):
+        """Thêm các tin nhắn vào cuối lịch sử trong một round-trip."""
+        if not entries:
+            return
+        pipe = redis_client.pipeline()
+        pipe.rpush(self.key, *self._encode(entries))
+        pipe.ltrim(self.key, -self.max_messages, -1)
+        pipe.expire(self.key, self.ttl)
+        length = pipe.execute()[0]
+        if length == len(entries):
+            # List vừa được tạo: nhập lịch sử cũ (nếu có) vào trước các tin nhắn mới
+            self._import_legacy()
+
+    def clear(self):
+        """Xóa lịch sử hội thoại của session (kể cả blob JSON cũ chưa được nhập)."""
+        redis_client.delete(self.key, self.session_id)
+
+    async def _aimport_legacy(self) -> bool:
+        """Phiên bản async của _import_legacy."""
+        pipe = async_redis_client.pipeline()
+        pipe.get(self.session_id)
+        pipe.delete(self.session_id)
+        entries = self._legacy_entries((await pipe.execute())[0])
+        if not entries:
+            return False
+        pipe = async_redis_client.pipeline()
+        self._prepend_pipeline(pipe, entries)
+        await pipe.execute()
+        return True
+
+    async def aload(self) -> list:
+        """Phiên bản async của load."""
+        raw_entries = await async_redis_client.lrange(self.key, 0, -1)
+        if not raw_entries and await self._aimport_legacy():
+            raw_entries = await async_redis_client.lrange(self.key, 0, -1)
+        return self._decode(raw_entries)
+
+    async def aload_recent(self, count: int) -> list:
+        """Phiên bản async của load_recent."""
+        if count <= 0:
+            return []
+        raw_entries = await async_redis_client.lrange(self.key, -count, -1)
+        if not raw_entries and await self._aimport_legacy():
+            raw_entries = await async_redis_client.lrange(self.key, -count, -1)
+        return self._decode(raw_entries)
+
+    async def aappend(self, entries: list):
+        """Phiên bản async của append."""
+        if not entries:
+            return
+        pipe = async_redis_client.pipeline()
+        pipe.rpush(self.key, *self._encode(entries))
+        pipe.ltrim(self.key, -self.max_messages, -1)
+        pipe.expire(self.key, self.ttl)
+        length = (await pipe.execute())[0]
+        if length == len(entries):
+            await self._aimport_legacy()
+
+    async def aclear(self):
+        """Phiên bản async của clear."""
+        await async_redis_client.delete(self.key, self.session_id)
+
+
+def create_memory_store(session_id: str):
+    """Tạo memory store theo CHAT_MEMORY_MODE"""
+    if Config.CHAT_MEMORY_MODE == "json":
+        return RedisMemoryStore(session_id)
+    return RedisListMemoryStore(session_id)
+
 
 class ChatMemory:
     """
@@ -50,40 +237,83 @@ class ChatMemory:
     """
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.redis_store = RedisMemoryStore(session_id)
-    
-    def add_message(self, role: str, message: str):
-        """Thêm một tin nhắn (từ user hoặc bot) vào lịch sử."""
-        history = self.redis_store.load()
-        history.append({
+        self.redis_store = create_memory_store(session_id)
+
+    @staticmethod
+    def _make_entry(role: str, message: str) -> dict:
+        return {
             "role": role,
             "message": message,
             # Sử dụng datetime thay cho pandas để nhẹ hơn
             "timestamp": datetime.now(timezone.utc).isoformat()
-        })
-        self.redis_store.save(history)
+        }
+
+    @staticmethod
+    def _format_history(history: list) -> str:
+        # Định dạng lại thành một chuỗi dễ đọc
+        formatted_lines = []
+        for m in history:
+            # Xác định người nói
+            speaker = "Người dùng" if m['role'] == 'user' else "Bot"
+            formatted_lines.append(f"{speaker}: {m['message']}")
+            
+        return "\n".join(formatted_lines)
+
+    @metrics.timed("redis_save")
+    def add_message(self, role: str, message: str):
+        """Thêm một tin nhắn (từ user hoặc bot) vào lịch sử."""
+        self.redis_store.append([self._make_entry(role, message)])
+
+    @metrics.timed("redis_save")
+    def add_turn(self, user_message: str, bot_message: str):
+        """Lưu cả tin nhắn của user và bot của một lượt trong một lần ghi."""
+        self.redis_store.append([
+            self._make_entry("user", user_message),
+            self._make_entry("bot", bot_message)
+        ])
     
+    @metrics.timed("redis_load")
     def get_history(self) -> list:
         """Lấy toàn bộ lịch sử hội thoại."""
         return self.redis_store.load()
 
+    @metrics.timed("redis_load")
     def format_history_for_context(self, max_messages: int = 10) -> str:
         """
         Định dạng một phần lịch sử gần đây để làm ngữ cảnh cho các mô hình AI.
+        Chỉ tải `max_messages` tin nhắn cuối cùng.
         """
-        history = self.redis_store.load()
-        # Lấy `max_messages` tin nhắn cuối cùng
-        recent_history = history[-max_messages:]
-        
-        # Định dạng lại thành một chuỗi dễ đọc
-        formatted_lines = []
-        for m in recent_history:
-            # Xác định người nói
-            speaker = "Người dùng" if m['role'] == 'user' else "Bot"
-            formatted_lines.append(f"{speaker}: {m['message']}")
-            
-        return "\n".join(formatted_lines)
+        return self._format_history(self.redis_store.load_recent(max_messages))
 
+    @metrics.timed("redis_save")
     def clear_history(self):
         """Xóa trắng lịch sử của session."""
-        self.redis_store.clear()
\ No newline at end of file
+        self.redis_store.clear()
+
+    @metrics.timed("redis_save")
+    async def aadd_message(self, role: str, message: str):
+        """Phiên bản async của add_message."""
+        await self.redis_store.aappend([self._make_entry(role, message)])
+
+    @metrics.timed("redis_save")
+    async def aadd_turn(self, user_message: str, bot_message: str):
+        """Phiên bản async của add_turn."""
+        await self.redis_store.aappend([
+            self._make_entry("user", user_message),
+            self._make_entry("bot", bot_message)
+        ])
+
+    @metrics.timed("redis_load")
+    async def aget_history(self) -> list:
+        """Phiên bản async của get_history."""
+        return await self.redis_store.aload()
+
+    @metrics.timed("redis_load")
+    async def aformat_history_for_context(self, max_messages: int = 10) -> str:
+        """Phiên bản async của format_history_for_context."""
+        return self._format_history(await self.redis_store.aload_recent(max_messages))
+
+    @metrics.timed("redis_save")
+    async def aclear_history(self):
+        """Phiên bản async của clear_history."""
+        await self.redis_store.aclear()
@@ -0,0 +1,26 @@
+import asyncio
+import contextvars
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+from config.settings import Config
+
+# Executor giới hạn số thread cho các tác vụ blocking (encode embedding, truy vấn Chroma)
+# để event loop không bị chặn và CPU không bị quá tải khi có nhiều request đồng thời
+blocking_executor = ThreadPoolExecutor(
+    max_workers=Config.BLOCKING_WORKERS,
+    thread_name_prefix="vexere-blocking"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Chạy một hàm blocking trong executor giới hạn và chờ kết quả mà không chặn event loop."""
+    loop = asyncio.get_running_loop()
+    # Copy context để span của trace hiện tại đi theo sang thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_executor, partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+class LLMProvider:
+    """
+    Giao diện chung cho các backend LLM.
+    Lớp con chỉ cần cài đặt _generate (và _agenerate nếu có client async); thời gian chờ model
+    được đo tại đây để tách độ trễ của model khỏi overhead của pipeline.
+    """
+    name = "base"
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+
+    def _record(self, latency: float, error: bool = False):
+        with self._stats_lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.total_latency += latency
+
+    def _generate(self, prompt: str, model: str) -> str:
+        raise NotImplementedError
+
+    async def _agenerate(self, prompt: str, model: str) -> str:
+        # Mặc định chạy bản sync trong thread để không chặn event loop
+        return await asyncio.to_thread(self._generate, prompt, model)
+
+    def generate(self, prompt: str, model: str = None) -> str:
+        """Sinh câu trả lời cho prompt"""
+        start = time.perf_counter()
+        error = True
+        try:
+            text = self._generate(prompt, model or self.model)
+            error = False
+            return text
+        finally:
+            self._record(time.perf_counter() - start, error)
+
+    async def agenerate(self, prompt: str, model: str = None) -> str:
+        """Phiên bản async của generate"""
+        start = time.perf_counter()
+        error = True
+        try:
+            text = await self._agenerate(prompt, model or self.model)
+            error = False
+            return text
+        finally:
+            self._record(time.perf_counter() - start, error)
+
+    def _stream(self, prompt: str, model: str):
+        # Mặc định trả về cả câu trong một đoạn
+        yield self._generate(prompt, model)
+
+    async def _astream(self, prompt: str, model: str):
+        yield await self._agenerate(prompt, model)
+
+    def stream(self, prompt: str, model: str = None):
+        """Sinh câu trả lời theo từng đoạn (token) ngay khi model trả về"""
+        start = time.perf_counter()
+        error = True
+        try:
+            for chunk in self._stream(prompt, model or self.model):
+                if chunk:
+                    yield chunk
+            error = False
+        finally:
+            self._record(time.perf_counter() - start, error)
+
+    async def astream(self, prompt: str, model: str = None):
+        """Phiên bản async của stream"""
+        start = time.perf_counter()
+        error = True
+        try:
+            async for chunk in self._astream(prompt, model or self.model):
+                if chunk:
+                    yield chunk
+            error = False
+        finally:
+            self._record(time.perf_counter() - start, error)
+
+    def stats(self) -> dict:
+        """Số lần gọi, số lỗi và thời gian chờ model"""
+        with self._stats_lock:
+            return {
+                "provider": self.name,
+                "model": self.model,
+                "calls": self.calls,
+                "errors": self.errors,
+                "total_latency_s": round(self.total_latency, 3),
+                "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0
+            }
+
+
+class GeminiProvider(LLMProvider):
+    """Gọi Gemini qua google-genai Client"""
+    name = "gemini"
+
+    def __init__(self, client, model: str = DEFAULT_MODEL):
+        super().__init__(model)
+        self.client = client
+
+    def _generate(self, prompt: str, model: str) -> str:
+        return self.client.models.generate_content(model=model, contents=prompt).text
+
+    async def _agenerate(self, prompt: str, model: str) -> str:
+        response = await self.client.aio.models.generate_content(model=model, contents=prompt)
+        return response.text
+
+    def _stream(self, prompt: str, model: str):
+        for chunk in self.client.models.generate_content_stream(model=model, contents=prompt):
+            yield chunk.text
+
+    async def _astream(self, prompt: str, model: str):
+        async for chunk in await self.client.aio.models.generate_content_stream(model=model, contents=prompt):
+            yield chunk.text
+
+
+# Kịch bản mặc định của FakeLLMProvider: router nhận "L1"/"L23" theo từ khóa, còn lại là câu trả lời mẫu
+DEFAULT_FAKE_SCRIPT = [
+    {"match": r'Câu hỏi:[^\n]*(đặt|hủy|huỷ|đổi|vé|hóa đơn|khiếu nại)[^\n]*\n\s*Kết quả trả về: "L1" hoặc "L23"',
+     "response": "L23"},
+    {"match": r'Kết quả trả về: "L1" hoặc "L23"', "response": "L1"},
+]
+DEFAULT_FAKE_RESPONSE = "Theo chính sách của Vexere, bạn vui lòng liên hệ tổng đài để được hỗ trợ chi tiết."
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    LLM giả, không cần mạng: trả lời theo kịch bản sau một độ trễ cấu hình được.
+    Kịch bản là danh sách luật {"match": regex, "response": str hoặc callable(prompt)}; luật đầu tiên
+    khớp với prompt được dùng, không khớp thì trả về default_response. Độ trễ = latency_ms ± jitter_ms
+    (jitter lấy từ Random(seed) nên lặp lại được giữa các lần chạy). Khi stream, độ trễ đó là thời gian
+    tới token đầu tiên, sau đó mỗi từ được trả về cách nhau token_ms.
+    """
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, script=None,
+                 default_response: str = DEFAULT_FAKE_RESPONSE, seed: int = 0, model: str = DEFAULT_MODEL,
+                 token_ms: float = 0.0):
+        super().__init__(model)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.default_response = default_response
+        self.rules = [
+            (re.compile(rule["match"], re.S), rule["response"])
+            for rule in (DEFAULT_FAKE_SCRIPT if script is None else script)
+        ]
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """Nạp kịch bản từ file JSON: danh sách {"match": ..., "response": ...}"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(script=json.load(f), **kwargs)
+
+    def _delay(self) -> float:
+        with self._rng_lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def respond(self, prompt: str) -> str:
+        """Câu trả lời theo kịch bản (không có độ trễ)"""
+        for pattern, response in self.rules:
+            if pattern.search(prompt):
+                return response(prompt) if callable(response) else response
+        return self.default_response
+
+    def _generate(self, prompt: str, model: str) -> str:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self.respond(prompt)
+
+    async def _agenerate(self, prompt: str, model: str) -> str:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self.respond(prompt)
+
+    @staticmethod
+    def _tokens(text: str):
+        # Tách theo từ, giữ khoảng trắng ở đầu mỗi token để ghép lại đúng câu gốc
+        return re.findall(r"\s*\S+", text) or [text]
+
+    def _stream(self, prompt: str, model: str):
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        for i, token in enumerate(self._tokens(self.respond(prompt))):
+            if i and self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            yield token
+
+    async def _astream(self, prompt: str, model: str):
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        for i, token in enumerate(self._tokens(self.respond(prompt))):
+            if i and self.token_ms:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield token
@@ -0,0 +1,145 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+from src.__modules.core.tracing import tracer
+
+# Biên các bucket (giây), từ 0.5ms đến 30s: đủ cho cả tra FAQ lẫn gọi LLM
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def format_labels(labels: dict = None) -> str:
+    """Nhãn Prometheus dạng `k="v",` (có dấu phẩy cuối) để đặt trước các nhãn riêng của series"""
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{key}="{value}",')
+    return "".join(parts)
+
+class StageHistogram:
+    """
+    Histogram độ trễ của một stage.
+    Mỗi lần ghi chỉ là một bisect và vài phép cộng dưới lock riêng của stage;
+    số đếm được cộng dồn theo chuẩn Prometheus khi render.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self):
+        """(số đếm cộng dồn theo bucket, tổng thời gian, số lần)"""
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class MetricsRegistry:
+    """
+    Tập histogram theo stage của pipeline, xuất ra định dạng text của Prometheus.
+    Mỗi stage được đo cũng là một span trong trace hiện tại (nếu có).
+    """
+    METRIC_NAME = "vexere_stage_duration_seconds"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> StageHistogram:
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, StageHistogram(self.buckets))
+        return histogram
+
+    def observe(self, stage: str, seconds: float):
+        """Ghi một lần đo của stage"""
+        self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Đo thời gian của khối with (kể cả khi có exception)"""
+        start = time.perf_counter()
+        try:
+            with tracer.span(stage):
+                yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str):
+        """Decorator đo thời gian của hàm sync hoặc async"""
+        def decorator(func):
+            histogram = self.histogram(stage)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        with tracer.span(stage):
+                            return await func(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with tracer.span(stage):
+                        return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def summary(self) -> dict:
+        """Số lần và thời gian trung bình (ms) của từng stage, dùng cho /stats"""
+        result = {}
+        for stage, histogram in sorted(self._stages.items()):
+            _, total, count = histogram.snapshot()
+            result[stage] = {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 3) if count else 0.0
+            }
+        return result
+
+    def render(self, labels: dict = None) -> str:
+        """Các histogram theo định dạng text exposition của Prometheus (`labels` gắn thêm vào mọi series)"""
+        extra = format_labels(labels)
+        lines = [
+            f"# HELP {self.METRIC_NAME} Thời gian xử lý của từng stage trong pipeline chat",
+            f"# TYPE {self.METRIC_NAME} histogram",
+        ]
+        for stage, histogram in sorted(self._stages.items()):
+            cumulative, total, count = histogram.snapshot()
+            series = f'{extra}stage="{stage}"'
+            for bound, value in zip(self.buckets, cumulative):
+                lines.append(f'{self.METRIC_NAME}_bucket{{{series},le="{bound}"}} {value}')
+            lines.append(f'{self.METRIC_NAME}_bucket{{{series},le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{self.METRIC_NAME}_sum{{{series}}} {total}')
+            lines.append(f'{self.METRIC_NAME}_count{{{series}}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# Registry dùng chung của process
+metrics = MetricsRegistry()
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class ProfilerBusyError(RuntimeError):
+    """Đang có một phiên profile khác chạy trong worker"""
+
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu cho process đang chạy: một thread nền đọc stack của mọi thread
+    (sys._current_frames) sau mỗi `interval` giây và đếm các stack giống nhau.
+    Kết quả ở định dạng "collapsed stacks" (frame;frame;frame số_mẫu) mà flamegraph.pl,
+    speedscope hay inferno đọc được. Chỉ chạy khi được gọi nên không tốn gì lúc bình thường.
+    """
+    MAX_DEPTH = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        filename = code.co_filename
+        # Rút gọn đường dẫn trong project để stack dễ đọc
+        if filename.startswith(os.getcwd()):
+            filename = os.path.relpath(filename)
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.MAX_DEPTH:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def profile(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> dict:
+        """
+        Lấy mẫu trong `seconds` giây. Mặc định bỏ qua các thread đang chờ (stack kết thúc ở
+        lock/queue/selector) để chỉ giữ lại các đường code thực sự đang chạy.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Đang có phiên profile khác")
+        try:
+            names = {}
+            stacks = Counter()
+            samples = 0
+            own_id = threading.get_ident()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    if not include_idle and self._is_idle(frame):
+                        continue
+                    stack = self._collapse(frame)
+                    stacks[f"{names.get(thread_id, thread_id)};{stack}"] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            self._lock.release()
+
+        return {
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        }
+
+    @staticmethod
+    def _is_idle(frame):
+        code = frame.f_code
+        return code.co_name in ("wait", "select", "poll", "get", "acquire") and (
+            "threading" in code.co_filename or "selectors" in code.co_filename
+            or "queue" in code.co_filename or "concurrent" in code.co_filename
+        )
+
+
+# Profiler dùng chung của process
+profiler = SamplingProfiler()
@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+import sys
+import os
+from collections import OrderedDict
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+from config.settings import Config
+from src.__modules.core import conversation_manager as memory
+from src.__modules.core.metrics import metrics
+from src.__modules.chatbot.nlp_extractor.nlp_engine import ConversationState
+
+class SessionStateStore:
+    """
+    Lưu ConversationState của từng session giữa các request.
+    Tầng 1: LRU giới hạn trong process giữ bản serialize (không phải đọc Redis mỗi tin nhắn); mỗi lần get
+    dựng một ConversationState mới nên các request đồng thời của cùng session không dùng chung object.
+    Tầng 2: cùng bản serialize gọn đó trong Redis với TTL, dùng khi cache miss hoặc sau khi restart.
+    Cả hai tầng đều hết hạn sau `ttl` giây kể từ lần ghi cuối.
+    """
+    KEY_PREFIX = "session_state:"
+
+    def __init__(self, max_entries: int = None, ttl: int = None):
+        self.max_entries = max_entries if max_entries is not None else Config.SESSION_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else Config.SESSION_STATE_TTL
+        self._cache = OrderedDict()  # session_id -> (expires_at, JSON của state.to_dict())
+        self._lock = threading.Lock()
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    def _get_cached(self, session_id: str):
+        with self._lock:
+            item = self._cache.get(session_id)
+            if item is None:
+                return None
+            expires_at, raw = item
+            if expires_at < time.monotonic():
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+        return self._deserialize(raw)
+
+    def _put_cached(self, session_id: str, raw: str):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._cache[session_id] = (time.monotonic() + self.ttl, raw)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _drop_cached(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def _serialize(self, state: ConversationState) -> str:
+        return json.dumps(state.to_dict(), ensure_ascii=False, separators=(',', ':'))
+
+    def _deserialize(self, raw):
+        return ConversationState.from_dict(json.loads(raw))
+
+    def get(self, session_id: str):
+        """Lấy trạng thái của session, None nếu không có"""
+        state = self._get_cached(session_id)
+        if state is not None or not memory.redis_client:
+            return state
+        with metrics.time("session_load"):
+            raw = memory.redis_client.get(self._key(session_id))
+        if not raw:
+            return None
+        raw = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        self._put_cached(session_id, raw)
+        return self._deserialize(raw)
+
+    def put(self, session_id: str, state: ConversationState):
+        """Lưu trạng thái và gia hạn TTL"""
+        raw = self._serialize(state)
+        self._put_cached(session_id, raw)
+        if memory.redis_client:
+            with metrics.time("session_save"):
+                memory.redis_client.set(self._key(session_id), raw, ex=self.ttl)
+
+    def delete(self, session_id: str):
+        """Xóa trạng thái của session"""
+        self._drop_cached(session_id)
+        if memory.redis_client:
+            memory.redis_client.delete(self._key(session_id))
+
+    async def aget(self, session_id: str):
+        """Phiên bản async của get"""
+        state = self._get_cached(session_id)
+        if state is not None or not memory.async_redis_client:
+            return state
+        with metrics.time("session_load"):
+            raw = await memory.async_redis_client.get(self._key(session_id))
+        if not raw:
+            return None
+        raw = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        self._put_cached(session_id, raw)
+        return self._deserialize(raw)
+
+    async def aput(self, session_id: str, state: ConversationState):
+        """Phiên bản async của put"""
+        raw = self._serialize(state)
+        self._put_cached(session_id, raw)
+        if memory.async_redis_client:
+            with metrics.time("session_save"):
+                await memory.async_redis_client.set(self._key(session_id), raw, ex=self.ttl)
+
+    async def adelete(self, session_id: str):
+        """Phiên bản async của delete"""
+        self._drop_cached(session_id)
+        if memory.async_redis_client:
+            await memory.async_redis_client.delete(self._key(session_id))
+
+# Store dùng chung cho toàn bộ process
+session_store = SessionStateStore()
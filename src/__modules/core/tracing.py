@@ -0,0 +1,144 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class Span:
+    """Một đoạn thời gian có tên trong trace, kèm span cha và các thuộc tính"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name, trace_id, parent_id=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.attributes = {}
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 3),
+            "attributes": self.attributes
+        }
+
+
+class Tracer:
+    """
+    Tracing nhẹ trong process: span hiện tại nằm trong contextvar nên tự đi theo
+    các lời gọi lồng nhau, qua await và qua run_blocking (context được copy sang thread).
+    Ngoài một trace (không có span gốc) span() gần như không tốn gì và không ghi lại gì.
+    Các trace đã xong được giữ trong một buffer vòng để tra cứu theo trace id.
+    """
+    def __init__(self, max_traces: int = 1000):
+        self.max_traces = max_traces
+        self._current = contextvars.ContextVar("vexere_current_span", default=None)
+        self._lock = threading.Lock()
+        self._active = {}               # trace_id -> danh sách span của trace đang chạy
+        self._finished = OrderedDict()  # trace_id -> danh sách span (mới nhất ở cuối)
+
+    def _reset(self, token):
+        try:
+            self._current.reset(token)
+        except ValueError:
+            # Generator (stream) bị đóng ở context khác: context cũ không còn dùng nữa
+            pass
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex
+
+    def current_trace_id(self):
+        span = self._current.get()
+        return span.trace_id if span else None
+
+    @contextmanager
+    def trace(self, name: str, trace_id: str = None, **attributes):
+        """Mở span gốc của một trace mới; trace được lưu vào buffer khi khối with kết thúc"""
+        span = Span(name, trace_id or self.new_trace_id())
+        span.attributes.update(attributes)
+        with self._lock:
+            self._active[span.trace_id] = [span]
+        token = self._current.set(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._reset(token)
+            with self._lock:
+                spans = self._active.pop(span.trace_id, [span])
+                self._finished[span.trace_id] = spans
+                while len(self._finished) > self.max_traces:
+                    self._finished.popitem(last=False)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Mở span con của span hiện tại (không làm gì nếu đang ngoài trace)"""
+        parent = self._current.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(name, parent.trace_id, parent.span_id)
+        span.attributes.update(attributes)
+        with self._lock:
+            spans = self._active.get(parent.trace_id)
+            if spans is not None:
+                spans.append(span)
+        token = self._current.set(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._reset(token)
+
+    def traced(self, name: str):
+        """Decorator mở span quanh hàm sync hoặc async"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def annotate(self, **attributes):
+        """Gắn thuộc tính vào span hiện tại"""
+        span = self._current.get()
+        if span is not None:
+            span.attributes.update(attributes)
+
+    def get_trace(self, trace_id: str):
+        """Các span của một trace (đã xong hoặc đang chạy), None nếu không còn trong buffer"""
+        with self._lock:
+            spans = self._finished.get(trace_id) or self._active.get(trace_id)
+            spans = list(spans) if spans else None
+        if not spans:
+            return None
+        origin = spans[0].start
+        return {
+            "trace_id": trace_id,
+            "spans": [span.to_dict(origin) for span in spans]
+        }
+
+    def recent_trace_ids(self, limit: int = 20):
+        with self._lock:
+            return list(self._finished)[-limit:][::-1]
+
+
+# Tracer dùng chung của process
+tracer = Tracer()
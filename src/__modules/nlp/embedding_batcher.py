@@ -0,0 +1,119 @@
+import asyncio
+import queue
+import threading
+import time
+import sys
+import os
+from concurrent.futures import Future
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+from config.settings import config
+
+class EmbeddingBatcher:
+    """
+    Gom các yêu cầu encode đồng thời (từ nhiều request) thành một batch để model chạy
+    một lượt forward thay vì nhiều lượt batch-size-1.
+    Yêu cầu đầu tiên mở một cửa sổ chờ tối đa `max_wait_ms`; batch được chạy ngay khi
+    đủ `max_batch_size` câu hoặc hết thời gian chờ. Mỗi caller nhận một Future riêng.
+    """
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._worker = None
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.size_histogram = {}  # kích thước batch -> số batch
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Đưa một câu vào hàng đợi, trả về Future chứa embedding của câu đó."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str):
+        """Encode đồng bộ một câu thông qua batcher."""
+        return self.submit(text).result()
+
+    async def aencode(self, text: str):
+        """Encode một câu thông qua batcher mà không chặn event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Hết thời gian chờ: chỉ lấy thêm những gì đã có sẵn trong hàng đợi
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Bỏ qua các Future đã bị hủy trước khi chạy
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.size_histogram[len(batch)] = self.size_histogram.get(len(batch), 0) + 1
+
+            try:
+                embeddings = self.model.encode([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+    def stats(self) -> dict:
+        """Thống kê độ đầy của các batch"""
+        with self._stats_lock:
+            avg_size = self.items / self.batches if self.batches else 0.0
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(avg_size, 2),
+                "avg_fill_ratio": round(avg_size / self.max_batch_size, 3),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "size_histogram": dict(sorted(self.size_histogram.items()))
+            }
+
+# Batcher dùng chung cho các câu hỏi L1
+embedding_batcher = EmbeddingBatcher(
+    config.model,
+    max_batch_size=config.EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=config.EMBED_BATCH_MAX_WAIT_MS
+)
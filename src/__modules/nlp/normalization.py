@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from functools import lru_cache, update_wrapper
+
+# Text ngắn (câu chat, tên thành phố, khóa từ điển) được cache; text dài (OCR) thì không
+# vì hiếm khi lặp lại và chỉ làm đầy cache
+CACHE_SIZE = 4096
+CACHE_MAX_LENGTH = 256
+
+# Viết tắt thường gặp trong tin nhắn (so khớp theo cả từ, trên text đã chuẩn hóa)
+ABBREVIATIONS = {
+    'tphcm': 'thành phố hồ chí minh',
+    'hcm': 'hồ chí minh',
+    'sg': 'sài gòn',
+    'hn': 'hà nội',
+    'tp': 'thành phố',
+    'ko': 'không',
+    'k0': 'không',
+    'đc': 'được',
+    'dc': 'được',
+}
+
+# Tên/cách viết thành phố -> tên chuẩn dùng trong dữ liệu chuyến
+CITY_ALIASES = {
+    'hà nội': 'hà nội',
+    'hanoi': 'hà nội',
+    'hn': 'hà nội',
+    'sài gòn': 'sài gòn',
+    'saigon': 'sài gòn',
+    'sg': 'sài gòn',
+    'hồ chí minh': 'sài gòn',
+    'thành phố hồ chí minh': 'sài gòn',
+    'tp hồ chí minh': 'sài gòn',
+    'tp hcm': 'sài gòn',
+    'tphcm': 'sài gòn',
+    'hcm': 'sài gòn',
+    'đà nẵng': 'đà nẵng',
+    'danang': 'đà nẵng',
+    'huế': 'huế',
+    'cần thơ': 'cần thơ',
+    'hải phòng': 'hải phòng',
+}
+
+def _build_fold_table():
+    """Bảng str.translate bỏ dấu tiếng Việt (và Latin nói chung): ký tự -> chữ cái gốc"""
+    table = {ord('đ'): 'd', ord('Đ'): 'D'}
+    for code in list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00)):
+        char = chr(code)
+        base = unicodedata.normalize('NFD', char)[0]
+        if base != char and base.isascii():
+            table[code] = base
+    # Dấu rời (text chưa NFC hoặc tổ hợp không có dạng dựng sẵn)
+    for code in range(0x0300, 0x0370):
+        table[code] = None
+    return table
+
+_FOLD_TABLE = _build_fold_table()
+_ABBREVIATION_PATTERN = re.compile(
+    r'(?<!\w)(?:' + '|'.join(re.escape(k) for k in sorted(ABBREVIATIONS, key=len, reverse=True)) + r')(?!\w)'
+)
+
+def memoized(func):
+    """Cache kết quả cho text ngắn, gọi thẳng với text dài"""
+    cached = lru_cache(maxsize=CACHE_SIZE)(func)
+
+    def wrapper(text):
+        return cached(text) if len(text) <= CACHE_MAX_LENGTH else func(text)
+
+    update_wrapper(wrapper, func)
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+def normalize_unicode(text: str) -> str:
+    """Đưa về dạng dựng sẵn NFC (bộ gõ tổ hợp/OCR có thể trả về chữ + dấu rời)"""
+    if unicodedata.is_normalized('NFC', text):
+        return text
+    return unicodedata.normalize('NFC', text)
+
+def collapse_whitespace(text: str) -> str:
+    return ' '.join(text.split())
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu: 'Đà Nẵng' -> 'Da Nang'"""
+    return normalize_unicode(text).translate(_FOLD_TABLE)
+
+@memoized
+def normalize_text(text: str) -> str:
+    """NFC, chữ thường và gộp khoảng trắng: dạng chuẩn để so khớp regex/từ khóa"""
+    return collapse_whitespace(normalize_unicode(text).lower())
+
+@memoized
+def fold_text(text: str) -> str:
+    """normalize_text rồi bỏ dấu: khóa so sánh không phụ thuộc cách gõ ('Ha Noi' == 'hà nội')"""
+    return normalize_text(text).translate(_FOLD_TABLE)
+
+def expand_abbreviations(text: str) -> str:
+    """Mở rộng viết tắt (theo cả từ) trên text đã chuẩn hóa: 'vé đi hcm' -> 'vé đi hồ chí minh'"""
+    return _ABBREVIATION_PATTERN.sub(lambda m: ABBREVIATIONS[m.group()], text)
+
+@memoized
+def normalize_query(text: str) -> str:
+    """normalize_text và mở rộng viết tắt, dùng cho câu hỏi của người dùng"""
+    return expand_abbreviations(normalize_text(text))
+
+
+class Vocabulary:
+    """
+    Từ điển tĩnh (cách viết -> giá trị chuẩn). Khóa được chuẩn hóa và bỏ dấu một lần khi khởi tạo
+    nên mỗi lần tra chỉ cần chuẩn hóa text đầu vào rồi so khớp khóa đã tính sẵn.
+    """
+    def __init__(self, aliases: dict):
+        self._values = {}
+        for alias, value in aliases.items():
+            self._values.setdefault(fold_text(alias), value)
+        # Khóa dài trước để 'thanh pho ho chi minh' thắng 'ho chi minh'
+        keys = sorted(self._values, key=len, reverse=True)
+        self._pattern = re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(k) for k in keys) + r')(?!\w)')
+
+    def __contains__(self, text):
+        return fold_text(text) in self._values
+
+    def canonical(self, text: str, default=None):
+        """Giá trị chuẩn nếu cả text là một cách viết trong từ điển"""
+        return self._values.get(fold_text(text), default)
+
+    def find(self, text: str):
+        """Giá trị chuẩn của cách viết xuất hiện đầu tiên trong text (theo cả từ), None nếu không có"""
+        match = self._pattern.search(fold_text(text))
+        return self._values[match.group()] if match else None
+
+    def find_all(self, text: str):
+        """Giá trị chuẩn của mọi cách viết trong text, theo thứ tự xuất hiện"""
+        return [self._values[m.group()] for m in self._pattern.finditer(fold_text(text))]
+
+
+# Từ điển thành phố dùng chung
+cities = Vocabulary(CITY_ALIASES)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Encode câu bằng bản ONNX lượng tử hóa int8 của model embedding (chạy CPU bằng ONNX Runtime, không cần PyTorch).
+
+    python src/__modules/nlp/onnx_embedder.py export --output ./models/gte-multilingual-base-int8
+    python src/__modules/nlp/onnx_embedder.py check --model-dir ./models/gte-multilingual-base-int8
+
+`export` nạp SentenceTransformer, xuất phần transformer sang ONNX, lượng tử hóa động trọng số sang int8,
+lưu tokenizer và cấu hình pooling vào cùng thư mục rồi chạy `check`: so embedding của hai bản trên các câu
+hỏi FAQ và đoạn chính sách, thoát với mã 1 nếu có câu có cosine thấp hơn --tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+DEFAULT_MODEL = "Alibaba-NLP/gte-multilingual-base"
+MODEL_FILE = "model.onnx"
+CONFIG_FILE = "embedder.json"
+TOKENIZER_FILE = "tokenizer.json"
+DEFAULT_TOLERANCE = 0.99
+
+# Câu ngắn (câu hỏi của người dùng) được cache token id; đoạn văn dài thì không
+TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_MAX_LENGTH = 256
+
+
+class OnnxEmbedder:
+    """
+    Thay cho SentenceTransformer ở những chỗ chỉ gọi encode(): tokenize bằng thư viện `tokenizers`
+    (token id của câu ngắn được cache), chia batch theo độ dài để ít padding, chạy session ONNX
+    rồi pooling (CLS hoặc trung bình theo attention mask) và chuẩn hóa giống model gốc.
+    """
+    def __init__(self, session, tokenizer, pooling: str = "cls", normalize: bool = True,
+                 max_length: int = 512, pad_token_id: int = 0, source_model: str = None, quantized: bool = False):
+        if pooling not in ("cls", "mean"):
+            raise ValueError(f"pooling không hợp lệ: {pooling}")
+        self.session = session
+        self.tokenizer = tokenizer
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self.pad_token_id = pad_token_id
+        # Model gốc và cờ lượng tử hóa (định danh của không gian embedding)
+        self.source_model = source_model
+        self.quantized = quantized
+        self._input_names = {i.name for i in session.get_inputs()}
+        self._output_name = session.get_outputs()[0].name
+        self._cached_ids = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self._tokenize_one)
+
+    @classmethod
+    def load(cls, model_dir: str, threads: int = 0):
+        """Nạp model đã export (model.onnx, tokenizer.json, embedder.json); threads=0 để ONNX Runtime tự chọn"""
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as file:
+            settings = json.load(file)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            os.path.join(model_dir, settings.get("model_file", MODEL_FILE)),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        # Padding tự làm theo từng batch; chỉ giữ truncation theo độ dài tối đa của model
+        tokenizer.no_padding()
+        tokenizer.enable_truncation(max_length=settings["max_length"])
+
+        return cls(
+            session,
+            tokenizer,
+            pooling=settings["pooling"],
+            normalize=settings["normalize"],
+            max_length=settings["max_length"],
+            pad_token_id=settings["pad_token_id"],
+            source_model=settings.get("source_model"),
+            quantized=settings.get("quantized", False)
+        )
+
+    def _tokenize_one(self, text):
+        return tuple(self.tokenizer.encode(text).ids)
+
+    def tokenize(self, texts):
+        """Token id (tuple) của từng text, câu ngắn lấy từ cache"""
+        ids = [None] * len(texts)
+        uncached = []
+        for i, text in enumerate(texts):
+            if len(text) <= TOKEN_CACHE_MAX_LENGTH:
+                ids[i] = self._cached_ids(text)
+            else:
+                uncached.append(i)
+        if uncached:
+            encodings = self.tokenizer.encode_batch([texts[i] for i in uncached])
+            for i, encoding in zip(uncached, encodings):
+                ids[i] = tuple(encoding.ids)
+        return ids
+
+    def _pad(self, batch_ids):
+        length = max(len(ids) for ids in batch_ids)
+        input_ids = np.full((len(batch_ids), length), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(batch_ids), length), dtype=np.int64)
+        for row, ids in enumerate(batch_ids):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        return input_ids, attention_mask
+
+    def _pool(self, hidden, attention_mask):
+        if self.pooling == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return embeddings.astype(np.float32)
+
+    def _run(self, batch_ids):
+        input_ids, attention_mask = self._pad(batch_ids)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+        hidden = self.session.run([self._output_name], feeds)[0]
+        return self._pool(hidden, attention_mask)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               normalize_embeddings: bool = None, convert_to_numpy: bool = True, **kwargs):
+        """
+        Giống SentenceTransformer.encode: một câu -> vector (dim,), list câu -> ma trận (n, dim) float32
+        theo đúng thứ tự đầu vào. Các tham số khác của SentenceTransformer được bỏ qua.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        ids = self.tokenize(texts)
+        # Câu dài trước, các câu cùng batch có độ dài gần nhau nên ít padding
+        order = sorted(range(len(texts)), key=lambda i: -len(ids[i]))
+        embeddings = None
+        starts = range(0, len(order), batch_size)
+        if show_progress_bar:
+            print(f"Encode {len(texts)} câu ({len(starts)} batch)...")
+        for start in starts:
+            rows = order[start:start + batch_size]
+            batch = self._run([ids[i] for i in rows])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[rows] = batch
+
+        normalize = self.normalize if normalize_embeddings is None else normalize_embeddings
+        if normalize:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings[0] if single else embeddings
+
+    def cache_info(self):
+        return self._cached_ids.cache_info()
+
+
+def cosine_similarities(a, b):
+    """Cosine giữa từng cặp dòng của hai ma trận cùng kích thước"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    dots = np.einsum("ij,ij->i", a, b)
+    return dots / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+
+def check_equivalence(reference, candidate, texts, tolerance: float = DEFAULT_TOLERANCE) -> dict:
+    """Encode `texts` bằng hai model, so cosine từng câu; passed=False nếu có câu dưới `tolerance`"""
+    texts = list(texts)
+    timings = {}
+    embeddings = {}
+    for name, model in (("reference", reference), ("candidate", candidate)):
+        model.encode(texts[:8])  # làm nóng
+        start = time.perf_counter()
+        embeddings[name] = model.encode(texts)
+        timings[name] = time.perf_counter() - start
+
+    similarities = cosine_similarities(embeddings["reference"], embeddings["candidate"])
+    worst = int(np.argmin(similarities))
+    return {
+        "texts": len(texts),
+        "min_cosine": float(similarities[worst]),
+        "mean_cosine": float(similarities.mean()),
+        "worst_text": texts[worst],
+        "below_tolerance": int((similarities < tolerance).sum()),
+        "tolerance": tolerance,
+        "passed": bool(similarities.min() >= tolerance),
+        "reference_ms_per_text": round(timings["reference"] * 1000 / len(texts), 3),
+        "candidate_ms_per_text": round(timings["candidate"] * 1000 / len(texts), 3),
+    }
+
+def sample_texts():
+    """Câu hỏi FAQ và các đoạn của file chính sách: đúng loại text mà model phải encode khi chạy"""
+    docs_dir = os.path.join(project_root, "src", "database", "docs")
+    texts = []
+    with open(os.path.join(docs_dir, "vexere_support_data.json"), "r", encoding="utf-8") as file:
+        texts.extend(json.load(file))
+    with open(os.path.join(docs_dir, "vexere_policy_structured.txt"), "r", encoding="utf-8") as file:
+        texts.extend(part.strip() for part in file.read().split("## ") if part.strip())
+    return texts
+
+
+def _load_reference(model_name):
+    from sentence_transformers import SentenceTransformer
+    # Tắt unpad/attention tối ưu của code model gốc để đồ thị export chỉ gồm các phép toán chuẩn
+    return SentenceTransformer(
+        model_name,
+        trust_remote_code=True,
+        config_kwargs={"unpad_inputs": False, "use_memory_efficient_attention": False}
+    )
+
+def _pooling_settings(reference):
+    pooling, normalize = "cls", False
+    for module in reference:
+        name = type(module).__name__
+        if name == "Pooling":
+            if getattr(module, "pooling_mode_mean_tokens", False):
+                pooling = "mean"
+            elif not getattr(module, "pooling_mode_cls_token", False):
+                raise ValueError(f"Chỉ hỗ trợ pooling CLS hoặc mean: {module.get_pooling_mode_str()}")
+        elif name == "Normalize":
+            normalize = True
+    return pooling, normalize
+
+def export(output_dir: str, model_name: str = DEFAULT_MODEL, quantize: bool = True, opset: int = 17,
+           reference=None):
+    """Xuất model sang ONNX (int8 nếu quantize) vào output_dir; trả về model SentenceTransformer đã nạp"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    reference = reference or _load_reference(model_name)
+    transformer = reference[0].auto_model.eval()
+    tokenizer = reference[0].tokenizer
+    pooling, normalize = _pooling_settings(reference)
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    dummy = tokenizer(["xin chào", "chính sách hủy vé"], padding=True, return_tensors="pt")
+    with tempfile.TemporaryDirectory() as workdir:
+        float_path = os.path.join(workdir, "model_fp32.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(transformer),
+                (dummy["input_ids"], dummy["attention_mask"]),
+                float_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=opset
+            )
+        model_path = os.path.join(output_dir, MODEL_FILE)
+        if quantize:
+            # Lượng tử hóa động: trọng số MatMul/Gather lưu int8, activation lượng tử hóa lúc chạy
+            quantize_dynamic(float_path, model_path, weight_type=QuantType.QInt8)
+        else:
+            shutil.move(float_path, model_path)
+
+    tokenizer.save_pretrained(output_dir)
+    settings = {
+        "source_model": model_name,
+        "model_file": MODEL_FILE,
+        "quantized": quantize,
+        "pooling": pooling,
+        "normalize": normalize,
+        "max_length": int(reference.max_seq_length),
+        "pad_token_id": int(tokenizer.pad_token_id or 0),
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as file:
+        json.dump(settings, file, ensure_ascii=False, indent=2)
+    return reference
+
+def _print_report(model_dir, report):
+    size = os.path.getsize(os.path.join(model_dir, MODEL_FILE)) / 1024 / 1024
+    status = "✅" if report["passed"] else "❌"
+    print(f"{status} {report['texts']} câu: cosine min {report['min_cosine']:.4f}, "
+          f"trung bình {report['mean_cosine']:.4f} (ngưỡng {report['tolerance']}, "
+          f"{report['below_tolerance']} câu dưới ngưỡng)")
+    print(f"   Encode: PyTorch {report['reference_ms_per_text']}ms/câu, "
+          f"ONNX {report['candidate_ms_per_text']}ms/câu; model.onnx {size:.0f} MB")
+    if not report["passed"]:
+        print(f"   Câu lệch nhất: {report['worst_text'][:120]!r}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất và kiểm tra model embedding ONNX")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Xuất model sang ONNX rồi kiểm tra tương đương")
+    export_parser.add_argument("--output", required=True, help="Thư mục lưu model ONNX")
+    export_parser.add_argument("--model", default=DEFAULT_MODEL, help="Tên/đường dẫn SentenceTransformer")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Giữ trọng số float32")
+    export_parser.add_argument("--opset", type=int, default=17)
+
+    check_parser = subparsers.add_parser("check", help="So embedding ONNX với model PyTorch gốc")
+    check_parser.add_argument("--model-dir", required=True, help="Thư mục model ONNX đã export")
+    check_parser.add_argument("--model", default=None, help="Model gốc (mặc định: model đã dùng khi export)")
+
+    for sub in (export_parser, check_parser):
+        sub.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Cosine tối thiểu mỗi câu")
+        sub.add_argument("--threads", type=int, default=0, help="Số thread ONNX Runtime (0: tự chọn)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        model_dir = args.output
+        reference = export(model_dir, args.model, quantize=not args.no_quantize, opset=args.opset)
+        print(f"✅ Đã xuất model vào {model_dir}")
+    else:
+        model_dir = args.model_dir
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as file:
+            reference = _load_reference(args.model or json.load(file)["source_model"])
+
+    candidate = OnnxEmbedder.load(model_dir, threads=args.threads)
+    report = check_equivalence(reference, candidate, sample_texts(), tolerance=args.tolerance)
+    _print_report(model_dir, report)
+    if not report["passed"]:
+        sys.exit(1)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import re
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, project_root)
+
+from config.settings import config
+from src.__modules.core.tracing import tracer
+from src.__modules.nlp.threading import threaded_main, athreaded_main
+from src.__modules.chatbot.nlp_extractor.nlp_engine import INTENT_PATTERNS, ENTITY_PATTERNS
+from src.__modules.nlp.normalization import normalize_query
+
+# Từ khóa cho câu hỏi chính sách/quy định (L1), neo theo ranh giới từ để "phí" không khớp "phía", "phím"
+POLICY_PATTERN = re.compile(
+    r'\b(?:chính sách|quy định|quy trình|thủ tục|hoàn tiền|hoàn lại|điều kiện|điều khoản|'
+    r'phí|lệ phí|hành lý|thanh toán|hướng dẫn|lưu ý|bảo hiểm|khuyến mãi|ưu đãi)\b',
+    re.I
+)
+
+# Dấu hiệu câu hỏi chung chung, nghiêng về L1
+QUESTION_PATTERN = re.compile(
+    r'\?|như thế nào|thế nào|làm sao|làm thế nào|bao lâu|bao nhiêu tiền|có được|được không|có phải|tại sao|vì sao',
+    re.I
+)
+
+# Entity thường xuất hiện trong yêu cầu đặt/đổi/hủy vé (L23)
+BOOKING_ENTITY_KEYS = ('city', 'time', 'ticket_code', 'quantity')
+
+STRONG_WEIGHT = 0.6
+WEAK_WEIGHT = 0.3
+
+def classify_locally(user_query: str) -> dict:
+    """
+    Phân loại L1/L23 bằng regex, không gọi mạng.
+    Độ tin cậy = điểm bên thắng / (tổng điểm hai bên + 0.1): chỉ có tín hiệu một phía thì cao,
+    có tín hiệu cả hai phía hoặc không có tín hiệu nào thì thấp.
+    """
+    # Chuẩn hóa (có cache) và mở rộng viết tắt: "vé đi hcm" có tín hiệu thành phố như "vé đi hồ chí minh"
+    text = normalize_query(user_query)
+
+    l23_score = 0.0
+    if any(pattern.search(text) for pattern in INTENT_PATTERNS.values()):
+        l23_score += STRONG_WEIGHT
+    if any(ENTITY_PATTERNS[key].search(text) for key in BOOKING_ENTITY_KEYS):
+        l23_score += WEAK_WEIGHT
+
+    l1_score = 0.0
+    if POLICY_PATTERN.search(text):
+        l1_score += STRONG_WEIGHT
+    if QUESTION_PATTERN.search(text):
+        l1_score += WEAK_WEIGHT
+
+    # Không có tín hiệu nào thì mặc định L1 (trả lời chung) với độ tin cậy 0
+    route = "L23" if l23_score > l1_score else "L1"
+    winner = max(l1_score, l23_score)
+    confidence = winner / (l1_score + l23_score + 0.1) if winner else 0.0
+
+    return {
+        'route': route,
+        'confidence': round(confidence, 3),
+        'source': 'local'
+    }
+
+def _apply_llm_action(decision: dict, action: str) -> dict:
+    """Cập nhật quyết định theo kết quả trả về từ LLM router"""
+    if "L23" in action:
+        decision['route'] = "L23"
+    elif "L1" in action:
+        decision['route'] = "L1"
+    else:
+        raise Exception(f"Kết quả router không hợp lệ: {action}")
+    decision['source'] = 'llm'
+    return decision
+
+@tracer.traced("router")
+def route_message(user_query: str, threshold: float = None) -> dict:
+    """
+    Quyết định chuyển câu hỏi đến L1 hay L23.
+    Dùng router cục bộ trước, chỉ gọi LLM (threaded_main) khi độ tin cậy thấp.
+    Trả về dict gồm 'route', 'confidence' (của router cục bộ) và 'source' ('local', 'llm' hoặc 'local_fallback').
+    """
+    if threshold is None:
+        threshold = config.ROUTER_CONFIDENCE_THRESHOLD
+
+    decision = classify_locally(user_query)
+    if decision['confidence'] >= threshold:
+        return decision
+
+    try:
+        if not config.llm:
+            raise Exception("API key không khả dụng")
+        return _apply_llm_action(decision, threaded_main(user_query))
+    except Exception as e:
+        print(f"⚠️ Router LLM lỗi, dùng kết quả cục bộ: {e}")
+        decision['source'] = 'local_fallback'
+
+    return decision
+
+@tracer.traced("router")
+async def aroute_message(user_query: str, threshold: float = None) -> dict:
+    """Phiên bản async của route_message, gọi LLM qua client async"""
+    if threshold is None:
+        threshold = config.ROUTER_CONFIDENCE_THRESHOLD
+
+    decision = classify_locally(user_query)
+    if decision['confidence'] >= threshold:
+        return decision
+
+    try:
+        if not config.llm:
+            raise Exception("API key không khả dụng")
+        return _apply_llm_action(decision, await athreaded_main(user_query))
+    except Exception as e:
+        print(f"⚠️ Router LLM lỗi, dùng kết quả cục bộ: {e}")
+        decision['source'] = 'local_fallback'
+
+    return decision
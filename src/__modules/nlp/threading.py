@@ -6,9 +6,10 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(o
 sys.path.insert(0, project_root)
 
 from config.settings import config
+from src.__modules.core.metrics import metrics
 
-def threaded_main(user_query: str):
-    prompt = f"""Tự động phân tích câu hỏi của người dùng và chuyển đến mô-đun phù hợp:
+def build_router_prompt(user_query: str) -> str:
+    return f"""Tự động phân tích câu hỏi của người dùng và chuyển đến mô-đun phù hợp:
     - Nếu câu hỏi liên quan đến chính sách, quy định, thủ tục, hoàn tiền -> Chuyển đến mô-đun L1
     - Nếu câu hỏi liên quan đến đặt vé, hủy vé, đổi giờ, xuất hóa đơn, khiếu nại -> Chuyển đến mô-đun L23
 
@@ -17,8 +18,11 @@ def threaded_main(user_query: str):
     Không giải thích gì thêm, chỉ trả về "L1" hoặc "L23".
     """
 
-    result = config.agent.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt
-    )
-    return result.text.strip()
\ No newline at end of file
+@metrics.timed("router_llm")
+def threaded_main(user_query: str):
+    return config.llm.generate(build_router_prompt(user_query)).strip()
+
+@metrics.timed("router_llm")
+async def athreaded_main(user_query: str):
+    """Phiên bản async của threaded_main, dùng client async của LLM provider"""
+    return (await config.llm.agenerate(build_router_prompt(user_query))).strip()
@@ -0,0 +1,8 @@
+import re
+
+# Ước lượng số token: mỗi từ/âm tiết hoặc dấu câu là một token. Tiếng Việt viết tách âm tiết nên gần với
+# số token của tokenizer subword, đủ để giới hạn kích thước prompt/chunk mà không gọi API đếm token
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_PATTERN.findall(text))
@@ -2,8 +2,9 @@ import sys
 import os
 import json
 import asyncio
-from typing import Dict, List
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, Security
+from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
@@ -11,7 +12,14 @@ from pydantic import BaseModel
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 
+from config.settings import config
 from src.__modules.core.controller import ChatController
+from src.__modules.core.cluster import cluster, merge_counters
+from src.__modules.core.metrics import metrics, format_labels
+from src.__modules.core.tracing import tracer
+from src.__modules.core.profiler import profiler, ProfilerBusyError
+from src.__modules.nlp.embedding_batcher import embedding_batcher
+from src.__modules.chatbot.L1 import context_builder
 
 # Pydantic models
 class ChatRequest(BaseModel):
@@ -22,30 +30,238 @@ class ChatResponse(BaseModel):
     response: str
     session_id: str
     status: str = "success"
+    trace_id: Optional[str] = None
 
 # WebSocket Connection Manager
+class Connection:
+    """
+    Trạng thái của một kết nối WebSocket:
+    - inbox: tin nhắn đã nhận nhưng chưa xử lý (giới hạn số tin nhắn in-flight của session)
+    - send_queue: frame chờ gửi, được một writer task gửi lần lượt theo đúng thứ tự
+    Tin nhắn của một session được xử lý tuần tự (trạng thái hội thoại phụ thuộc thứ tự),
+    trong khi reader vẫn tiếp tục nhận frame (pong, tin nhắn mới) và các session khác chạy song song.
+    """
+    def __init__(self, websocket: WebSocket, session_id: str, send_queue_size: int, max_inflight: int):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.send_queue = asyncio.Queue(maxsize=send_queue_size)
+        self.inbox = asyncio.Queue(maxsize=max_inflight)
+        self.last_seen = asyncio.get_event_loop().time()
+        self.closed = False
+        self.tasks: List[asyncio.Task] = []
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    """
+    Quản lý các kết nối WebSocket của worker. Khi có cluster (CLUSTER_MODE), frame cho session
+    đang kết nối ở worker khác được chuyển qua Redis pub/sub và mỗi session chỉ giữ một kết nối
+    trên toàn cluster.
+    """
+    def __init__(self, send_queue_size: int = None, max_inflight: int = None, send_timeout: float = None,
+                 heartbeat_interval: float = None, idle_timeout: float = None, cluster=None):
+        self.send_queue_size = send_queue_size or config.WS_SEND_QUEUE_SIZE
+        self.max_inflight = max_inflight or config.WS_MAX_INFLIGHT
+        self.send_timeout = send_timeout or config.WS_SEND_TIMEOUT
+        self.heartbeat_interval = heartbeat_interval or config.WS_HEARTBEAT_INTERVAL
+        self.idle_timeout = idle_timeout or config.WS_IDLE_TIMEOUT
+        self.active_connections: Dict[str, Connection] = {}
+        self.cluster = cluster
+        self._background = set()
+        if cluster is not None:
+            cluster.on("deliver", self._on_cluster_deliver)
+            cluster.on("close_session", self._on_cluster_close)
+
+        # Metrics
+        self.rejected_messages = 0
+        self.slow_consumer_disconnects = 0
+        self.idle_disconnects = 0
 
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str) -> Connection:
         await websocket.accept()
-        self.active_connections[session_id] = websocket
+        # Session mở kết nối mới thì đóng kết nối cũ
+        old = self.active_connections.get(session_id)
+        if old is not None:
+            # Session vẫn ở worker này: giữ nguyên quyền giữ trong cluster cho kết nối mới
+            await self._close(old, 1000, "replaced by new connection", release=False)
+
+        connection = Connection(websocket, session_id, self.send_queue_size, self.max_inflight)
+        self.active_connections[session_id] = connection
+        connection.tasks.append(asyncio.create_task(self._writer(connection)))
+        if self._cluster_enabled():
+            try:
+                await self.cluster.claim_session(session_id)
+            except Exception as e:
+                print(f"⚠️ Không ghi được session {session_id} vào cluster: {e}")
         print(f"🔗 WebSocket connected: {session_id}")
+        return connection
 
-    def disconnect(self, session_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
-            print(f"❌ WebSocket disconnected: {session_id}")
+    def _cluster_enabled(self) -> bool:
+        return self.cluster is not None and self.cluster.enabled
 
-    async def send_personal_message(self, message: dict, session_id: str):
+    def disconnect(self, session_id: str, connection: Connection = None, release: bool = True):
+        current = self.active_connections.get(session_id)
+        if current is None or (connection is not None and current is not connection):
+            return
+        del self.active_connections[session_id]
+        self._cancel_tasks(current)
+        if release and self._cluster_enabled():
+            task = asyncio.create_task(self._release_session(session_id))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        print(f"❌ WebSocket disconnected: {session_id}")
+
+    async def _release_session(self, session_id: str):
         if session_id in self.active_connections:
-            websocket = self.active_connections[session_id]
+            # Session đã kết nối lại ở worker này trước khi kịp xóa
+            return
+        try:
+            await self.cluster.release_session(session_id)
+        except Exception as e:
+            print(f"⚠️ Không xóa được session {session_id} khỏi cluster: {e}")
+
+    def _cancel_tasks(self, connection: Connection):
+        connection.closed = True
+        current = asyncio.current_task()
+        for task in connection.tasks:
+            if task is not current:
+                task.cancel()
+
+    async def _close(self, connection: Connection, code: int, reason: str, release: bool = True):
+        """Đóng kết nối (idle, client chậm, bị thay thế); reader sẽ nhận disconnect và dọn dẹp"""
+        if connection.closed:
+            return
+        print(f"⚠️ Đóng WebSocket {connection.session_id}: {reason}")
+        self.disconnect(connection.session_id, connection, release)
+        self._cancel_tasks(connection)
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=code, reason=reason), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _enqueue(self, connection: Connection, message: dict):
+        """
+        Đưa frame vào hàng đợi gửi. Hàng đợi đầy quá send_timeout nghĩa là client không đọc kịp:
+        ngắt kết nối thay vì để frame dồn lại không giới hạn.
+        """
+        if connection.closed:
+            return
+        try:
+            await asyncio.wait_for(connection.send_queue.put(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            self.slow_consumer_disconnects += 1
+            await self._close(connection, 1013, "slow consumer")
+
+    async def _writer(self, connection: Connection):
+        """Gửi lần lượt các frame trong hàng đợi (giữ đúng thứ tự của session)"""
+        while True:
+            message = await connection.send_queue.get()
             try:
-                await websocket.send_text(json.dumps(message, ensure_ascii=False))
+                await asyncio.wait_for(
+                    connection.websocket.send_text(json.dumps(message, ensure_ascii=False)), self.send_timeout
+                )
+            except asyncio.TimeoutError:
+                self.slow_consumer_disconnects += 1
+                await self._close(connection, 1013, "slow consumer")
+                return
             except Exception as e:
-                print(f"❌ Error sending message to {session_id}: {e}")
-                self.disconnect(session_id)
+                print(f"❌ Error sending message to {connection.session_id}: {e}")
+                await self._close(connection, 1011, "send error")
+                return
+
+    async def _processor(self, connection: Connection, handler):
+        """Xử lý tuần tự các tin nhắn trong inbox của session"""
+        while True:
+            user_message, stream = await connection.inbox.get()
+            try:
+                await handler(connection.websocket, connection.session_id, user_message, stream)
+            except Exception as e:
+                print(f"❌ WebSocket handler error for {connection.session_id}: {e}")
+
+    async def _heartbeat(self, connection: Connection):
+        """Gửi ping định kỳ và đóng kết nối không có frame nào từ client quá idle_timeout"""
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if loop.time() - connection.last_seen > self.idle_timeout:
+                self.idle_disconnects += 1
+                await self._close(connection, 1001, "idle timeout")
+                return
+            await self._enqueue(connection, {"type": "ping", "timestamp": loop.time()})
+            if self._cluster_enabled():
+                try:
+                    await self.cluster.refresh_session(connection.session_id)
+                except Exception as e:
+                    print(f"⚠️ Không gia hạn được session {connection.session_id} trong cluster: {e}")
+
+    async def serve(self, websocket: WebSocket, session_id: str, handler):
+        """
+        Vòng đọc của một kết nối: nhận frame, trả lời ping/pong và đưa tin nhắn vào inbox.
+        Khi inbox đầy (quá max_inflight tin nhắn chưa xử lý), tin nhắn mới bị từ chối bằng frame "busy".
+        """
+        connection = await self.connect(websocket, session_id)
+        connection.tasks.append(asyncio.create_task(self._processor(connection, handler)))
+        connection.tasks.append(asyncio.create_task(self._heartbeat(connection)))
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                data = await websocket.receive_text()
+                connection.last_seen = loop.time()
+                try:
+                    message_data = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+
+                if message_data.get("type") == "pong":
+                    continue
+                user_message = message_data.get("message", "")
+                if not user_message:
+                    continue
+
+                try:
+                    connection.inbox.put_nowait((user_message, bool(message_data.get("stream"))))
+                except asyncio.QueueFull:
+                    self.rejected_messages += 1
+                    await self._enqueue(connection, {
+                        "type": "busy",
+                        "response": "Bạn đang gửi quá nhiều tin nhắn, vui lòng chờ phản hồi trước đó.",
+                        "session_id": session_id,
+                        "status": "error",
+                        "timestamp": loop.time()
+                    })
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            print(f"❌ WebSocket error for {session_id}: {e}")
+        finally:
+            self.disconnect(session_id, connection)
+
+    async def send_personal_message(self, message: dict, session_id: str):
+        """Gửi frame cho session, kể cả khi WebSocket của session đang mở ở worker khác trong cluster"""
+        connection = self.active_connections.get(session_id)
+        if connection is not None:
+            await self._enqueue(connection, message)
+        elif self._cluster_enabled():
+            await self.cluster.deliver(session_id, message)
+
+    async def _on_cluster_deliver(self, payload: dict):
+        connection = self.active_connections.get(payload["session_id"])
+        if connection is not None:
+            await self._enqueue(connection, payload["message"])
+
+    async def _on_cluster_close(self, payload: dict):
+        # Session đã kết nối lại ở worker khác
+        connection = self.active_connections.get(payload["session_id"])
+        if connection is not None:
+            await self._close(connection, 1000, "replaced by new connection")
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "queued_frames": sum(c.send_queue.qsize() for c in self.active_connections.values()),
+            "pending_messages": sum(c.inbox.qsize() for c in self.active_connections.values()),
+            "rejected_messages": self.rejected_messages,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "idle_disconnects": self.idle_disconnects
+        }
 
 # Stats tracking
 class StatsTracker:
@@ -76,11 +292,76 @@ class StatsTracker:
             "l1_requests": self.l1_requests,
             "l2_requests": self.l2_requests,
             "l3_requests": self.l3_requests,
-            "fallback_requests": self.fallback_requests
+            "fallback_requests": self.fallback_requests,
+            "websocket": manager.stats(),
+            "cluster": cluster.stats(),
+            "embedding_batcher": embedding_batcher.stats(),
+            "context": context_builder.stats(),
+            "llm": config.llm.stats() if config.llm else None,
+            "stages": metrics.summary()
         }
 
+    def render_prometheus(self, labels: dict = None) -> str:
+        """Các bộ đếm theo định dạng text của Prometheus (`labels` gắn thêm vào mọi series)"""
+        extra = format_labels(labels)
+        worker = f"{{{extra.rstrip(',')}}}" if extra else ""
+        levels = {
+            "L1": self.l1_requests,
+            "L2": self.l2_requests,
+            "L3": self.l3_requests,
+            "fallback": self.fallback_requests
+        }
+        lines = [
+            "# HELP vexere_messages_total Tổng số tin nhắn đã xử lý",
+            "# TYPE vexere_messages_total counter",
+            f"vexere_messages_total{worker} {self.total_messages}",
+            "# HELP vexere_requests_total Số tin nhắn theo mức xử lý",
+            "# TYPE vexere_requests_total counter",
+        ]
+        lines += [f'vexere_requests_total{{{extra}level="{level}"}} {count}' for level, count in levels.items()]
+        lines += [
+            "# HELP vexere_active_sessions Số kết nối WebSocket đang mở",
+            "# TYPE vexere_active_sessions gauge",
+            f"vexere_active_sessions{worker} {len(manager.active_connections)}",
+        ]
+        context = context_builder.stats()
+        lines += [
+            "# HELP vexere_context_tokens_total Số token ngữ cảnh chính sách đưa vào prompt L1 (ước lượng)",
+            "# TYPE vexere_context_tokens_total counter",
+            f"vexere_context_tokens_total{worker} {context['tokens']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+# Các bộ đếm của get_stats() cộng gộp được giữa các worker (xem merge_counters). Thiết lập và gauge
+# như max_batch_size, max_wait_ms, queue_depth, max_tokens chỉ có trong thống kê riêng của từng worker.
+CLUSTER_COUNTERS = {
+    "active_sessions": True,
+    "total_messages_processed": True,
+    "l1_requests": True,
+    "l2_requests": True,
+    "l3_requests": True,
+    "fallback_requests": True,
+    "websocket": {
+        "connections": True,
+        "rejected_messages": True,
+        "slow_consumer_disconnects": True,
+        "idle_disconnects": True
+    },
+    "cluster": {"published": True, "received": True, "undelivered": True},
+    "embedding_batcher": {"batches": True, "items": True, "size_histogram": {"*": True}},
+    "context": {
+        "requests": True,
+        "tokens": True,
+        "raw_tokens": True,
+        "truncated_chunks": True,
+        "duplicate_chunks": True
+    },
+    "llm": {"calls": True, "errors": True, "total_latency_s": True},
+    "stages": {"*": {"count": True}}
+}
+
 # Global instances
-manager = ConnectionManager()
+manager = ConnectionManager(cluster=cluster)
 stats_tracker = StatsTracker()
 
 # API Functions
@@ -95,13 +376,18 @@ async def handle_chat_request(request: ChatRequest) -> ChatResponse:
         # Khởi tạo controller với session_id
         chat_controller = ChatController(request.session_id)
         
-        # Xử lý tin nhắn
-        bot_response = chat_controller.handle_user_message(request.message)
+        # Xử lý tin nhắn (không chặn event loop)
+        with tracer.trace("chat", session_id=request.session_id) as trace:
+            with metrics.time("request"):
+                bot_response = await chat_controller.ahandle_user_message(request.message)
+        if chat_controller.last_level:
+            stats_tracker.increment_level(chat_controller.last_level)
         
         return ChatResponse(
             response=bot_response,
             session_id=request.session_id,
-            status="success"
+            status="success",
+            trace_id=trace.trace_id
         )
         
     except Exception as e:
@@ -111,23 +397,69 @@ async def handle_chat_request(request: ChatRequest) -> ChatResponse:
             detail=f"Lỗi xử lý tin nhắn: {str(e)}"
         )
 
-async def handle_websocket_message(websocket: WebSocket, session_id: str, user_message: str):
+async def stream_chat_events(session_id: str, user_message: str):
     """
-    Xử lý tin nhắn WebSocket
+    Xử lý tin nhắn ở chế độ streaming, trả về lần lượt các event:
+    - {"type": "chunk", "delta": ...} cho từng đoạn câu trả lời
+    - {"type": "final", "response": <câu trả lời đầy đủ>, "status": "success"} ở cuối
+    - {"type": "error", ...} nếu có lỗi
     """
+    stats_tracker.increment_message()
+    chat_controller = ChatController(session_id)
+    loop = asyncio.get_event_loop()
+    with tracer.trace("chat_stream", session_id=session_id) as trace:
+        base = {"session_id": session_id, "trace_id": trace.trace_id}
+        try:
+            chunks = []
+            start = loop.time()
+            with metrics.time("request"):
+                async for chunk in chat_controller.astream_user_message(user_message):
+                    if not chunks:
+                        # Thời gian tới đoạn đầu tiên: độ trễ người dùng thực sự cảm nhận
+                        metrics.observe("first_token", loop.time() - start)
+                    chunks.append(chunk)
+                    yield dict(base, type="chunk", delta=chunk)
+            if chat_controller.last_level:
+                stats_tracker.increment_level(chat_controller.last_level)
+            yield dict(base, type="final", response="".join(chunks), status="success", timestamp=loop.time())
+        except Exception as e:
+            print(f"❌ Lỗi xử lý chat stream: {str(e)}")
+            yield dict(base, type="error", response=f"Xin lỗi, có lỗi xảy ra: {str(e)}",
+                       status="error", timestamp=loop.time())
+
+async def handle_chat_stream_request(request: ChatRequest):
+    """Server-Sent Events cho /chat/stream: mỗi event là một dòng `event:` và một dòng `data:` JSON"""
+    async for event in stream_chat_events(request.session_id, request.message):
+        yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def handle_websocket_message(websocket: WebSocket, session_id: str, user_message: str, stream: bool = False):
+    """
+    Xử lý tin nhắn WebSocket. Với stream=True, gửi mỗi đoạn câu trả lời thành một frame
+    {"type": "chunk"} rồi một frame {"type": "final"} chứa câu trả lời đầy đủ.
+    """
+    if stream:
+        async for event in stream_chat_events(session_id, user_message):
+            await manager.send_personal_message(event, session_id)
+        return
+
     try:
         # Track stats
         stats_tracker.increment_message()
         
         # Xử lý tin nhắn với chatbot
         chat_controller = ChatController(session_id)
-        bot_response = chat_controller.handle_user_message(user_message)
+        with tracer.trace("ws_message", session_id=session_id) as trace:
+            with metrics.time("request"):
+                bot_response = await chat_controller.ahandle_user_message(user_message)
+        if chat_controller.last_level:
+            stats_tracker.increment_level(chat_controller.last_level)
         
         # Gửi phản hồi về client
         response_data = {
             "response": bot_response,  # Đổi từ "message" thành "response" để đồng nhất với HTTP API
             "session_id": session_id,
             "status": "success",
+            "trace_id": trace.trace_id,
             "timestamp": asyncio.get_event_loop().time()
         }
         
@@ -143,11 +475,71 @@ async def handle_websocket_message(websocket: WebSocket, session_id: str, user_m
         }
         await manager.send_personal_message(error_response, session_id)
 
-def get_system_stats():
+async def get_system_stats():
+    """
+    Lấy thống kê hệ thống. Ở chế độ cluster, các bộ đếm (CLUSTER_COUNTERS) được cộng gộp từ thống kê
+    mới nhất của mọi worker còn sống; thống kê đầy đủ của từng worker nằm trong "workers".
+    """
+    stats = stats_tracker.get_stats()
+    if not cluster.enabled:
+        return stats
+    await cluster.publish_stats(stats)
+    workers = await cluster.worker_stats()
+    aggregated = merge_counters(workers.values(), CLUSTER_COUNTERS)
+    aggregated["worker_count"] = len(workers)
+    aggregated["workers"] = workers
+    return aggregated
+
+async def start_cluster():
+    """Tham gia cluster khi app khởi động (no-op nếu CLUSTER_MODE tắt hoặc không có Redis)"""
+    await cluster.start(stats_tracker.get_stats)
+
+async def stop_cluster():
+    await cluster.stop()
+
+def get_metrics_text():
     """
-    Lấy thống kê hệ thống
+    Metrics theo định dạng Prometheus: bộ đếm tin nhắn và histogram độ trễ từng stage.
+    Số liệu chỉ của worker trả lời request nên mọi series có nhãn worker để Prometheus
+    không coi việc đổi worker giữa các lần scrape là counter bị reset.
     """
-    return stats_tracker.get_stats()
+    labels = {"worker": cluster.worker_id}
+    return stats_tracker.render_prometheus(labels) + metrics.render(labels)
+
+# Xác thực cho các endpoint quản trị (header x-api-key, danh sách key trong API_KEYS)
+api_key_header = APIKeyHeader(name=config.API_KEY_NAME, auto_error=False)
+
+async def verify_api_key(api_key: str = Security(api_key_header)):
+    if not api_key or api_key not in config.API_KEY:
+        raise HTTPException(status_code=403, detail="API key không hợp lệ")
+    return api_key
+
+# Giới hạn cho một phiên profile để endpoint không giữ worker quá lâu
+MAX_PROFILE_SECONDS = 60.0
+
+async def run_profiler(seconds: float, interval_ms: float, include_idle: bool = False) -> dict:
+    """
+    Bật sampling profiler trong `seconds` giây trên worker hiện tại (chạy ở thread riêng,
+    event loop vẫn phục vụ request bình thường) và trả về collapsed stacks cho flamegraph
+    """
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds phải trong khoảng (0, {MAX_PROFILE_SECONDS}]")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms phải trong khoảng [1, 1000]")
+    try:
+        return await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def get_trace(trace_id: str) -> dict:
+    """Các span của một trace gần đây"""
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy trace")
+    return trace
+
+def get_recent_traces(limit: int = 20) -> dict:
+    return {"trace_ids": tracer.recent_trace_ids(limit)}
 
 def get_health_status():
     """
@@ -0,0 +1,414 @@
+import csv
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date as Date
+
+import numpy as np
+
+from src.database.storage import TicketCodeGenerator
+
+# Khóa (tuyến, ngày) được gộp vào một số int64: departure << 41 | destination << 20 | date ordinal
+_DEST_SHIFT = 20
+_DEP_SHIFT = 41
+_MAX_CITY_CODE = 1 << 21
+_MAX_ORDINAL = 1 << 20
+
+
+def _parse_minutes(time_str):
+    hour, minute = time_str.strip().split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def _format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class ScheduleCatalog:
+    """
+    Danh mục chuyến dạng cột (NumPy) cho lịch chạy hàng triệu chuyến.
+    Mỗi chuyến chỉ tốn vài chục byte: id dạng bytes cố định, mã thành phố đã intern (uint16),
+    ngày dạng ordinal (int32), giờ dạng số phút trong ngày (int16) và số ghế (int32).
+    Các dòng được sắp theo (điểm đi, điểm đến, ngày) nên tìm chuyến chỉ cần searchsorted
+    để lấy đoạn của tuyến rồi lọc bằng mask vector hóa.
+
+    Các cột đang nạp (append_rows) tách khỏi snapshot mà truy vấn đọc: finalize() dựng snapshot mới
+    (cột + khóa tuyến + index theo id) và công bố trong một lần gán. Người đọc lấy `snapshot` một lần
+    rồi truyền vào các hàm truy vấn để mọi vị trí dòng đều thuộc cùng một snapshot.
+    """
+    def __init__(self):
+        self.city_codes = {}
+        self.city_names = []
+        self._size = 0
+        self._columns = {}
+        self._alloc(0, 8)
+        self._data = self._build_snapshot(self._columns)
+
+    # ---------- Xây dựng ----------
+
+    def _alloc(self, capacity, id_width):
+        columns = {
+            'id': np.zeros(capacity, dtype=f'S{id_width}'),
+            'departure': np.zeros(capacity, dtype=np.uint16),
+            'destination': np.zeros(capacity, dtype=np.uint16),
+            'date': np.zeros(capacity, dtype=np.int32),
+            'minute': np.zeros(capacity, dtype=np.int16),
+            'seats': np.zeros(capacity, dtype=np.int32),
+            'active': np.zeros(capacity, dtype=bool),
+        }
+        for name, column in self._columns.items():
+            if name == 'id':
+                columns[name] = columns[name].astype(f'S{max(id_width, column.dtype.itemsize)}')
+            columns[name][:self._size] = column[:self._size]
+        self._columns = columns
+
+    def _capacity(self):
+        return len(self._columns['id'])
+
+    def intern_city(self, name):
+        """Mã số của một thành phố (tạo mới nếu chưa có)"""
+        key = name.strip().lower()
+        code = self.city_codes.get(key)
+        if code is None:
+            code = len(self.city_names)
+            if code >= min(_MAX_CITY_CODE, np.iinfo(np.uint16).max):
+                raise ValueError("Quá nhiều thành phố cho danh mục")
+            self.city_codes[key] = code
+            self.city_names.append(key)
+        return code
+
+    def append_rows(self, rows):
+        """Thêm một lô chuyến (list dict) vào cuối các cột; gọi finalize() sau khi nạp xong"""
+        if not rows:
+            return
+        ids = np.array([str(r['id']).encode('utf-8') for r in rows])
+        needed = self._size + len(rows)
+        id_width = max(self._columns['id'].dtype.itemsize, ids.dtype.itemsize)
+        if needed > self._capacity() or id_width > self._columns['id'].dtype.itemsize:
+            self._alloc(max(needed, self._capacity() * 2), id_width)
+
+        start, end = self._size, needed
+        cols = self._columns
+        cols['id'][start:end] = ids
+        cols['departure'][start:end] = [self.intern_city(r['departure']) for r in rows]
+        cols['destination'][start:end] = [self.intern_city(r['destination']) for r in rows]
+        cols['date'][start:end] = [Date.fromisoformat(str(r['date']).strip()).toordinal() for r in rows]
+        cols['minute'][start:end] = [_parse_minutes(str(r['time'])) for r in rows]
+        cols['seats'][start:end] = [int(r['available_seats']) for r in rows]
+        cols['active'][start:end] = True
+        self._size = end
+
+    def finalize(self):
+        """Bỏ các dòng đã xóa, sắp xếp theo (tuyến, ngày), dựng index theo id rồi công bố snapshot mới"""
+        keep = np.flatnonzero(self._columns['active'][:self._size])
+        cols = {name: column[keep] for name, column in self._columns.items()}
+        # lexsort ổn định: cùng khóa thì giữ thứ tự trong file
+        order = np.lexsort((cols['date'], cols['destination'], cols['departure']))
+        columns = {name: column[order] for name, column in cols.items()}
+        self._columns, self._size = columns, len(keep)
+        self._data = self._build_snapshot(columns)
+        return self
+
+    @classmethod
+    def _build_snapshot(cls, columns):
+        """Snapshot các cột đã sắp xếp kèm khóa tuyến và index theo id (chỉ số ghế/active đổi tại chỗ)"""
+        id_order = np.argsort(columns['id'], kind='stable').astype(np.int32)
+        return {
+            "columns": columns,
+            "route_key": cls._make_key(columns['departure'], columns['destination'], columns['date']),
+            "id_order": id_order,
+            "sorted_ids": columns['id'][id_order],
+        }
+
+    @staticmethod
+    def _make_key(departure, destination, ordinal):
+        return ((np.asarray(departure, dtype=np.int64) << _DEP_SHIFT)
+                | (np.asarray(destination, dtype=np.int64) << _DEST_SHIFT)
+                | np.asarray(ordinal, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path, chunk_rows=100_000):
+        """
+        Nạp danh mục từ file CSV (có header) hoặc JSONL theo từng lô `chunk_rows` dòng,
+        nên bộ nhớ tạm chỉ tỉ lệ với kích thước lô chứ không với cả file.
+        Các cột cần có: id, departure, destination, date (YYYY-MM-DD), time (HH:MM), available_seats.
+        """
+        catalog = cls()
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            if path.endswith(".jsonl") or path.endswith(".json"):
+                records = (json.loads(line) for line in file if line.strip())
+            else:
+                records = csv.DictReader(file)
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= chunk_rows:
+                    catalog.append_rows(batch)
+                    batch = []
+            catalog.append_rows(batch)
+        return catalog.finalize()
+
+    @classmethod
+    def from_schedules(cls, schedules):
+        """Dựng danh mục từ danh sách dict chuyến (như DEFAULT_SCHEDULES)"""
+        catalog = cls()
+        catalog.append_rows(list(schedules))
+        return catalog.finalize()
+
+    # ---------- Truy vấn ----------
+
+    @property
+    def snapshot(self):
+        """Snapshot hiện tại; giữ một tham chiếu cho cả lượt đọc để vị trí dòng không bị dời giữa chừng"""
+        return self._data
+
+    def __len__(self):
+        return len(self._data["columns"]['id'])
+
+    @property
+    def nbytes(self):
+        """Tổng dung lượng các cột (kể cả index)"""
+        data = self._data
+        arrays = list(data["columns"].values()) + [data["route_key"], data["id_order"], data["sorted_ids"]]
+        return sum(array.nbytes for array in arrays)
+
+    def row(self, i, data=None):
+        """Chuyển một dòng thành dict chuyến"""
+        cols = (data or self._data)["columns"]
+        return {
+            'id': cols['id'][i].decode('utf-8'),
+            'departure': self.city_names[cols['departure'][i]],
+            'destination': self.city_names[cols['destination'][i]],
+            'time': _format_minutes(int(cols['minute'][i])),
+            'date': Date.fromordinal(int(cols['date'][i])).isoformat(),
+            'available_seats': int(cols['seats'][i])
+        }
+
+    def index_of(self, schedule_id, data=None):
+        """Vị trí dòng của chuyến theo id (tìm nhị phân), None nếu không có hoặc đã xóa"""
+        data = data or self._data
+        sorted_ids = data["sorted_ids"]
+        key = str(schedule_id).encode('utf-8')
+        pos = np.searchsorted(sorted_ids, key)
+        if pos < len(sorted_ids) and sorted_ids[pos] == key:
+            i = int(data["id_order"][pos])
+            if data["columns"]['active'][i]:
+                return i
+        return None
+
+    def _route_range(self, data, departure, destination, first_ordinal, last_ordinal):
+        dep = self.city_codes.get(departure.strip().lower())
+        dest = self.city_codes.get(destination.strip().lower())
+        if dep is None or dest is None:
+            return 0, 0
+        low = self._make_key(dep, dest, first_ordinal)
+        high = self._make_key(dep, dest, last_ordinal)
+        return (int(np.searchsorted(data["route_key"], low, side='left')),
+                int(np.searchsorted(data["route_key"], high, side='right')))
+
+    def find_rows(self, departure, destination, date, quantity=1, data=None):
+        """Các dòng cùng tuyến, cùng ngày còn đủ `quantity` ghế"""
+        try:
+            ordinal = Date.fromisoformat(date).toordinal()
+        except (TypeError, ValueError):
+            return np.empty(0, dtype=np.int64)
+        data = data or self._data
+        start, end = self._route_range(data, departure, destination, ordinal, ordinal)
+        cols = data["columns"]
+        mask = (cols['seats'][start:end] >= quantity) & cols['active'][start:end]
+        return np.flatnonzero(mask) + start
+
+    def find_route_time_rows(self, departure, destination, time_str, quantity=1, data=None):
+        """Các dòng cùng tuyến, cùng giờ (mọi ngày) còn đủ `quantity` ghế"""
+        try:
+            minute = _parse_minutes(time_str)
+        except ValueError:
+            return np.empty(0, dtype=np.int64)
+        data = data or self._data
+        start, end = self._route_range(data, departure, destination, 0, _MAX_ORDINAL - 1)
+        cols = data["columns"]
+        mask = ((cols['minute'][start:end] == minute)
+                & (cols['seats'][start:end] >= quantity)
+                & cols['active'][start:end])
+        return np.flatnonzero(mask) + start
+
+
+class CatalogStorage:
+    """
+    Storage backend dùng ScheduleCatalog cho chuyến và dict cho vé (số vé nhỏ hơn nhiều số chuyến).
+    Số ghế được cập nhật trực tiếp trong cột NumPy dưới lock phân dải theo dòng.
+    Thêm chuyến dựng snapshot mới của danh mục nên giữ toàn bộ lock ghế; các thao tác ghế kiểm tra
+    lại snapshot sau khi lấy lock và thử lại nếu nó đã bị thay (dòng có thể đã bị dời chỗ).
+    Các thao tác chỉ đọc lấy một snapshot và dùng nó cho cả lượt, không cần lock.
+    Thứ tự kết quả là theo (ngày, thứ tự trong file) của từng tuyến.
+    """
+    SEAT_LOCK_STRIPES = 256
+    BOOKING_LOCK_STRIPES = 64
+
+    def __init__(self, catalog, ticket_codes=None):
+        self.catalog = catalog
+        self.ticket_codes = ticket_codes or TicketCodeGenerator()
+        self.bookings = {}
+        self._seat_locks = [threading.Lock() for _ in range(self.SEAT_LOCK_STRIPES)]
+        self._booking_locks = [threading.Lock() for _ in range(self.BOOKING_LOCK_STRIPES)]
+
+    @property
+    def _seats(self):
+        # Chỉ dùng khi đang giữ lock ghế: snapshot không thể bị thay trong lúc đó
+        return self.catalog.snapshot["columns"]['seats']
+
+    def _booking_lock(self, ticket_code):
+        return self._booking_locks[hash(ticket_code) % self.BOOKING_LOCK_STRIPES]
+
+    @contextmanager
+    def _locked_rows(self, schedule_ids):
+        """
+        Lấy lock ghế (theo thứ tự dải) cho các chuyến và trả về vị trí dòng của chúng
+        (None cho chuyến không tồn tại). Vị trí luôn hợp lệ trong suốt khối with.
+        """
+        while True:
+            data = self.catalog.snapshot
+            rows = [self.catalog.index_of(schedule_id, data) for schedule_id in schedule_ids]
+            stripes = {row % self.SEAT_LOCK_STRIPES for row in rows if row is not None}
+            if None in rows:
+                # Không tìm thấy có thể do đang dựng lại cột: giữ một lock để chờ việc dựng lại xong
+                stripes.add(0)
+            stripes = sorted(stripes)
+            locks = [self._seat_locks[i] for i in stripes]
+            for lock in locks:
+                lock.acquire()
+            try:
+                if self.catalog.snapshot is data:
+                    yield rows
+                    return
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    @property
+    def schedules(self):
+        """Danh sách tất cả chuyến còn hoạt động (tạo dict cho từng dòng, chỉ dùng cho dữ liệu nhỏ)"""
+        data = self.catalog.snapshot
+        active = np.flatnonzero(data["columns"]['active'])
+        return [self.catalog.row(i, data) for i in active]
+
+    def add_schedule(self, schedule):
+        """Thêm (hoặc thay thế) một chuyến"""
+        self.add_schedules([schedule])
+
+    def add_schedules(self, schedules):
+        """Thêm nhiều chuyến rồi sắp xếp và dựng lại index một lần"""
+        schedules = list(schedules)
+        for lock in self._seat_locks:
+            lock.acquire()
+        try:
+            active = self.catalog.snapshot["columns"]['active']
+            for schedule in schedules:
+                row = self.catalog.index_of(schedule['id'])
+                if row is not None:
+                    active[row] = False
+            self.catalog.append_rows(schedules)
+            self.catalog.finalize()
+        finally:
+            for lock in reversed(self._seat_locks):
+                lock.release()
+
+    def remove_schedule(self, schedule_id):
+        """Đánh dấu một chuyến là đã xóa"""
+        with self._locked_rows([schedule_id]) as (row,):
+            if row is None:
+                return None
+            schedule = self.catalog.row(row)
+            self.catalog.snapshot["columns"]['active'][row] = False
+        return schedule
+
+    def get_schedule(self, schedule_id):
+        """Lấy chuyến theo id"""
+        data = self.catalog.snapshot
+        row = self.catalog.index_of(schedule_id, data)
+        return self.catalog.row(row, data) if row is not None else None
+
+    def find_available_schedules(self, departure, destination, date, quantity=1):
+        """Tìm chuyến có sẵn"""
+        data = self.catalog.snapshot
+        return [self.catalog.row(i, data) for i in self.catalog.find_rows(departure, destination, date, quantity, data)]
+
+    def book_ticket(self, schedule_id, quantity, passenger_info):
+        """Đặt vé"""
+        with self._locked_rows([schedule_id]) as (row,):
+            if row is None or self._seats[row] < quantity:
+                return None, "Không đủ chỗ trống"
+            self._seats[row] -= quantity
+            schedule = self.catalog.row(row)
+
+        ticket_code = self.ticket_codes.next_code()
+        self.bookings[ticket_code] = {
+            'ticket_code': ticket_code,
+            'schedule_id': schedule['id'],
+            'departure': schedule['departure'],
+            'destination': schedule['destination'],
+            'time': schedule['time'],
+            'date': schedule['date'],
+            'quantity': quantity,
+            'status': 'booked'
+        }
+        return ticket_code, "Đặt vé thành công"
+
+    def get_booking(self, ticket_code):
+        """Lấy thông tin booking"""
+        return self.bookings.get(ticket_code)
+
+    def cancel_ticket(self, ticket_code):
+        """Hủy vé"""
+        booking = self.bookings.get(ticket_code)
+        if not booking:
+            return False, "Không tìm thấy vé"
+
+        with self._booking_lock(ticket_code):
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+            booking['status'] = 'cancelled'
+            with self._locked_rows([booking['schedule_id']]) as (row,):
+                if row is not None:
+                    self._seats[row] += booking['quantity']
+
+        return True, "Hủy vé thành công"
+
+    def change_time(self, ticket_code, new_time):
+        """Đổi giờ: trả ghế chuyến cũ và giữ ghế chuyến mới trong cùng một thao tác nguyên tử"""
+        booking = self.bookings.get(ticket_code)
+        if not booking:
+            return False, "Không tìm thấy vé"
+
+        with self._booking_lock(ticket_code):
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+
+            quantity = booking['quantity']
+            data = self.catalog.snapshot
+            candidates = [
+                data["columns"]['id'][i].decode('utf-8')
+                for i in self.catalog.find_route_time_rows(
+                    booking['departure'], booking['destination'], new_time, quantity, data
+                )
+            ]
+            for new_id in candidates:
+                with self._locked_rows([booking['schedule_id'], new_id]) as (old_row, new_row):
+                    if new_row is None:
+                        continue
+                    # Chuyến cũ và mới trùng nhau thì số ghế trả lại đủ cho chính nó
+                    seats = int(self._seats[new_row])
+                    if new_row == old_row:
+                        seats += quantity
+                    if seats < quantity:
+                        continue
+                    if old_row is not None:
+                        self._seats[old_row] += quantity
+                    self._seats[new_row] -= quantity
+                    schedule = self.catalog.row(new_row)
+
+                booking['schedule_id'] = schedule['id']
+                booking['time'] = schedule['time']
+                return True, f"Đổi giờ thành công sang {new_time}"
+
+        return False, f"Không có chuyến lúc {new_time}"
@@ -0,0 +1,117 @@
+import re
+from collections import deque
+
+from src.__modules.nlp.tokens import estimate_tokens
+
+DEFAULT_HEADING = "Giới thiệu chung"
+# File được đọc theo từng khối ký tự; dòng dài hơn một khối được cắt sau câu trọn vẹn cuối cùng
+READ_BLOCK_SIZE = 1 << 16
+
+_HEADING_PATTERN = re.compile(r"^\s*(#{1,6})\s+(.*\S)")
+_NOISE_PATTERN = re.compile(r"📄")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…;])\s+")
+
+def read_lines(file, block_size: int = READ_BLOCK_SIZE):
+    """Các dòng của file text, đọc từng khối nên bộ nhớ không phụ thuộc độ dài file hay độ dài dòng
+    (dòng dài hơn block_size được trả về thành nhiều phần)"""
+    carry = ""
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        lines = (carry + block).split("\n")
+        carry = lines.pop()
+        yield from lines
+        if len(carry) > block_size:
+            # Ưu tiên cắt sau câu cuối cùng đã trọn vẹn, không có thì tại khoảng trắng cuối cùng
+            boundary = None
+            for boundary in _SENTENCE_BOUNDARY.finditer(carry):
+                pass
+            cut = boundary.start() if boundary else carry.rfind(" ")
+            cut = cut if cut > 0 else len(carry)
+            yield carry[:cut]
+            carry = carry[cut:]
+    if carry:
+        yield carry
+
+def _split_words(sentence, max_tokens, count_tokens):
+    """Cắt câu dài hơn max_tokens thành các phần theo từ"""
+    words, used = [], 0
+    for word in sentence.split(" "):
+        cost = count_tokens(word)
+        if words and used + cost > max_tokens:
+            yield " ".join(words)
+            words, used = [], 0
+        words.append(word)
+        used += cost
+    if words:
+        yield " ".join(words)
+
+def _iter_sentences(lines):
+    """Câu (đã làm sạch) theo thứ tự trong file; None đánh dấu một tiêu đề mới, kèm đường dẫn tiêu đề"""
+    levels, titles = [], []
+    for line in lines:
+        match = _HEADING_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            while levels and levels[-1] >= level:
+                levels.pop()
+                titles.pop()
+            levels.append(level)
+            titles.append(match.group(2).strip())
+            yield tuple(titles), None
+            continue
+        text = _WHITESPACE_PATTERN.sub(" ", _NOISE_PATTERN.sub("", line)).strip()
+        if text:
+            for sentence in _SENTENCE_BOUNDARY.split(text):
+                yield None, sentence
+
+def iter_chunks(lines, max_tokens: int = 512, overlap_tokens: int = 64, count_tokens=estimate_tokens):
+    """
+    Chia tài liệu (iterable các dòng, tiêu đề dạng markdown #..######) thành chunk, trả về dần (chunk, metadata).
+
+    Mỗi mục dưới một tiêu đề được ghép theo câu thành các chunk không quá `max_tokens` token; chunk sau
+    lặp lại các câu cuối của chunk trước (tối đa `overlap_tokens` token) để câu trả lời nằm giữa hai chunk
+    vẫn tìm được. Câu dài hơn max_tokens được cắt theo từ. metadata gồm "source" (tiêu đề gần nhất),
+    "heading_path" (các tiêu đề cha, nối bằng " > ") và "chunk_index" (thứ tự chunk trong mục).
+    Chỉ giữ trong bộ nhớ các câu của chunk đang ghép.
+    """
+    path = (DEFAULT_HEADING,)
+    window = deque()  # (câu, số token)
+    size = fresh = index = 0
+
+    def chunk():
+        metadata = {"source": path[-1], "heading_path": " > ".join(path), "chunk_index": index}
+        return " ".join(sentence for sentence, _ in window), metadata
+
+    for heading, sentence in _iter_sentences(lines):
+        if heading is not None:
+            if fresh:
+                yield chunk()
+            path, window, size, fresh, index = heading, deque(), 0, 0, 0
+            continue
+
+        cost = count_tokens(sentence)
+        pieces = [(sentence, cost)] if cost <= max_tokens else [
+            (piece, count_tokens(piece)) for piece in _split_words(sentence, max_tokens, count_tokens)
+        ]
+        for piece, cost in pieces:
+            if fresh and size + cost > max_tokens:
+                yield chunk()
+                index += 1
+                fresh = 0
+                # Giữ lại phần đuôi làm đoạn chồng lấn, chừa chỗ cho câu mới
+                while window and (size > overlap_tokens or size + cost > max_tokens):
+                    size -= window.popleft()[1]
+            window.append((piece, cost))
+            size += cost
+            fresh += 1
+
+    if fresh:
+        yield chunk()
+
+def iter_file_chunks(path: str, block_size: int = READ_BLOCK_SIZE, **kwargs):
+    """iter_chunks trên một file, đọc dần từng khối"""
+    with open(path, "r", encoding="utf-8") as file:
+        yield from iter_chunks(read_lines(file, block_size), **kwargs)
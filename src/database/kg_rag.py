@@ -6,8 +6,13 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.insert(0, project_root)
 
 from config.settings import config
-import re
 import json
+import hashlib
+import threading
+from fuzzywuzzy import fuzz, utils
+from src.__modules.nlp.normalization import memoized, normalize_unicode
+from src.database.vector_index import NumpyVectorIndex
+from src.database.chunker import iter_chunks, iter_file_chunks
 
 # Sử dụng đường dẫn tương đối từ thư mục gốc
 document_text_path = "src/database/docs/vexere_policy_structured.txt"
@@ -15,72 +20,112 @@ faq_data_path = "src/database/docs/vexere_support_data.json"
 
 def create_semantic_chunks(text):
     """
-    Hàm này chia văn bản thành các đoạn (chunks) dựa trên các tiêu đề (##).
-    Mỗi chunk sẽ chứa nội dung dưới một tiêu đề và metadata là chính tiêu đề đó.
+    Chia văn bản thành các chunk theo tiêu đề (#..######), mỗi chunk không quá CHUNK_MAX_TOKENS token.
+    Trả về (danh sách chunk, danh sách metadata); khi index dùng iter_file_chunks để không nạp cả file.
     """
-    parts = re.split(r'(## .*)', text)
     chunks = []
     metadatas = []
-    current_heading = "Giới thiệu chung"
-
-    if parts[0].strip() == "":
-        parts = parts[1:]
-
-    for i in range(len(parts)):
-        part = parts[i].strip()
-        if part.startswith("##"):
-            current_heading = part.replace("##", "").strip()
-        elif part:
-            cleaned_text = re.sub(r'📄', '', part).strip()
-            cleaned_text = re.sub(r'\s{2,}', ' ', cleaned_text)
-            chunks.append(cleaned_text)
-            metadatas.append({"source": current_heading})
-            
+    for chunk, metadata in iter_chunks(text.splitlines(), **_chunk_options()):
+        chunks.append(chunk)
+        metadatas.append(metadata)
     return chunks, metadatas
 
+def _chunk_options():
+    return {"max_tokens": config.CHUNK_MAX_TOKENS, "overlap_tokens": config.CHUNK_OVERLAP_TOKENS}
+
+def chunk_id(chunk, metadata):
+    """
+    Sinh id ổn định cho một chunk từ hash nội dung kèm toàn bộ metadata (JSON sắp theo khóa),
+    nên hai chunk cùng nội dung ở hai mục/vị trí khác nhau không trùng id.
+    Chunk không đổi giữa các lần khởi động sẽ giữ nguyên id nên không cần embed lại.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    digest.update(b"\n")
+    digest.update(chunk.encode("utf-8"))
+    return f"chunk_{digest.hexdigest()[:32]}"
+
+# Index vector trong process cho VECTOR_BACKEND=numpy, cùng khoảng cách với collection
+policy_index = NumpyVectorIndex(
+    dtype=config.VECTOR_DTYPE,
+    metric=(config.collection.metadata or {}).get("hnsw:space", "l2")
+)
+
 def policy_kg():
-    """Khởi tạo knowledge graph từ file policy"""
+    """
+    Khởi tạo/cập nhật index chính sách từ file policy.
+    Mỗi chunk được định danh bằng hash nội dung: chỉ các chunk mới hoặc đã thay đổi
+    được embed, các id không còn trong file sẽ bị xóa khỏi collection.
+    Với VECTOR_BACKEND=numpy, index trong process được nạp lại từ collection sau khi cập nhật.
+    """
+    _update_policy_collection()
+    if config.VECTOR_BACKEND == "numpy":
+        policy_index.load_collection(config.collection)
+        stats = policy_index.stats()
+        print(f"Index numpy: {stats['documents']} chunk, {stats['dtype']}, {stats['matrix_bytes'] / 1024:.0f} KB.")
+
+def _update_policy_collection():
     if not os.path.exists(document_text_path):
         print(f"File không tồn tại: {document_text_path}")
         return
-        
-    with open(document_text_path, "r", encoding="utf-8") as file:
-        document_text = file.read()
-
-    chunks, metadatas = create_semantic_chunks(document_text)
-
-    print(f"Đã tạo ra {len(chunks)} đoạn văn bản (chunks).")
-
-    print("\nĐang tải mô hình embedding 'Alibaba-NLP/gte-multilingual-base'...")
-    # LƯU Ý: Lần đầu tiên chạy, quá trình tải mô hình này có thể mất vài phút.
-    # trust_remote_code=True là bắt buộc để mô hình này hoạt động.
-    model = config.model
-    print("Mô hình đã được tải.")
 
-    # Tạo embeddings cho tất cả các chunks
-    print("Đang tạo embeddings cho các chunks...")
-    embeddings = model.encode(chunks, show_progress_bar=True)
-    print(f"Đã tạo xong {len(embeddings)} embeddings.")
-
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
-
-    # Thêm dữ liệu vào collection
+    existing_ids = set(config.collection.get(include=[])["ids"])
+    seen_ids = set()
+    batch = []
+    total = added = 0
+
+    # Đọc file và chia chunk dần; chunk mới/thay đổi được embed và thêm theo từng batch
+    # nên bộ nhớ không phụ thuộc kích thước tài liệu
+    for chunk, metadata in iter_file_chunks(document_text_path, **_chunk_options()):
+        total += 1
+        doc_id = chunk_id(chunk, metadata)
+        # Bỏ các chunk trùng lặp hoàn toàn và các chunk đã có trong collection
+        if doc_id in seen_ids:
+            continue
+        seen_ids.add(doc_id)
+        if doc_id in existing_ids:
+            continue
+        batch.append((doc_id, chunk, metadata))
+        if len(batch) >= config.INDEX_BATCH_SIZE:
+            added += _add_policy_batch(batch)
+            batch = []
+    if batch:
+        added += _add_policy_batch(batch)
+
+    print(f"Đã tạo ra {total} đoạn văn bản (chunks).")
+
+    stale_ids = [i for i in existing_ids if i not in seen_ids]
+    if stale_ids:
+        config.collection.delete(ids=stale_ids)
+        print(f"Đã xóa {len(stale_ids)} chunk không còn trong tài liệu.")
+
+    if not added:
+        print(f"Index đã cập nhật, không có chunk mới ({config.collection.count()} tài liệu).")
+        return
+    print(f"Đã thêm thành công {added} chunk, collection hiện có {config.collection.count()} tài liệu.")
+
+def _add_policy_batch(batch):
+    """Embed một batch chunk mới (id, chunk, metadata) và thêm vào collection"""
+    ids = [doc_id for doc_id, _, _ in batch]
+    chunks = [chunk for _, chunk, _ in batch]
+    metadatas = [metadata for _, _, metadata in batch]
+    print(f"Đang tạo embeddings cho {len(chunks)} chunks mới...")
+    embeddings = config.model.encode(chunks, batch_size=config.INDEX_BATCH_SIZE)
     config.collection.add(
         embeddings=embeddings,
         documents=chunks,
         metadatas=metadatas,
         ids=ids
     )
+    return len(ids)
 
-    print(f"Đã thêm thành công {config.collection.count()} tài liệu vào ChromaDB.")
-
-def faq_kg():
+def faq_kg(path=faq_data_path):
     """Tải FAQ knowledge graph"""
-    if not os.path.exists(faq_data_path):
-        print(f"File FAQ không tồn tại: {faq_data_path}")
+    if not os.path.exists(path):
+        print(f"File FAQ không tồn tại: {path}")
         return {}
         
-    with open(faq_data_path, "r", encoding="utf-8") as file:
+    with open(path, "r", encoding="utf-8") as file:
         faq_data = json.load(file)
     
     # Lọc ra các FAQ có content
@@ -89,4 +134,86 @@ def faq_kg():
         if value.get('content') and len(value['content']) > 0
     }
 
-    return faq_data
\ No newline at end of file
+    return faq_data
+
+@memoized
+def _process_faq_text(text):
+    """
+    Chuẩn hóa giống hệt pipeline mặc định của process.extractOne
+    (full_process rồi full_process(force_ascii=True)) để điểm số không đổi.
+    Text được đưa về NFC trước: force_ascii bỏ cả chữ có dấu dựng sẵn nhưng chỉ bỏ dấu rời,
+    nên cùng một câu gõ dạng tổ hợp sẽ cho khóa khác với câu hỏi FAQ.
+    Có cache vì khách thường hỏi lại đúng các câu giống nhau.
+    """
+    return utils.full_process(utils.full_process(normalize_unicode(text)), force_ascii=True)
+
+class FAQIndex:
+    """
+    Index FAQ dùng chung trong process: đọc file JSON một lần, chuẩn hóa sẵn các câu hỏi
+    và tự nạp lại khi file thay đổi (theo mtime).
+    """
+    def __init__(self, path=faq_data_path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.entries = {}
+        self._keys = []        # (câu hỏi đã chuẩn hóa, câu hỏi gốc)
+        self._exact = {}       # câu hỏi đã chuẩn hóa -> câu hỏi gốc
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh_if_changed(self):
+        mtime = self._current_mtime()
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            entries = faq_kg(self.path)
+            keys = []
+            exact = {}
+            for question in entries:
+                processed = _process_faq_text(question)
+                keys.append((processed, question))
+                exact.setdefault(processed, question)
+            # Gán một lượt để các thread đang đọc luôn thấy dữ liệu nhất quán
+            self.entries, self._keys, self._exact = entries, keys, exact
+            self._mtime = mtime
+
+    def match(self, query_text):
+        """
+        Tìm câu hỏi FAQ gần nhất với query.
+        Trả về (câu hỏi gốc, điểm) như process.extractOne, hoặc (None, 0) nếu không có FAQ.
+        """
+        self._refresh_if_changed()
+        keys, exact = self._keys, self._exact
+        if not keys:
+            return None, 0
+
+        processed_query = _process_faq_text(query_text)
+        if processed_query in exact:
+            return exact[processed_query], 100
+
+        # Chấm điểm tất cả câu hỏi trong một lượt, giữ kết quả đầu tiên nếu bằng điểm
+        best_question, best_score = None, -1
+        for processed, question in keys:
+            score = fuzz.WRatio(processed_query, processed, full_process=False)
+            if score > best_score:
+                best_question, best_score = question, score
+                if score == 100:
+                    break
+        return best_question, best_score
+
+    def answer(self, question):
+        """Lấy nội dung trả lời của một câu hỏi FAQ"""
+        content = self.entries[question]['content']
+        if isinstance(content, list):
+            return "\n".join(content)
+        return content
+
+# Index FAQ dùng chung cho toàn bộ process
+faq_index = FAQIndex()
@@ -1,140 +1,127 @@
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from src.database.storage import TicketCodeGenerator, InMemoryStorage, SQLiteStorage
+from src.__modules.core.tracing import tracer
+
+# Dữ liệu chuyến mẫu để demo
+DEFAULT_SCHEDULES = [
+    {
+        'id': 'TN001',
+        'departure': 'hà nội',
+        'destination': 'sài gòn',
+        'time': '08:00',
+        'date': '2025-09-05',
+        'available_seats': 50
+    },
+    {
+        'id': 'TN002', 
+        'departure': 'hà nội',
+        'destination': 'sài gòn',
+        'time': '09:00',  # THÊM CHUYẾN 9H
+        'date': '2025-09-05',
+        'available_seats': 30
+    },
+    {
+        'id': 'TN003',
+        'departure': 'hà nội',
+        'destination': 'sài gòn',
+        'time': '14:00',
+        'date': '2025-09-05',
+        'available_seats': 30
+    },
+    {
+        'id': 'TN004',
+        'departure': 'sài gòn',
+        'destination': 'hà nội', 
+        'time': '09:00',
+        'date': '2025-09-05',
+        'available_seats': 40
+    }
+]
+
+def create_storage(schedules=None, ticket_codes=None):
+    """
+    Tạo storage backend theo biến môi trường DATABASE_BACKEND:
+    "memory" (mặc định, dữ liệu trong process) hoặc "sqlite" (file DATABASE_PATH, chế độ WAL,
+    dùng chung được giữa các worker và giữ dữ liệu qua restart) hoặc "catalog" (danh mục cột NumPy
+    cho lịch chạy rất lớn, nạp từ SCHEDULE_CATALOG_PATH dạng CSV/JSONL nếu có).
+    Khi CLUSTER_MODE bật mặc định là "sqlite" vì dữ liệu trong process không dùng chung được giữa các worker.
+    """
+    schedules = DEFAULT_SCHEDULES if schedules is None else schedules
+    cluster_mode = os.getenv("CLUSTER_MODE", "false").lower() == "true"
+    backend = os.getenv("DATABASE_BACKEND", "sqlite" if cluster_mode else "memory")
+    if cluster_mode and backend != "sqlite":
+        print(f"⚠️ DATABASE_BACKEND={backend} chỉ lưu vé trong từng worker, không dùng chung được ở chế độ cluster")
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("DATABASE_PATH", "vexere.db"), schedules, ticket_codes)
+    if backend == "catalog":
+        from src.database.catalog import ScheduleCatalog, CatalogStorage
+        path = os.getenv("SCHEDULE_CATALOG_PATH")
+        catalog = ScheduleCatalog.load(path) if path else ScheduleCatalog.from_schedules(schedules)
+        return CatalogStorage(catalog, ticket_codes)
+    if backend != "memory":
+        raise ValueError(f"DATABASE_BACKEND không hợp lệ: {backend}")
+    return InMemoryStorage(schedules, ticket_codes)
+
 class SimpleDatabase:
-    """Database đơn giản để demo"""
-    def __init__(self):
-        self.schedules = [
-            {
-                'id': 'TN001',
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '08:00',
-                'date': '2025-09-05',
-                'available_seats': 50
-            },
-            {
-                'id': 'TN002', 
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '09:00',  # THÊM CHUYẾN 9H
-                'date': '2025-09-05',
-                'available_seats': 30
-            },
-            {
-                'id': 'TN003',
-                'departure': 'hà nội',
-                'destination': 'sài gòn',
-                'time': '14:00',
-                'date': '2025-09-05',
-                'available_seats': 30
-            },
-            {
-                'id': 'TN004',
-                'departure': 'sài gòn',
-                'destination': 'hà nội', 
-                'time': '09:00',
-                'date': '2025-09-05',
-                'available_seats': 40
-            }
-        ]
-        self.bookings = {}
+    """
+    Database đơn giản để demo.
+    Giữ nguyên API mà ConversationManager sử dụng, phần lưu trữ được ủy quyền cho một storage backend.
+    """
+    def __init__(self, schedules=None, ticket_codes=None, storage=None):
+        self.storage = storage if storage is not None else create_storage(schedules, ticket_codes)
+
+    @property
+    def schedules(self):
+        """Danh sách tất cả chuyến theo thứ tự thêm vào"""
+        return self.storage.schedules
+
+    def add_schedule(self, schedule):
+        """Thêm (hoặc thay thế) một chuyến"""
+        self.storage.add_schedule(schedule)
+
+    def add_schedules(self, schedules):
+        """Thêm nhiều chuyến trong một lần ghi"""
+        self.storage.add_schedules(schedules)
+
+    def remove_schedule(self, schedule_id):
+        """Xóa một chuyến"""
+        return self.storage.remove_schedule(schedule_id)
+
+    @tracer.traced("storage.get_schedule")
+    def get_schedule(self, schedule_id):
+        """Lấy chuyến theo id"""
+        return self.storage.get_schedule(schedule_id)
     
+    @tracer.traced("storage.find_available_schedules")
     def find_available_schedules(self, departure, destination, date, quantity=1):
         """Tìm chuyến có sẵn"""
-        available = []
-        for schedule in self.schedules:
-            if (schedule['departure'] == departure.lower() and 
-                schedule['destination'] == destination.lower() and
-                schedule['date'] == date and
-                schedule['available_seats'] >= quantity):
-                available.append(schedule)
-        return available
+        return self.storage.find_available_schedules(departure, destination, date, quantity)
     
+    @tracer.traced("storage.book_ticket")
     def book_ticket(self, schedule_id, quantity, passenger_info):
         """Đặt vé"""
-        # Tìm schedule
-        schedule = None
-        for s in self.schedules:
-            if s['id'] == schedule_id:
-                schedule = s
-                break
-        
-        if not schedule or schedule['available_seats'] < quantity:
-            return None, "Không đủ chỗ trống"
-        
-        # Tạo mã vé
-        ticket_code = f"VN{len(self.bookings)+1:06d}"
-        
-        # Lưu booking
-        self.bookings[ticket_code] = {
-            'ticket_code': ticket_code,
-            'schedule_id': schedule_id,
-            'departure': schedule['departure'],
-            'destination': schedule['destination'],
-            'time': schedule['time'],
-            'date': schedule['date'],
-            'quantity': quantity,
-            'status': 'booked'
-        }
-        
-        # Giảm ghế trống
-        schedule['available_seats'] -= quantity
-        
-        return ticket_code, "Đặt vé thành công"
+        return self.storage.book_ticket(schedule_id, quantity, passenger_info)
     
+    @tracer.traced("storage.get_booking")
     def get_booking(self, ticket_code):
         """Lấy thông tin booking"""
-        return self.bookings.get(ticket_code)
+        return self.storage.get_booking(ticket_code)
     
+    @tracer.traced("storage.cancel_ticket")
     def cancel_ticket(self, ticket_code):
         """Hủy vé"""
-        booking = self.bookings.get(ticket_code)
-        if not booking:
-            return False, "Không tìm thấy vé"
-        
-        if booking['status'] == 'cancelled':
-            return False, "Vé đã được hủy"
-        
-        # Hủy vé
-        booking['status'] = 'cancelled'
-        
-        # Hoàn ghế
-        for schedule in self.schedules:
-            if schedule['id'] == booking['schedule_id']:
-                schedule['available_seats'] += booking['quantity']
-                break
-        
-        return True, "Hủy vé thành công"
+        return self.storage.cancel_ticket(ticket_code)
     
+    @tracer.traced("storage.change_time")
     def change_time(self, ticket_code, new_time):
         """Đổi giờ"""
-        booking = self.bookings.get(ticket_code)
-        if not booking:
-            return False, "Không tìm thấy vé"
-        
-        # Tìm chuyến mới cùng tuyến
-        new_schedule = None
-        for schedule in self.schedules:
-            if (schedule['departure'] == booking['departure'] and
-                schedule['destination'] == booking['destination'] and 
-                schedule['time'] == new_time and
-                schedule['available_seats'] >= booking['quantity']):
-                new_schedule = schedule
-                break
-        
-        if not new_schedule:
-            return False, f"Không có chuyến lúc {new_time}"
-        
-        # Hoàn ghế cho chuyến cũ
-        for schedule in self.schedules:
-            if schedule['id'] == booking['schedule_id']:
-                schedule['available_seats'] += booking['quantity']
-                break
-        
-        # Đặt chỗ chuyến mới
-        new_schedule['available_seats'] -= booking['quantity']
-        booking['schedule_id'] = new_schedule['id']
-        booking['time'] = new_time
-        
-        return True, f"Đổi giờ thành công sang {new_time}"
+        return self.storage.change_time(ticket_code, new_time)
 
 def normalize_time(time_str):
     """Chuẩn hóa format thời gian"""
@@ -162,4 +149,4 @@ def normalize_time(time_str):
     return time_str
 
 # Khởi tạo database
-db = SimpleDatabase()
\ No newline at end of file
+db = SimpleDatabase()
@@ -0,0 +1,454 @@
+import itertools
+import os
+import sqlite3
+import threading
+
+
+class TicketCodeGenerator:
+    """
+    Sinh mã vé tăng dần và không trùng giữa các shard (worker/node).
+    Shard `shard_id` trong `shard_count` shard chỉ dùng các số seq * shard_count + shard_id + 1,
+    nên các shard không bao giờ cấp trùng số; với một shard duy nhất mã vé là VN000001, VN000002, ...
+    """
+    def __init__(self, prefix="VN", shard_id=None, shard_count=None, start=0):
+        self.prefix = prefix
+        self.shard_id = int(os.getenv("TICKET_SHARD_ID", "0")) if shard_id is None else shard_id
+        self.shard_count = int(os.getenv("TICKET_SHARD_COUNT", "1")) if shard_count is None else shard_count
+        if not 0 <= self.shard_id < self.shard_count:
+            raise ValueError(f"shard_id {self.shard_id} phải nằm trong [0, {self.shard_count})")
+        self._counter = itertools.count(start)
+        self._lock = threading.Lock()
+
+    def format(self, seq):
+        """Mã vé ứng với số thứ tự `seq` (bắt đầu từ 0) của shard"""
+        return f"{self.prefix}{seq * self.shard_count + self.shard_id + 1:06d}"
+
+    def next_code(self):
+        """Lấy mã vé tiếp theo của shard"""
+        with self._lock:
+            seq = next(self._counter)
+        return self.format(seq)
+
+class InMemoryStorage:
+    """
+    Lưu chuyến và vé trong bộ nhớ của process (mất khi restart).
+    Ngoài bảng chuyến chính (theo id) còn có các index phụ theo (tuyến, ngày) và (tuyến, giờ),
+    được cập nhật ở mọi thao tác thêm/xóa chuyến nên các truy vấn không phải quét toàn bộ danh sách.
+
+    An toàn khi gọi từ nhiều thread: số ghế của mỗi chuyến được bảo vệ bởi lock riêng của chuyến đó,
+    các thao tác trên một vé (hủy, đổi giờ) được tuần tự hóa bằng lock theo mã vé. Khi cần nhiều lock,
+    luôn lấy lock vé trước rồi đến lock chuyến theo thứ tự id để không bị deadlock.
+    """
+    BOOKING_LOCK_STRIPES = 64
+
+    def __init__(self, schedules, ticket_codes=None):
+        self._schedules_by_id = {}
+        self._schedules_by_route_date = {}  # (departure, destination, date) -> [schedule]
+        self._schedules_by_route_time = {}  # (departure, destination, time) -> [schedule]
+        self._schedule_locks = {}           # schedule id -> Lock
+        self._index_lock = threading.Lock()
+        self._booking_locks = [threading.Lock() for _ in range(self.BOOKING_LOCK_STRIPES)]
+        self.ticket_codes = ticket_codes or TicketCodeGenerator()
+        self.bookings = {}
+
+        for schedule in schedules:
+            self.add_schedule(dict(schedule))
+
+    @property
+    def schedules(self):
+        """Danh sách tất cả chuyến theo thứ tự thêm vào"""
+        return list(self._schedules_by_id.values())
+
+    @staticmethod
+    def _route_date_key(schedule):
+        return (schedule['departure'], schedule['destination'], schedule['date'])
+
+    @staticmethod
+    def _route_time_key(schedule):
+        return (schedule['departure'], schedule['destination'], schedule['time'])
+
+    def add_schedule(self, schedule):
+        """Thêm một chuyến và cập nhật các index"""
+        with self._index_lock:
+            if schedule['id'] in self._schedules_by_id:
+                self._remove_schedule_locked(schedule['id'])
+            self._schedules_by_id[schedule['id']] = schedule
+            self._schedule_locks.setdefault(schedule['id'], threading.Lock())
+            self._schedules_by_route_date.setdefault(self._route_date_key(schedule), []).append(schedule)
+            self._schedules_by_route_time.setdefault(self._route_time_key(schedule), []).append(schedule)
+
+    def add_schedules(self, schedules):
+        """Thêm nhiều chuyến"""
+        for schedule in schedules:
+            self.add_schedule(dict(schedule))
+
+    def remove_schedule(self, schedule_id):
+        """Xóa một chuyến và cập nhật các index"""
+        with self._index_lock:
+            return self._remove_schedule_locked(schedule_id)
+
+    def _remove_schedule_locked(self, schedule_id):
+        schedule = self._schedules_by_id.pop(schedule_id, None)
+        if not schedule:
+            return None
+        for index, key in ((self._schedules_by_route_date, self._route_date_key(schedule)),
+                           (self._schedules_by_route_time, self._route_time_key(schedule))):
+            # Thay bucket mới thay vì sửa tại chỗ để các thread đang duyệt bucket cũ không bị ảnh hưởng
+            bucket = [s for s in index[key] if s is not schedule]
+            if bucket:
+                index[key] = bucket
+            else:
+                del index[key]
+        return schedule
+
+    def _booking_lock(self, ticket_code):
+        return self._booking_locks[hash(ticket_code) % self.BOOKING_LOCK_STRIPES]
+
+    def _reserve_seats(self, schedule, quantity):
+        """Giữ `quantity` ghế của chuyến một cách nguyên tử, trả về False nếu không đủ chỗ"""
+        with self._schedule_locks[schedule['id']]:
+            if schedule['available_seats'] < quantity:
+                return False
+            schedule['available_seats'] -= quantity
+            return True
+
+    def _release_seats(self, schedule, quantity):
+        """Trả lại `quantity` ghế cho chuyến"""
+        with self._schedule_locks[schedule['id']]:
+            schedule['available_seats'] += quantity
+
+    def get_schedule(self, schedule_id):
+        """Lấy chuyến theo id"""
+        return self._schedules_by_id.get(schedule_id)
+    
+    def find_available_schedules(self, departure, destination, date, quantity=1):
+        """Tìm chuyến có sẵn"""
+        candidates = self._schedules_by_route_date.get((departure.lower(), destination.lower(), date), [])
+        return [schedule for schedule in candidates if schedule['available_seats'] >= quantity]
+    
+    def book_ticket(self, schedule_id, quantity, passenger_info):
+        """Đặt vé"""
+        # Tìm schedule và giữ chỗ (kiểm tra + trừ ghế trong cùng một lock)
+        schedule = self._schedules_by_id.get(schedule_id)
+        
+        if not schedule or not self._reserve_seats(schedule, quantity):
+            return None, "Không đủ chỗ trống"
+        
+        # Tạo mã vé
+        ticket_code = self.ticket_codes.next_code()
+        
+        # Lưu booking
+        self.bookings[ticket_code] = {
+            'ticket_code': ticket_code,
+            'schedule_id': schedule_id,
+            'departure': schedule['departure'],
+            'destination': schedule['destination'],
+            'time': schedule['time'],
+            'date': schedule['date'],
+            'quantity': quantity,
+            'status': 'booked'
+        }
+        
+        return ticket_code, "Đặt vé thành công"
+    
+    def get_booking(self, ticket_code):
+        """Lấy thông tin booking"""
+        return self.bookings.get(ticket_code)
+    
+    def cancel_ticket(self, ticket_code):
+        """Hủy vé"""
+        booking = self.bookings.get(ticket_code)
+        if not booking:
+            return False, "Không tìm thấy vé"
+        
+        with self._booking_lock(ticket_code):
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+            
+            # Hủy vé
+            booking['status'] = 'cancelled'
+            
+            # Hoàn ghế
+            schedule = self._schedules_by_id.get(booking['schedule_id'])
+            if schedule:
+                self._release_seats(schedule, booking['quantity'])
+        
+        return True, "Hủy vé thành công"
+    
+    def change_time(self, ticket_code, new_time):
+        """Đổi giờ: trả ghế chuyến cũ và giữ ghế chuyến mới trong cùng một thao tác nguyên tử"""
+        booking = self.bookings.get(ticket_code)
+        if not booking:
+            return False, "Không tìm thấy vé"
+        
+        with self._booking_lock(ticket_code):
+            # Vé đã hủy không còn giữ ghế nên không thể đổi giờ
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+            
+            quantity = booking['quantity']
+            old_schedule = self._schedules_by_id.get(booking['schedule_id'])
+            
+            # Tìm chuyến mới cùng tuyến
+            key = (booking['departure'], booking['destination'], new_time)
+            for new_schedule in self._schedules_by_route_time.get(key, []):
+                if new_schedule['available_seats'] < quantity:
+                    continue
+                
+                # Lấy lock của cả hai chuyến theo thứ tự id rồi kiểm tra lại số ghế
+                schedule_ids = {new_schedule['id']}
+                if old_schedule:
+                    schedule_ids.add(old_schedule['id'])
+                locks = [self._schedule_locks[i] for i in sorted(schedule_ids)]
+                for lock in locks:
+                    lock.acquire()
+                try:
+                    # Chuyến cũ và mới trùng nhau thì số ghế trả lại đủ cho chính nó
+                    seats = new_schedule['available_seats']
+                    if old_schedule is new_schedule:
+                        seats += quantity
+                    if seats < quantity:
+                        continue
+                    
+                    # Hoàn ghế cho chuyến cũ
+                    if old_schedule:
+                        old_schedule['available_seats'] += quantity
+                    
+                    # Đặt chỗ chuyến mới
+                    new_schedule['available_seats'] -= quantity
+                    booking['schedule_id'] = new_schedule['id']
+                    booking['time'] = new_time
+                finally:
+                    for lock in reversed(locks):
+                        lock.release()
+                
+                return True, f"Đổi giờ thành công sang {new_time}"
+        
+        return False, f"Không có chuyến lúc {new_time}"
+
+
+class SQLiteStorage:
+    """
+    Lưu chuyến và vé trong SQLite ở chế độ WAL: dữ liệu giữ được qua restart và dùng chung
+    được giữa các uvicorn worker trên cùng máy; nhiều reader chạy song song với một writer.
+
+    Mỗi thread dùng một connection riêng; các câu SQL là hằng có tham số nên được sqlite3
+    cache dưới dạng prepared statement. Giữ chỗ là một câu UPDATE có điều kiện
+    (available_seats >= ?) trong transaction IMMEDIATE nên không thể bán quá số ghế,
+    kể cả khi nhiều process cùng ghi.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS schedules (
+            id TEXT PRIMARY KEY,
+            departure TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            time TEXT NOT NULL,
+            date TEXT NOT NULL,
+            available_seats INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedules_route_date ON schedules (departure, destination, date);
+        CREATE INDEX IF NOT EXISTS idx_schedules_route_time ON schedules (departure, destination, time);
+        CREATE TABLE IF NOT EXISTS bookings (
+            ticket_code TEXT PRIMARY KEY,
+            schedule_id TEXT NOT NULL,
+            departure TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            time TEXT NOT NULL,
+            date TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+    SCHEDULE_COLUMNS = "id, departure, destination, time, date, available_seats"
+
+    def __init__(self, path, schedules=(), ticket_codes=None):
+        self.path = path
+        self.ticket_codes = ticket_codes or TicketCodeGenerator()
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('ticket', 0)")
+        # Chỉ nạp dữ liệu mẫu khi chuyến chưa tồn tại, giữ nguyên số ghế đã lưu
+        self._insert_schedules(schedules, replace=False)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn())
+
+    def _insert_schedules(self, schedules, replace=True):
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        rows = (
+            (s['id'], s['departure'], s['destination'], s['time'], s['date'], s['available_seats'])
+            for s in schedules
+        )
+        with self._transaction() as conn:
+            conn.executemany(
+                f"{verb} INTO schedules ({self.SCHEDULE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @property
+    def schedules(self):
+        """Danh sách tất cả chuyến theo thứ tự thêm vào"""
+        rows = self._conn().execute(f"SELECT {self.SCHEDULE_COLUMNS} FROM schedules ORDER BY rowid")
+        return [dict(row) for row in rows]
+
+    def add_schedule(self, schedule):
+        """Thêm (hoặc thay thế) một chuyến"""
+        self._insert_schedules([schedule])
+
+    def add_schedules(self, schedules):
+        """Thêm nhiều chuyến trong một transaction"""
+        self._insert_schedules(schedules)
+
+    def remove_schedule(self, schedule_id):
+        """Xóa một chuyến"""
+        with self._transaction() as conn:
+            schedule = self._fetch_schedule(conn, schedule_id)
+            if schedule:
+                conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+        return schedule
+
+    def _fetch_schedule(self, conn, schedule_id):
+        row = conn.execute(
+            f"SELECT {self.SCHEDULE_COLUMNS} FROM schedules WHERE id = ?", (schedule_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_schedule(self, schedule_id):
+        """Lấy chuyến theo id"""
+        return self._fetch_schedule(self._conn(), schedule_id)
+
+    def find_available_schedules(self, departure, destination, date, quantity=1):
+        """Tìm chuyến có sẵn (dùng index theo tuyến + ngày)"""
+        rows = self._conn().execute(
+            f"SELECT {self.SCHEDULE_COLUMNS} FROM schedules "
+            "WHERE departure = ? AND destination = ? AND date = ? AND available_seats >= ? "
+            "ORDER BY rowid",
+            (departure.lower(), destination.lower(), date, quantity)
+        )
+        return [dict(row) for row in rows]
+
+    def book_ticket(self, schedule_id, quantity, passenger_info):
+        """Đặt vé: giữ chỗ, cấp mã vé và lưu booking trong cùng một transaction"""
+        with self._transaction() as conn:
+            reserved = conn.execute(
+                "UPDATE schedules SET available_seats = available_seats - ? "
+                "WHERE id = ? AND available_seats >= ?",
+                (quantity, schedule_id, quantity)
+            ).rowcount
+            if not reserved:
+                return None, "Không đủ chỗ trống"
+
+            schedule = self._fetch_schedule(conn, schedule_id)
+            ticket_code = self.ticket_codes.format(self._next_ticket_seq(conn))
+            conn.execute(
+                "INSERT INTO bookings (ticket_code, schedule_id, departure, destination, time, date, quantity, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'booked')",
+                (ticket_code, schedule_id, schedule['departure'], schedule['destination'],
+                 schedule['time'], schedule['date'], quantity)
+            )
+        return ticket_code, "Đặt vé thành công"
+
+    def _next_ticket_seq(self, conn):
+        # Số thứ tự được tăng trong transaction của booking nên không trùng giữa các process
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'ticket'")
+        return conn.execute("SELECT value FROM counters WHERE name = 'ticket'").fetchone()[0] - 1
+
+    def get_booking(self, ticket_code):
+        """Lấy thông tin booking"""
+        row = self._conn().execute(
+            "SELECT ticket_code, schedule_id, departure, destination, time, date, quantity, status "
+            "FROM bookings WHERE ticket_code = ?",
+            (ticket_code,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def cancel_ticket(self, ticket_code):
+        """Hủy vé và hoàn ghế trong cùng một transaction"""
+        with self._transaction() as conn:
+            booking = conn.execute(
+                "SELECT schedule_id, quantity, status FROM bookings WHERE ticket_code = ?", (ticket_code,)
+            ).fetchone()
+            if not booking:
+                return False, "Không tìm thấy vé"
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+
+            conn.execute("UPDATE bookings SET status = 'cancelled' WHERE ticket_code = ?", (ticket_code,))
+            conn.execute(
+                "UPDATE schedules SET available_seats = available_seats + ? WHERE id = ?",
+                (booking['quantity'], booking['schedule_id'])
+            )
+        return True, "Hủy vé thành công"
+
+    def change_time(self, ticket_code, new_time):
+        """Đổi giờ: trả ghế chuyến cũ và giữ ghế chuyến mới trong cùng một transaction"""
+        with self._transaction() as conn:
+            booking = conn.execute(
+                "SELECT schedule_id, departure, destination, quantity, status FROM bookings WHERE ticket_code = ?",
+                (ticket_code,)
+            ).fetchone()
+            if not booking:
+                return False, "Không tìm thấy vé"
+            if booking['status'] == 'cancelled':
+                return False, "Vé đã được hủy"
+
+            # Tìm chuyến mới cùng tuyến (dùng index theo tuyến + giờ)
+            new_schedule = conn.execute(
+                "SELECT id FROM schedules "
+                "WHERE departure = ? AND destination = ? AND time = ? AND available_seats >= ? "
+                "ORDER BY rowid LIMIT 1",
+                (booking['departure'], booking['destination'], new_time, booking['quantity'])
+            ).fetchone()
+            if not new_schedule:
+                return False, f"Không có chuyến lúc {new_time}"
+
+            if new_schedule['id'] != booking['schedule_id']:
+                conn.executemany(
+                    "UPDATE schedules SET available_seats = available_seats + ? WHERE id = ?",
+                    [(booking['quantity'], booking['schedule_id']),
+                     (-booking['quantity'], new_schedule['id'])]
+                )
+            conn.execute(
+                "UPDATE bookings SET schedule_id = ?, time = ? WHERE ticket_code = ?",
+                (new_schedule['id'], new_time, ticket_code)
+            )
+        return True, f"Đổi giờ thành công sang {new_time}"
+
+
+class _ImmediateTransaction:
+    """
+    Context manager cho transaction BEGIN IMMEDIATE: lấy write lock ngay từ đầu nên các bước
+    kiểm tra-rồi-ghi trong transaction không bị writer khác chen vào. Commit khi thoát bình thường
+    (kể cả bằng return), rollback khi có exception.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
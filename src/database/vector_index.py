@@ -0,0 +1,187 @@
+import threading
+
+import numpy as np
+
+# Số dòng ma trận được đổi sang float32 mỗi lần khi chấm điểm (giới hạn bộ nhớ tạm với corpus lớn)
+_SCORE_BLOCK_ROWS = 8192
+
+class NumpyVectorIndex:
+    """
+    Index vector trong process cho corpus nhỏ (vài trăm tới vài chục nghìn chunk), thay cho truy vấn Chroma.
+
+    Embedding được lưu trong một ma trận liền khối float32/float16/int8 (int8: lượng tử hóa đối xứng
+    theo từng dòng, kèm hệ số scale), chuẩn của từng dòng được tính sẵn. Mỗi truy vấn là một phép nhân
+    ma trận-vector rồi argpartition lấy top-k. Khoảng cách giống Chroma: "l2" là bình phương khoảng cách
+    Euclid (mặc định của collection), "cosine" là 1 - cosine, "ip" là 1 - tích vô hướng.
+    Kết quả query() có cùng dạng với collection.query() của Chroma.
+    """
+    DTYPES = ("float32", "float16", "int8")
+    METRICS = ("l2", "cosine", "ip")
+
+    def __init__(self, dtype: str = "int8", metric: str = "l2"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"dtype không hợp lệ: {dtype}")
+        if metric not in self.METRICS:
+            raise ValueError(f"metric không hợp lệ: {metric}")
+        self.dtype = dtype
+        self.metric = metric
+        self._lock = threading.Lock()
+        self._data = None  # snapshot bất biến, thay cả cụm khi build lại
+
+    def __len__(self):
+        data = self._data
+        return len(data["ids"]) if data else 0
+
+    def build(self, ids, embeddings, documents=None, metadatas=None):
+        """Dựng lại index từ toàn bộ embedding (thay thế dữ liệu cũ trong một lần gán)"""
+        ids = list(ids)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(ids), -1)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = [m or {} for m in metadatas] if metadatas is not None else [{} for _ in ids]
+
+        scales = None
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+            restored = matrix.astype(np.float32) * scales[:, None]
+        else:
+            matrix = vectors.astype(self.dtype)
+            restored = matrix.astype(np.float32)
+        # Chuẩn tính trên vector đã lượng tử hóa để khoảng cách nhất quán với phần tích vô hướng
+        squared_norms = np.einsum("ij,ij->i", restored, restored)
+
+        # Index ngược cho lọc metadata: trường -> giá trị -> các dòng
+        postings = {}
+        for row, metadata in enumerate(metadatas):
+            for key, value in metadata.items():
+                postings.setdefault(key, {}).setdefault(value, []).append(row)
+        postings = {
+            key: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+            for key, values in postings.items()
+        }
+
+        data = {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "matrix": np.ascontiguousarray(matrix),
+            "scales": scales,
+            "squared_norms": squared_norms,
+            "norms": np.sqrt(squared_norms),
+            "postings": postings,
+        }
+        with self._lock:
+            self._data = data
+
+    def load_collection(self, collection):
+        """Nạp toàn bộ embedding/document/metadata từ một collection Chroma"""
+        result = collection.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = result["embeddings"]
+        if embeddings is None or len(embeddings) == 0:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.build(result["ids"], embeddings, result["documents"], result["metadatas"])
+
+    def _dot(self, data, queries):
+        """Tích vô hướng queries (q, d) với mọi dòng: (q, n), đổi ma trận sang float32 theo từng khối"""
+        matrix, scales = data["matrix"], data["scales"]
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), _SCORE_BLOCK_ROWS):
+            block = matrix[start:start + _SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def _distances(self, data, queries):
+        dots = self._dot(data, queries)
+        if self.metric == "l2":
+            query_norms = np.einsum("ij,ij->i", queries, queries)
+            return np.maximum(query_norms[:, None] - 2 * dots + data["squared_norms"], 0.0)
+        if self.metric == "cosine":
+            query_norms = np.linalg.norm(queries, axis=1)
+            denominator = np.maximum(query_norms[:, None] * data["norms"], 1e-12)
+            return 1.0 - dots / denominator
+        return 1.0 - dots
+
+    @staticmethod
+    def _rows(postings, key, condition):
+        values = postings.get(key, {})
+        if isinstance(condition, dict):
+            (operator, operand), = condition.items()
+        else:
+            operator, operand = "$eq", condition
+        if operator in ("$eq", "$ne"):
+            operand = [operand]
+        elif operator not in ("$in", "$nin"):
+            raise ValueError(f"Toán tử lọc không hỗ trợ: {operator}")
+        rows = [values[value] for value in operand if value in values]
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        return rows, operator in ("$ne", "$nin")
+
+    def _filter_mask(self, data, where):
+        """Mask các dòng thỏa `where` (cú pháp con của Chroma: {field: value}, $eq/$ne/$in/$nin, $and)"""
+        mask = np.ones(len(data["ids"]), dtype=bool)
+        conditions = where["$and"] if "$and" in where else [{key: value} for key, value in where.items()]
+        for condition in conditions:
+            for key, value in condition.items():
+                rows, negate = self._rows(data["postings"], key, value)
+                selected = np.zeros(len(mask), dtype=bool)
+                selected[rows] = True
+                mask &= ~selected if negate else selected
+        return mask
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include=("documents", "metadatas", "distances")):
+        """Top-k gần nhất cho từng vector truy vấn, trả về dict dạng Chroma (mỗi trường là list theo truy vấn)"""
+        data = self._data
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        result = {"ids": []}
+        for field in include:
+            result[field] = []
+        if not data or not data["ids"]:
+            for field in result:
+                result[field] = [[] for _ in queries]
+            return result
+
+        distances = self._distances(data, queries)
+        candidates = len(data["ids"])
+        if where:
+            mask = self._filter_mask(data, where)
+            distances[:, ~mask] = np.inf
+            candidates = int(mask.sum())
+        k = min(n_results, candidates)
+
+        for row_distances in distances:
+            if k <= 0:
+                top = np.zeros(0, dtype=np.int64)
+            elif k < len(row_distances):
+                top = np.argpartition(row_distances, k - 1)[:k]
+                top = top[np.argsort(row_distances[top], kind="stable")]
+            else:
+                top = np.argsort(row_distances, kind="stable")[:k]
+            result["ids"].append([data["ids"][i] for i in top])
+            if "documents" in result:
+                result["documents"].append([data["documents"][i] for i in top])
+            if "metadatas" in result:
+                result["metadatas"].append([data["metadatas"][i] for i in top])
+            if "distances" in result:
+                result["distances"].append([float(row_distances[i]) for i in top])
+        return result
+
+    def stats(self) -> dict:
+        data = self._data
+        if not data:
+            return {"documents": 0, "dtype": self.dtype, "metric": self.metric, "matrix_bytes": 0}
+        return {
+            "documents": len(data["ids"]),
+            "dtype": self.dtype,
+            "metric": self.metric,
+            "matrix_bytes": int(data["matrix"].nbytes)
+        }
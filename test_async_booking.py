@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test lượt đặt vé L23 trên đường async: khi SQLite đang bị worker khác giữ write lock,
+lượt đặt vé chờ trong executor còn event loop vẫn phục vụ request khác.
+"""
+import sys
+import os
+import time
+import sqlite3
+import asyncio
+import tempfile
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.core.controller import ChatController
+from src.__modules.chatbot.nlp_extractor.nlp_engine import SimpleDatabase, ConversationManager
+from src.database.storage import SQLiteStorage
+
+LOCK_SECONDS = 0.5
+
+async def _heartbeat(stop, interval=0.01):
+    """Độ trễ lớn nhất giữa hai lần event loop được chạy lại"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def _book_while_locked(path):
+    controller = ChatController(f"test-async-booking-{time.time_ns()}")
+    for message in ["tôi muốn đặt vé từ hà nội đến sài gòn", "ngày 05/09", "2 vé"]:
+        await controller.ahandle_user_message(message)
+
+    # Một "worker" khác giữ write lock của file SQLite
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    booking = asyncio.create_task(controller.ahandle_user_message("8h"))
+
+    await asyncio.sleep(LOCK_SECONDS)
+    assert not booking.done(), "Lượt đặt vé phải chờ write lock"
+    holder.execute("COMMIT")
+    holder.close()
+
+    response = await booking
+    stop.set()
+    return response, await heartbeat
+
+def test_async_booking_does_not_block_event_loop():
+    db = SimpleDatabase()
+    original_storage = db.storage
+    date = ConversationManager()._parse_date("05/09")
+    schedule = {'id': 'AS001', 'departure': 'hà nội', 'destination': 'sài gòn',
+                'time': '08:00', 'date': date, 'available_seats': 10}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bookings.db")
+        db.storage = SQLiteStorage(path, [schedule])
+        try:
+            response, worst_lag = asyncio.run(_book_while_locked(path))
+        finally:
+            db.storage = original_storage
+
+    assert "Mã vé" in response, response
+    assert worst_lag < LOCK_SECONDS / 2, f"Event loop bị chặn {worst_lag * 1000:.0f}ms"
+    print(f"   ✅ Đặt vé sau khi lock được nhả, event loop trễ tối đa {worst_lag * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    print("=== TEST ĐẶT VÉ ASYNC ===")
+    test_async_booking_does_not_block_event_loop()
+    print("\n✅ Hoàn thành test!")
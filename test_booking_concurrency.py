@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Stress test đặt/hủy/đổi vé đồng thời trên SimpleDatabase:
+không bán quá số ghế, không trùng mã vé, tổng số ghế luôn được bảo toàn.
+"""
+import sys
+import os
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.database.schemas import SimpleDatabase, TicketCodeGenerator
+from src.database.storage import SQLiteStorage
+from src.database.catalog import ScheduleCatalog, CatalogStorage
+
+THREADS = 32
+
+def _test_schedules(seats_per_trip):
+    return [
+        {'id': 'ST001', 'departure': 'hà nội', 'destination': 'sài gòn',
+         'time': '08:00', 'date': '2025-09-05', 'available_seats': seats_per_trip},
+        {'id': 'ST002', 'departure': 'hà nội', 'destination': 'sài gòn',
+         'time': '14:00', 'date': '2025-09-05', 'available_seats': seats_per_trip},
+    ]
+
+def _make_db(seats_per_trip):
+    return SimpleDatabase(schedules=_test_schedules(seats_per_trip))
+
+def _make_sqlite_db(seats_per_trip, directory):
+    storage = SQLiteStorage(os.path.join(directory, "bookings.db"), _test_schedules(seats_per_trip))
+    return SimpleDatabase(storage=storage)
+
+def _run_concurrently(func, count):
+    # Chuyển thread thường xuyên hơn để tăng khả năng xen kẽ giữa các thao tác
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            return list(executor.map(func, range(count)))
+    finally:
+        sys.setswitchinterval(old_interval)
+
+def test_no_overselling(db=None, capacity=500):
+    """Nhiều thread cùng đặt vé trên một chuyến: tổng vé bán ra không vượt quá số ghế"""
+    db = db or _make_db(capacity)
+    barrier = threading.Barrier(THREADS)
+
+    def book(i):
+        if i < THREADS:
+            barrier.wait()
+        return db.book_ticket('ST001', random.randint(1, 3), {})
+
+    results = _run_concurrently(book, capacity * 4)
+    codes = [code for code, _ in results if code]
+    sold = sum(db.get_booking(code)['quantity'] for code in codes)
+
+    assert len(codes) == len(set(codes)), "Có mã vé bị trùng"
+    assert sold <= capacity, f"Bán quá số ghế: {sold} > {capacity}"
+    assert db.get_schedule('ST001')['available_seats'] == capacity - sold
+    assert db.get_schedule('ST001')['available_seats'] >= 0
+    # Số yêu cầu gấp nhiều lần số ghế nên chuyến phải được bán gần hết (chỉ còn lẻ vài ghế)
+    assert db.get_schedule('ST001')['available_seats'] < 3
+    print(f"   ✅ Đã bán {sold}/{capacity} ghế với {len(codes)} mã vé không trùng")
+
+def test_concurrent_cancel_and_change_time(db=None, capacity=300):
+    """Hủy và đổi giờ đồng thời: mỗi vé chỉ hủy được một lần và số ghế mỗi chuyến được bảo toàn"""
+    db = db or _make_db(capacity)
+    codes = []
+    for _ in range(100):
+        code, _ = db.book_ticket('ST001', 1, {})
+        codes.append(code)
+
+    def mutate(i):
+        code = codes[i % len(codes)]
+        action = i % 3
+        if action == 0:
+            return 'cancel', db.cancel_ticket(code)[0]
+        new_time = '14:00' if i % 2 else '08:00'
+        return 'change', db.change_time(code, new_time)[0]
+
+    results = _run_concurrently(mutate, 1500)
+    cancelled = sum(1 for action, ok in results if action == 'cancel' and ok)
+
+    assert cancelled == len(codes), f"Số lần hủy thành công {cancelled} khác số vé {len(codes)}"
+
+    # Với mỗi chuyến: ghế trống + ghế của các vé còn hiệu lực trỏ tới chuyến đó = sức chứa
+    held = {'ST001': 0, 'ST002': 0}
+    for code in codes:
+        booking = db.get_booking(code)
+        if booking['status'] != 'cancelled':
+            held[booking['schedule_id']] += booking['quantity']
+    for schedule_id, seats in held.items():
+        assert db.get_schedule(schedule_id)['available_seats'] + seats == capacity, f"Lệch số ghế ở {schedule_id}"
+    print(f"   ✅ {cancelled} vé hủy đúng một lần, số ghế được bảo toàn")
+
+def test_sqlite_backend_under_concurrency():
+    """Cùng các kiểm tra trên với SQLite (WAL), mỗi thread dùng connection riêng"""
+    with tempfile.TemporaryDirectory() as directory:
+        test_no_overselling(_make_sqlite_db(200, directory), capacity=200)
+    with tempfile.TemporaryDirectory() as directory:
+        test_concurrent_cancel_and_change_time(_make_sqlite_db(300, directory), capacity=300)
+
+def test_catalog_backend_under_concurrency():
+    """Cùng các kiểm tra trên với danh mục cột NumPy, kể cả khi đang thêm chuyến (dựng lại cột)"""
+    def make_catalog_db(capacity):
+        catalog = ScheduleCatalog.from_schedules(_test_schedules(capacity))
+        return SimpleDatabase(storage=CatalogStorage(catalog))
+
+    test_no_overselling(make_catalog_db(200), capacity=200)
+
+    db = make_catalog_db(300)
+    extra = [{'id': f'EX{i:03d}', 'departure': 'đà nẵng', 'destination': 'huế', 'time': '07:00',
+              'date': '2025-09-05', 'available_seats': 10} for i in range(50)]
+    adder = threading.Thread(target=lambda: [db.add_schedule(s) for s in extra])
+    adder.start()
+    test_concurrent_cancel_and_change_time(db, capacity=300)
+    adder.join()
+    assert len(db.find_available_schedules('đà nẵng', 'huế', '2025-09-05')) == len(extra)
+
+def test_catalog_reads_during_rebuild():
+    """Đọc không lock trong lúc thêm chuyến (dựng snapshot mới) luôn thấy chuyến cũ với dữ liệu đúng"""
+    catalog = ScheduleCatalog.from_schedules(_test_schedules(100))
+    db = SimpleDatabase(storage=CatalogStorage(catalog))
+    extra = [{'id': f'RB{i:03d}', 'departure': 'cần thơ', 'destination': 'đà lạt', 'time': '06:00',
+              'date': '2025-09-05', 'available_seats': 5} for i in range(200)]
+    adder = threading.Thread(target=lambda: [db.add_schedule(s) for s in extra])
+
+    def read(i):
+        schedule = db.get_schedule('ST002')
+        found = db.find_available_schedules('hà nội', 'sài gòn', '2025-09-05')
+        return schedule, [s['id'] for s in found]
+
+    adder.start()
+    results = _run_concurrently(read, 3000)
+    adder.join()
+    for schedule, found in results:
+        assert schedule is not None and schedule['id'] == 'ST002' and schedule['time'] == '14:00'
+        assert found == ['ST001', 'ST002'], found
+    assert len(db.find_available_schedules('cần thơ', 'đà lạt', '2025-09-05')) == len(extra)
+    print(f"   ✅ {len(results)} lượt đọc trong lúc dựng lại danh mục đều nhất quán")
+
+def test_ticket_codes_unique_across_shards():
+    """Các shard sinh mã vé song song không bao giờ trùng nhau"""
+    generators = [TicketCodeGenerator(shard_id=i, shard_count=4) for i in range(4)]
+
+    def generate(i):
+        return generators[i % 4].next_code()
+
+    codes = _run_concurrently(generate, 8000)
+    assert len(codes) == len(set(codes)), "Có mã vé bị trùng giữa các shard"
+    assert TicketCodeGenerator(shard_id=0, shard_count=1).next_code() == "VN000001"
+    print(f"   ✅ {len(codes)} mã vé từ 4 shard không trùng")
+
+if __name__ == "__main__":
+    print("=== STRESS TEST ĐẶT VÉ ĐỒNG THỜI ===")
+    test_no_overselling()
+    test_concurrent_cancel_and_change_time()
+    test_sqlite_backend_under_concurrency()
+    test_catalog_backend_under_concurrency()
+    test_catalog_reads_during_rebuild()
+    test_ticket_codes_unique_across_shards()
+    print("\n✅ Hoàn thành test!")
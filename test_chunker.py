@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test chia chunk tài liệu chính sách: giới hạn token, chồng lấn giữa các chunk, đường dẫn tiêu đề
+và đọc file theo từng khối cho cùng kết quả
+"""
+import sys
+import os
+import io
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.database.chunker import iter_chunks, read_lines
+from src.__modules.nlp.tokens import estimate_tokens
+
+DOCUMENT = "\n".join([
+    "TITLE: Quy chế",
+    "## Quy trình giao dịch",
+    "  ### 10. Chính sách hủy",
+    "    📄 " + " ".join(f"Điều {i}: vé hủy trước {i} giờ được hoàn {i}0% giá vé." for i in range(1, 31)),
+    "    #### Ghi chú",
+    "    📄 Liên hệ   tổng đài để được hỗ trợ.",
+    "  ### 11. Chính sách hoàn tiền",
+    "    📄 Hoàn tiền trong 7 ngày.",
+])
+
+def test_headings_and_size():
+    chunks = list(iter_chunks(DOCUMENT.splitlines(), max_tokens=60, overlap_tokens=15))
+    sources = [metadata["source"] for _, metadata in chunks]
+
+    assert chunks[0] == ("TITLE: Quy chế", {"source": "Giới thiệu chung", "heading_path": "Giới thiệu chung",
+                                             "chunk_index": 0})
+    assert sources.count("10. Chính sách hủy") > 3
+    assert chunks[-2] == ("Liên hệ tổng đài để được hỗ trợ.", {
+        "source": "Ghi chú",
+        "heading_path": "Quy trình giao dịch > 10. Chính sách hủy > Ghi chú",
+        "chunk_index": 0
+    })
+    assert chunks[-1][1]["heading_path"] == "Quy trình giao dịch > 11. Chính sách hoàn tiền"
+    assert all(estimate_tokens(chunk) <= 60 for chunk, _ in chunks)
+    print(f"   ✅ {len(chunks)} chunk, tối đa {max(estimate_tokens(chunk) for chunk, _ in chunks)} token")
+
+def test_overlap():
+    """Chunk sau bắt đầu bằng câu cuối của chunk trước, ghép lại đủ mọi câu theo thứ tự"""
+    section = [chunk for chunk, metadata in iter_chunks(DOCUMENT.splitlines(), max_tokens=60, overlap_tokens=15)
+               if metadata["source"] == "10. Chính sách hủy"]
+    sentences = []
+    for previous, current in zip(section, section[1:]):
+        tail = previous.split(". ")[-1]
+        assert current.startswith(tail.rstrip(".")), (previous, current)
+    for chunk in section:
+        for sentence in chunk.split(". "):
+            sentence = sentence.rstrip(".") + "."
+            if sentence not in sentences:
+                sentences.append(sentence)
+    assert sentences == [f"Điều {i}: vé hủy trước {i} giờ được hoàn {i}0% giá vé." for i in range(1, 31)]
+    print(f"   ✅ {len(section)} chunk chồng lấn, đủ 30 câu")
+
+def test_long_sentence_and_blocks():
+    """Câu dài hơn giới hạn được cắt theo từ; đọc từng khối nhỏ (cắt giữa dòng) vẫn giữ giới hạn"""
+    text = "## Mục\n" + "từ " * 500 + "\n" + DOCUMENT
+    expected = list(iter_chunks(text.splitlines(), max_tokens=60))
+    # 500 từ = 8 phần 60 từ + 20 từ, ghép cùng dòng tiếp theo của mục ("TITLE: Quy chế")
+    assert [len(chunk.split()) for chunk, _ in expected[:9]] == [60] * 8 + [23]
+
+    assert list(iter_chunks(read_lines(io.StringIO(text), block_size=1024), max_tokens=60)) == expected
+    small_blocks = list(iter_chunks(read_lines(io.StringIO(text), block_size=64), max_tokens=60))
+    assert all(estimate_tokens(chunk) <= 60 for chunk, _ in small_blocks)
+    assert {m["heading_path"] for _, m in small_blocks} == {m["heading_path"] for _, m in expected}
+    print(f"   ✅ {len(expected)} chunk, đọc theo khối 1024/64 ký tự")
+
+if __name__ == "__main__":
+    print("=== TEST CHUNKER ===")
+    test_headings_and_size()
+    test_overlap()
+    test_long_sentence_and_blocks()
+    print("\n✅ Hoàn thành test!")
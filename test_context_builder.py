@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test ghép ngữ cảnh L1: thứ tự theo khoảng cách, bỏ câu/đoạn trùng, cắt tại ranh giới câu trong giới hạn token
+"""
+import sys
+import os
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.chatbot.context_builder import ContextBuilder, estimate_tokens, split_sentences
+
+REFUND = "Vé được hoàn tiền trong 7 ngày. Phí hủy là 10% giá vé. Hoàn tiền về tài khoản đã thanh toán."
+CHANGE = "Đổi vé trước giờ khởi hành 24 giờ. Mỗi vé chỉ được đổi một lần."
+LUGGAGE = " ".join(f"Hành lý loại {i} được miễn phí tối đa {i + 5} kg." for i in range(40))
+
+def test_order_and_dedupe():
+    """Đoạn gần nhất đứng trước; đoạn chồng lấn chỉ đóng góp câu mới, đoạn trùng hẳn bị bỏ"""
+    overlapping = "Hoàn tiền về tài khoản đã thanh toán. Liên hệ tổng đài nếu quá hạn."
+    builder = ContextBuilder(max_tokens=1000)
+    result = builder.build([CHANGE, REFUND, overlapping, REFUND], distances=[0.5, 0.1, 0.3, 0.2])
+
+    lines = result.text.split("\n")
+    assert lines == [REFUND, "Liên hệ tổng đài nếu quá hạn.", CHANGE]
+    assert result.duplicates == 1 and result.truncated == 0 and result.chunks == 3
+    assert result.tokens == estimate_tokens(result.text)
+    print(f"   ✅ {result.chunks} đoạn, {result.tokens}/{result.raw_tokens} token")
+
+def test_budget_trims_at_sentence_boundary():
+    builder = ContextBuilder(max_tokens=60)
+    result = builder.build([LUGGAGE, REFUND], distances=[0.1, 0.2])
+
+    assert result.tokens <= 60 and result.raw_tokens > 400
+    assert result.text.endswith(".") and result.text in LUGGAGE
+    assert set(split_sentences(result.text)) <= set(split_sentences(LUGGAGE))
+    assert result.truncated == 2  # đoạn hành lý bị cắt, đoạn hoàn tiền không còn chỗ
+
+    # Giới hạn riêng mỗi đoạn chừa chỗ cho đoạn sau
+    result = ContextBuilder(max_tokens=60, max_chunk_tokens=35).build([LUGGAGE, REFUND], distances=[0.1, 0.2])
+    assert result.chunks == 2 and result.tokens <= 60 and result.text.endswith("\n" + REFUND)
+    print(f"   ✅ {result.tokens} token, {result.truncated} đoạn bị cắt")
+
+def test_long_sentence_and_stats():
+    """Câu đầu dài hơn ngân sách vẫn được lấy phần đầu (cắt theo từ); stats cộng dồn theo request"""
+    builder = ContextBuilder(max_tokens=10)
+    result = builder.build(["một " * 50])
+    assert result.text == " ".join(["một"] * 10) and result.tokens == 10
+
+    second = builder.build([REFUND])
+    stats = builder.stats()
+    assert second.text == split_sentences(REFUND)[0]
+    assert stats["requests"] == 2 and stats["tokens"] == 10 + second.tokens
+    print(f"   ✅ {stats}")
+
+if __name__ == "__main__":
+    print("=== TEST CONTEXT BUILDER ===")
+    test_order_and_dedupe()
+    test_budget_trims_at_sentence_boundary()
+    test_long_sentence_and_stats()
+    print("\n✅ Hoàn thành test!")
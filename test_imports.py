@@ -39,6 +39,10 @@ def test_imports():
         from src.__modules.nlp.threading import threaded_main
         print("  - NLP threading loaded")
         
+        print("✓ Testing src.__modules.nlp.router...")
+        from src.__modules.nlp.router import route_message
+        print("  - Intent router loaded")
+        
         print("✓ Testing src.__modules.chatbot.L1...")
         from src.__modules.chatbot.L1 import bot_response
         print("  - L1 bot loaded")
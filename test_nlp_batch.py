@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test trích xuất NLP hàng loạt: cùng kết quả và thứ tự với gọi từng text, cả khi dùng process pool
+"""
+import sys
+import os
+import io
+import json
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.chatbot.nlp_extractor.nlp_engine import get_intent_entities_from_text
+from src.__modules.chatbot.nlp_extractor.batch import extract_batch, process_jsonl
+
+TEXTS = [
+    f"Đặt {i % 5 + 1} vé từ hà nội đến sài gòn lúc {i % 24}h ngày {i % 28 + 1}/10" if i % 3 else f"Hủy vé VN{100000 + i}"
+    for i in range(50)
+]
+
+def test_batch_matches_single():
+    """In-process và process pool (chunk nhỏ để có nhiều chunk đang chạy) giữ nguyên thứ tự"""
+    expected = [get_intent_entities_from_text(text) for text in TEXTS]
+    assert list(extract_batch(iter(TEXTS))) == expected
+    assert list(extract_batch(iter(TEXTS), workers=2, chunk_size=3, max_pending=2)) == expected
+    print(f"   ✅ {len(TEXTS)} text, kết quả giống gọi từng text")
+
+def test_jsonl_records():
+    """Object giữ nguyên các trường, chuỗi JSON được bọc lại, dòng lỗi ghi 'error' mà không dừng"""
+    lines = [
+        json.dumps({"id": 1, "text": "Hủy vé VN123456"}, ensure_ascii=False),
+        json.dumps("đặt 2 vé đi huế", ensure_ascii=False),
+        "",
+        "{không phải json",
+        json.dumps({"id": 4}),
+    ]
+    output = io.StringIO()
+    stats = process_jsonl(lines, output)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert stats["records"] == 4 and stats["errors"] == 2
+    assert records[0]["id"] == 1 and records[0]["nlp"]["intent"] == "huy_ve"
+    assert records[1]["text"] == "đặt 2 vé đi huế" and records[1]["nlp"]["intent"] == "dat_ve"
+    assert records[2]["line"] == 4 and "error" in records[2]
+    assert records[3]["line"] == 5 and "error" in records[3]
+    print(f"   ✅ {stats}")
+
+if __name__ == "__main__":
+    print("=== TEST NLP BATCH ===")
+    test_batch_matches_single()
+    test_jsonl_records()
+    print("\n✅ Hoàn thành test!")
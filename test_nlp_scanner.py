@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test trích xuất intent/entity: cả tìm theo từng pattern (câu ngắn) lẫn scanner một lần quét (text dài)
+cho kết quả giống hệt cài đặt regex gốc, span có vị trí đúng và pattern không tách được vẫn quét được
+"""
+import sys
+import os
+import re
+import random
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.chatbot.nlp_extractor.nlp_engine import (
+    get_intent_entities_from_text, _extract_by_pattern, _extract_by_scanner, scanner,
+    INTENT_PATTERNS, ENTITY_PATTERNS, SCANNER_MIN_LENGTH
+)
+from src.__modules.chatbot.nlp_extractor.scanner import PatternScanner
+
+def reference_intent_entities(text):
+    """Cài đặt gốc (mỗi pattern quét lại toàn bộ text), dùng làm chuẩn đối chiếu cho test và bench_nlp.py"""
+    text_lower = text.lower()
+
+    intent = 'unknown'
+    for intent_name, pattern in INTENT_PATTERNS.items():
+        if pattern.search(text_lower):
+            intent = intent_name
+            break
+
+    entities = []
+    for label in ('time', 'date', 'quantity'):
+        for match in ENTITY_PATTERNS[label].finditer(text_lower):
+            entities.append({'entity': label, 'value': match.group().strip(), 'confidence': 0.8})
+    for match in ENTITY_PATTERNS['ticket_code'].finditer(text):
+        entities.append({'entity': 'ticket_code', 'value': match.group().strip(), 'confidence': 0.8})
+
+    if 'từ' in text_lower and 'đến' in text_lower:
+        location_match = re.search(r'từ\s+([\w\s]+?)\s+đến\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)', text_lower)
+        if location_match:
+            entities.append({'entity': 'departure', 'value': location_match.group(1).strip(), 'confidence': 0.8})
+            entities.append({'entity': 'destination', 'value': location_match.group(2).strip(), 'confidence': 0.8})
+    elif 'đi' in text_lower:
+        go_match = re.search(r'đi\s+([\w\s]+?)(?:\s+lúc|\s+vào|\s+ngày|$)', text_lower)
+        if go_match:
+            entities.append({'entity': 'destination', 'value': go_match.group(1).strip(), 'confidence': 0.8})
+
+    return {
+        'intent': intent,
+        'entities': entities,
+        'confidence': 0.8 if intent != 'unknown' else 0.0
+    }
+
+WORDS = (
+    "xin chào từ hà nội đến sài gòn lúc 9h sáng ngày 12/10 mã vé VN123456 2 vé 350.000đ "
+    "đặt mua book hủy huỷ cancel trả đổi thay đổi chuyển giờ xuất hóa đơn bill khiếu nại "
+    "12:30 10h tối ngày mai hôm nay mai 1/2/3 ABCD1234567 xy12345678 İstanbul ſài HÀ NỘI "
+    "Đi ĐẾN Từ 123h 1234:56 3vé 12 / 10 , . ? đi vào"
+).split(" ")
+
+def test_same_result_as_regex():
+    """Text ghép ngẫu nhiên (có chữ hoa, ký tự đổi độ dài khi lowercase) cho cùng kết quả với cả hai cách tìm"""
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = "".join(rng.choice(WORDS) + rng.choice([" ", "", "\n", ", "]) for _ in range(rng.randint(0, 60)))
+        expected = reference_intent_entities(text)
+        assert _extract_by_pattern(text) == expected, text
+        assert _extract_by_scanner(text) == expected, text
+        assert get_intent_entities_from_text(text) == expected, text
+    print(f"   ✅ 3000 text ngẫu nhiên cho kết quả giống hệt (ngưỡng scanner {SCANNER_MIN_LENGTH} ký tự)")
+
+def test_span_positions():
+    """Span trỏ đúng vị trí trong text, city được nhận diện trong cùng lần quét"""
+    text = "Đặt 2 vé từ Hà Nội đến Đà Nẵng lúc 8h sáng, mã VN123456"
+    result = scanner.scan(text)
+    assert result.first_intent(scanner.intent_labels) == 'dat_ve'
+    assert [span.value for span in result.spans['city']] == ['hà nội', 'đà nẵng']
+    for span in result.all_spans():
+        source = text if span.label == 'ticket_code' else result.text_lower
+        assert source[span.start:span.end].strip() == span.value
+    assert result.keywords['từ'] == [text.lower().index('từ')]
+    print(f"   ✅ {len(result.all_spans())} span đúng vị trí")
+
+def test_unscannable_patterns_fall_back():
+    """Nhánh bắt đầu bằng \\b, [..] hay một nhóm không làm hỏng scanner mà được quét bằng finditer"""
+    intents = {'phi': re.compile(r'\bphí\b|lệ phí', re.I), 'gia': re.compile(r'giá|(?:bao nhiêu) tiền', re.I)}
+    entities = {'seat': re.compile(r'[a-d]\d{1,2}', re.I), 'quantity': ENTITY_PATTERNS['quantity']}
+    custom = PatternScanner(intents, entities)
+    text = "Lệ phí ghế A12 phía trước bao nhiêu tiền, phí 2 vé; giá ghế b3"
+    result = custom.scan(text)
+    for label, pattern in {**intents, **entities}.items():
+        assert result.values(label) == [m.group().strip() for m in pattern.finditer(text.lower())], label
+    assert result.first_intent(custom.intent_labels) == 'phi'
+    assert [rule.label for rule in custom.rules if rule.fallback] == ['phi', 'gia', 'seat']
+    print(f"   ✅ {sum(rule.fallback for rule in custom.rules)} pattern chạy fallback, kết quả như finditer")
+
+if __name__ == "__main__":
+    print("=== TEST NLP SCANNER ===")
+    test_same_result_as_regex()
+    test_span_positions()
+    test_unscannable_patterns_fall_back()
+    print("\n✅ Hoàn thành test!")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test lớp chuẩn hóa tiếng Việt: NFC, bỏ dấu, viết tắt, từ điển thành phố và cache
+"""
+import sys
+import os
+import unicodedata
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.nlp.normalization import normalize_text, fold_text, normalize_query, cities
+from src.__modules.chatbot.nlp_extractor.nlp_engine import ConversationManager
+
+def test_normalize_and_fold():
+    """Dạng tổ hợp (NFD), hoa thường và khoảng trắng thừa cho cùng một khóa"""
+    decomposed = unicodedata.normalize('NFD', '  Đà   Nẵng ')
+    assert normalize_text(decomposed) == 'đà nẵng'
+    assert fold_text(decomposed) == fold_text('da nang') == 'da nang'
+    assert normalize_query('Vé đi HCM ko?') == 'vé đi hồ chí minh không?'
+    # Chỉ mở rộng khi là cả từ
+    assert normalize_query('sgk') == 'sgk'
+
+    normalize_text.cache_clear()
+    normalize_text('Hà Nội')
+    normalize_text('Hà Nội')
+    assert normalize_text.cache_info().hits == 1
+    print("   ✅ Chuẩn hóa, bỏ dấu và cache đúng")
+
+def test_city_vocabulary():
+    """Tên có dấu, không dấu, viết tắt đều về tên chuẩn trong dữ liệu chuyến"""
+    assert cities.canonical('HCM') == 'sài gòn'
+    assert cities.canonical('Ha Noi') == 'hà nội'
+    assert cities.canonical('hội an') is None
+    assert cities.find('Bến xe TP.HCM - quầy 3') == 'sài gòn'
+    assert cities.find_all('từ hn đến Da Nang') == ['hà nội', 'đà nẵng']
+    assert cities.find('hnx') is None
+    print("   ✅ Tra từ điển thành phố đúng")
+
+def test_conversation_uses_canonical_cities():
+    """Entity tuyến đường viết tắt được lưu bằng tên chuẩn"""
+    manager = ConversationManager()
+    manager.process_turn('đặt vé từ hn đến sg', 'dat_ve', [
+        {'entity': 'departure', 'value': 'hn', 'confidence': 0.8},
+        {'entity': 'destination', 'value': 'sg', 'confidence': 0.8},
+    ])
+    assert manager.state.collected_entities['departure'] == 'hà nội'
+    assert manager.state.collected_entities['destination'] == 'sài gòn'
+    print("   ✅ Hội thoại lưu tên thành phố chuẩn")
+
+if __name__ == "__main__":
+    print("=== TEST NORMALIZATION ===")
+    test_normalize_and_fold()
+    test_city_vocabulary()
+    test_conversation_uses_canonical_cities()
+    print("\n✅ Hoàn thành test!")
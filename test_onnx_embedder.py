@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test OnnxEmbedder với session/tokenizer giả: thứ tự kết quả khi chia batch theo độ dài, pooling
+không phụ thuộc padding, cache token id và kiểm tra tương đương theo cosine
+"""
+import sys
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.__modules.nlp.onnx_embedder import OnnxEmbedder, check_equivalence, cosine_similarities
+
+DIM = 8
+
+class FakeTokenizer:
+    """Mỗi từ là một token, id = 1 + hash ổn định của từ"""
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return SimpleNamespace(ids=[1 + sum(map(ord, word)) % 97 for word in text.split()])
+
+    def encode_batch(self, texts):
+        return [self.encode(text) for text in texts]
+
+class FakeSession:
+    """Hidden state của mỗi token chỉ phụ thuộc id của nó (token padding cũng có vector riêng)"""
+    def __init__(self):
+        self.table = np.random.default_rng(0).normal(size=(100, DIM)).astype(np.float32)
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name="last_hidden_state")]
+
+    def run(self, output_names, feeds):
+        self.batches.append(feeds["input_ids"].shape)
+        return [self.table[feeds["input_ids"]]]
+
+TEXTS = [" ".join(f"từ{j}" for j in range(i % 7 + 1)) for i in range(20)]
+
+def test_encode_order_and_padding():
+    """Kết quả theo thứ tự đầu vào và giống encode từng câu (padding không làm lệch mean pooling)"""
+    embedder = OnnxEmbedder(FakeSession(), FakeTokenizer(), pooling="mean", normalize=True)
+    batched = embedder.encode(TEXTS, batch_size=4)
+    single = np.stack([embedder.encode(text) for text in TEXTS])
+
+    assert batched.shape == (len(TEXTS), DIM) and batched.dtype == np.float32
+    assert np.allclose(batched, single, atol=1e-6)
+    assert np.allclose(np.linalg.norm(batched, axis=1), 1.0, atol=1e-6)
+    # Batch theo độ dài giảm dần: batch đầu có câu dài nhất
+    assert embedder.session.batches[0] == (4, 7)
+    print(f"   ✅ {len(TEXTS)} câu, {len(embedder.session.batches)} lần chạy session")
+
+def test_token_cache():
+    tokenizer = FakeTokenizer()
+    embedder = OnnxEmbedder(FakeSession(), tokenizer, pooling="cls", normalize=False)
+    embedder.encode(["chính sách hủy vé"] * 5)
+    embedder.encode("chính sách hủy vé")
+    assert tokenizer.calls == 1
+    assert embedder.cache_info().hits == 5
+    print(f"   ✅ {embedder.cache_info()}")
+
+def test_check_equivalence():
+    embedder = OnnxEmbedder(FakeSession(), FakeTokenizer(), pooling="mean")
+
+    class Noisy:
+        def __init__(self, scale):
+            self.rng = np.random.default_rng(1)
+            self.scale = scale
+
+        def encode(self, texts):
+            embeddings = embedder.encode(texts)
+            return embeddings + self.rng.normal(scale=self.scale, size=embeddings.shape)
+
+    close = check_equivalence(Noisy(0.001), embedder, TEXTS, tolerance=0.99)
+    far = check_equivalence(Noisy(1.0), embedder, TEXTS, tolerance=0.99)
+    assert close["passed"] and close["min_cosine"] > 0.99
+    assert not far["passed"] and far["below_tolerance"] > 0
+    assert np.allclose(cosine_similarities(np.eye(3), 2 * np.eye(3)), 1.0)
+    print(f"   ✅ min cosine {close['min_cosine']:.4f} / {far['min_cosine']:.4f}")
+
+if __name__ == "__main__":
+    print("=== TEST ONNX EMBEDDER ===")
+    test_encode_order_and_padding()
+    test_token_cache()
+    test_check_equivalence()
+    print("\n✅ Hoàn thành test!")
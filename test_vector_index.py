@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test index vector numpy: kết quả dạng Chroma, top-k đúng, lượng tử hóa giữ recall, lọc metadata
+"""
+import sys
+import os
+
+import numpy as np
+
+# Add project root to path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+from src.database.vector_index import NumpyVectorIndex
+
+rng = np.random.default_rng(7)
+VECTORS = rng.normal(size=(300, 64)).astype(np.float32)
+QUERIES = VECTORS[:50] + rng.normal(scale=0.3, size=(50, 64)).astype(np.float32)
+IDS = [f"c{i}" for i in range(len(VECTORS))]
+METADATAS = [{"source": f"mục {i % 3}"} for i in range(len(VECTORS))]
+
+def exact_ids(query, k, rows=None):
+    rows = np.arange(len(VECTORS)) if rows is None else rows
+    distances = ((VECTORS[rows] - query) ** 2).sum(axis=1)
+    return [IDS[rows[i]] for i in np.argsort(distances)[:k]]
+
+def test_exact_float32():
+    """float32 cho đúng top-k và khoảng cách L2 bình phương như Chroma"""
+    index = NumpyVectorIndex(dtype="float32")
+    index.build(IDS, VECTORS, [f"doc {i}" for i in range(len(IDS))], METADATAS)
+    result = index.query(QUERIES[:5], n_results=3)
+    assert set(result) == {"ids", "documents", "metadatas", "distances"}
+    for query, ids, distances in zip(QUERIES[:5], result["ids"], result["distances"]):
+        assert ids == exact_ids(query, 3)
+        assert np.isclose(distances[0], ((VECTORS[IDS.index(ids[0])] - query) ** 2).sum(), rtol=1e-4)
+    print("   ✅ float32 khớp brute force")
+
+def test_quantized_recall():
+    """float16/int8 giữ recall@3 gần như tuyệt đối với bộ nhớ nhỏ hơn 2-4 lần"""
+    for dtype, min_recall in (("float16", 0.98), ("int8", 0.95)):
+        index = NumpyVectorIndex(dtype=dtype)
+        index.build(IDS, VECTORS)
+        result = index.query(QUERIES, n_results=3)
+        recall = np.mean([len(set(ids) & set(exact_ids(q, 3))) / 3 for q, ids in zip(QUERIES, result["ids"])])
+        assert recall >= min_recall, (dtype, recall)
+        print(f"   ✅ {dtype}: recall@3={recall:.3f}, {index.stats()['matrix_bytes']} byte")
+
+def test_metadata_filter():
+    """where lọc đúng tập dòng, không đủ kết quả thì trả ít hơn n_results"""
+    index = NumpyVectorIndex()
+    index.build(IDS, VECTORS, metadatas=METADATAS)
+    rows = np.array([i for i, m in enumerate(METADATAS) if m["source"] == "mục 1"])
+    result = index.query(QUERIES[0], n_results=3, where={"source": "mục 1"})
+    assert all(m["source"] == "mục 1" for m in result["metadatas"][0])
+    assert set(result["ids"][0]) <= {IDS[i] for i in rows}
+
+    result = index.query(QUERIES[0], n_results=3, where={"source": {"$nin": ["mục 0", "mục 1"]}})
+    assert all(m["source"] == "mục 2" for m in result["metadatas"][0])
+    assert index.query(QUERIES[0], n_results=3, where={"source": "không có"})["ids"] == [[]]
+    assert NumpyVectorIndex().query(QUERIES[0], n_results=3)["ids"] == [[]]
+    print("   ✅ Lọc metadata đúng")
+
+if __name__ == "__main__":
+    print("=== TEST VECTOR INDEX ===")
+    test_exact_float32()
+    test_quantized_recall()
+    test_metadata_filter()
+    print("\n✅ Hoàn thành test!")